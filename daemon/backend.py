@@ -30,13 +30,18 @@ Requirements:
 
 Notes:
 ------
-- The server create daemon threads for client handling.
+- The server create daemon threads for client handling, or multiplexes every
+  connection on one event loop when started in ``eventloop`` mode.
+- With ``workers`` > 1 the serving loop runs in that many pre-forked
+  processes, see :mod:`daemon.prefork`.
 - The current implementation error handling is minimal, socket errors are printed to the console.
 - The actual request processing is delegated to the HttpAdapter class.
 
 Usage Example:
 --------------
 >>> create_backend("127.0.0.1", 9000, routes={})
+>>> create_backend("127.0.0.1", 9000, routes={}, mode="eventloop", backlog=1024)
+>>> create_backend("127.0.0.1", 9000, routes={}, workers=4)
 
 """
 
@@ -47,8 +52,49 @@ import argparse
 from .response import *
 from .httpadapter import HttpAdapter
 from .dictionary import CaseInsensitiveDict
+from .eventloop import run_eventloop, THREADS
+from .workerpool import WorkerPool, QUEUE_SIZE
+from .prefork import run_prefork, GRACE_PERIOD
 
-def handle_client(ip, port, conn, addr, routes):
+#: Thread-per-connection serving mode (the original behaviour).
+MODE_THREAD = "thread"
+#: Non-blocking serving mode, see :mod:`daemon.eventloop`.
+MODE_EVENTLOOP = "eventloop"
+
+#: Default length of the listen queue.
+BACKLOG = 50
+
+#: Seconds advertised in ``Retry-After`` when a connection is shed.
+RETRY_AFTER = 1
+
+#: Seconds ``accept`` may block before the stop signal is checked again.
+ACCEPT_TIMEOUT = 1.0
+
+
+class _InFlight:
+    """Counts the client connections being handled, to drain on shutdown."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._count = 0
+
+    def run(self, fn, *args, **kwargs):
+        with self._cond:
+            self._count += 1
+        try:
+            fn(*args, **kwargs)
+        finally:
+            with self._cond:
+                self._count -= 1
+                self._cond.notify_all()
+
+    def wait_idle(self):
+        with self._cond:
+            while self._count:
+                self._cond.wait()
+
+
+def handle_client(ip, port, conn, addr, routes, **adapter_options):
     """
     Initializes an HttpAdapter instance and delegates the client handling logic to it.
 
@@ -57,56 +103,210 @@ def handle_client(ip, port, conn, addr, routes):
     :param conn (socket.socket): Client connection socket.
     :param addr (tuple): client address (IP, port).
     :param routes (dict): Dictionary of route handlers.
+    :param adapter_options: per-connection settings, see :class:`HttpAdapter`.
     """
-    daemon = HttpAdapter(ip, port, conn, addr, routes)
+    daemon = HttpAdapter(ip, port, conn, addr, routes, **adapter_options)
 
     # Handle client
     daemon.handle_client(conn, addr, routes)
 
-def run_backend(ip, port, routes):
+def reject_connection(conn, retry_after=RETRY_AFTER):
+    """
+    Answers ``503 Service Unavailable`` on a fresh connection and closes it.
+
+    Used when the worker pool queue is full; the write is bounded by a short
+    timeout so a slow client cannot stall the accept loop.
+
+    :param conn (socket.socket): Client connection socket.
+    :param retry_after (int): seconds advertised in ``Retry-After``.
+    """
+    try:
+        conn.settimeout(0.5)
+        conn.sendall(Response().build_unavailable(retry_after))
+    except socket.error:
+        pass
+    finally:
+        conn.close()
+
+def create_server_socket(ip, port, backlog=BACKLOG, reuse_port=False):
+    """
+    Creates the listening socket of the backend.
+
+    :param ip (str): IP address to bind the server.
+    :param port (int): Port number to listen on.
+    :param backlog (int): length of the kernel accept queue.
+    :param reuse_port (bool): set ``SO_REUSEPORT`` so that several worker
+                              processes can each listen on the port.
+
+    :rtype socket.socket: bound and listening server socket.
+    """
+    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server.bind((ip, port))
+    server.listen(backlog)
+    return server
+
+def serve_threaded(server, ip, port, routes, pool_size=None, queue_size=QUEUE_SIZE,
+                   stop_event=None, **adapter_options):
+    """
+    Accepts connections on ``server`` and spawns a thread for each client.
+
+    With ``pool_size`` set, clients are handed to a fixed :class:`WorkerPool`
+    instead; connections arriving while ``queue_size`` others already wait
+    for a worker are answered 503 immediately. A worker stays with its
+    connection for its whole keep-alive lifetime.
+
+    Once ``stop_event`` is set the server socket is closed and the function
+    returns when the connections already accepted have been served.
+
+    :param server (socket.socket): bound and listening server socket.
+    :param ip (str): IP address the server is bound to.
+    :param port (int): Port number the server is listening on.
+    :param routes (dict): Dictionary of route handlers.
+    :param pool_size (int): worker threads, or None for one thread per client.
+    :param queue_size (int): connections allowed to wait for a worker.
+    :param stop_event (threading.Event): optional graceful stop signal.
+    :param adapter_options: per-connection settings, see :class:`HttpAdapter`.
+    """
+    in_flight = _InFlight()
+    if stop_event is not None:
+        server.settimeout(ACCEPT_TIMEOUT)
+
+    pool = None
+    if pool_size:
+        pool = WorkerPool("backend", pool_size, queue_size)
+        print("[Backend] Worker pool of {} threads, queue {}".format(pool_size, queue_size))
+
+    while stop_event is None or not stop_event.is_set():
+        try:
+            conn, addr = server.accept()
+        except socket.timeout:
+            continue
+        except InterruptedError:
+            continue
+        conn.settimeout(None)
+        if pool is not None:
+            if not pool.submit(in_flight.run, handle_client,
+                               ip, port, conn, addr, routes, **adapter_options):
+                print("[Backend] Queue full, shedding {}".format(addr))
+                reject_connection(conn)
+            continue
+        #
+        #  TODO: implement the step of the client incomping connection
+        #        using multi-thread programming with the
+        #        provided handle_client routine
+        #
+        client_thread = threading.Thread(
+            target=in_flight.run, 
+            args=(handle_client, ip, port, conn, addr, routes),
+            kwargs=adapter_options
+        )
+
+        client_thread.daemon = True  # Đánh dấu là daemon thread
+        client_thread.start()
+
+    server.close()
+    in_flight.wait_idle()
+    if pool is not None:
+        pool.shutdown()
+
+def serve(server, stop_event, ip, port, routes, mode=MODE_THREAD, threads=THREADS,
+          pool_size=None, queue_size=QUEUE_SIZE, **adapter_options):
+    """
+    Runs the serving loop of ``mode`` on a listening socket, in the current
+    process. Shared by the single-process backend and every pre-forked worker.
+
+    :param server (socket.socket): bound and listening server socket.
+    :param stop_event (threading.Event): graceful stop signal, or None.
+    """
+    if mode == MODE_EVENTLOOP:
+        run_eventloop(server, ip, port, routes, threads, queue_size, stop_event,
+                      **adapter_options)
+    else:
+        serve_threaded(server, ip, port, routes, pool_size, queue_size, stop_event,
+                       **adapter_options)
+
+def run_backend(ip, port, routes, mode=MODE_THREAD, backlog=BACKLOG, workers=1,
+                threads=THREADS, pool_size=None, queue_size=QUEUE_SIZE,
+                grace=GRACE_PERIOD, on_stop=None, on_shutdown=None, **adapter_options):
     """
     Starts the backend server, binds to the specified IP and port, and listens for incoming
-    connections. Each connection is handled in a separate thread. The backend accepts incoming
-    connections and spawns a thread for each client.
+    connections. In the default ``thread`` mode each connection is handled in a separate
+    thread. In the ``eventloop`` mode all connections are multiplexed on one selectors
+    loop and the route hooks run on a bounded pool of ``threads`` threads.
+
+    With ``workers`` > 1 the chosen mode runs in that many pre-forked processes
+    sharing the port; ``SIGTERM`` drains them and ``SIGHUP`` replaces them one
+    generation at a time.
 
 
     :param ip (str): IP address to bind the server.
     :param port (int): Port number to listen on.
     :param routes (dict): Dictionary of route handlers.
+    :param mode (str): serving mode, ``thread`` or ``eventloop``.
+    :param backlog (int): length of the kernel accept queue.
+    :param workers (int): number of serving processes.
+    :param threads (int): hook worker threads in ``eventloop`` mode.
+    :param pool_size (int): in ``thread`` mode, a fixed number of connection
+                            workers instead of one thread per connection.
+    :param queue_size (int): requests (``eventloop``) or connections (pooled
+                             ``thread``) allowed to wait for a worker before
+                             new ones are answered 503.
+    :param grace (float): seconds a worker process may take to drain.
+    :param on_stop (callable): called in each pre-forked worker as soon as it
+                               is asked to stop, before the requests in flight
+                               are drained, e.g. to release long-polls.
+    :param on_shutdown (callable): called in each serving process once it has
+                                   stopped serving, e.g. to flush buffers.
+    :param adapter_options: per-connection settings passed to :class:`HttpAdapter`
+                            (``max_header_size``, ``max_body_size``, ``read_timeout``,
+                            ``keepalive_timeout``, ``max_keepalive_requests``).
     """
-    server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if mode not in (MODE_THREAD, MODE_EVENTLOOP):
+        raise ValueError("Unknown serving mode {!r}".format(mode))
+
+    def make_socket(reuse_port):
+        return create_server_socket(ip, port, backlog, reuse_port)
+
+    def serve_worker(server, stop_event):
+        if on_stop is not None and stop_event is not None:
+            def watch_stop():
+                stop_event.wait()
+                on_stop()
+            threading.Thread(target=watch_stop, name="stop-watcher", daemon=True).start()
+        try:
+            serve(server, stop_event, ip, port, routes, mode, threads, pool_size,
+                  queue_size, **adapter_options)
+        finally:
+            if on_shutdown is not None:
+                on_shutdown()
 
     try:
-        server.bind((ip, port))
-        server.listen(50)
-        print("[Backend] Listening on port {}".format(port))
+        print("[Backend] Listening on port {} ({} mode, backlog {}, {} worker{})".format(
+            port, mode, backlog, workers, "s" if workers > 1 else ""))
         if routes != {}:
             print("[Backend] route settings {}".format(routes))
 
-        while True:
-            conn, addr = server.accept()
-            #
-            #  TODO: implement the step of the client incomping connection
-            #        using multi-thread programming with the
-            #        provided handle_client routine
-            #
-            client_thread = threading.Thread(
-                target=handle_client, 
-                args=(ip, port, conn, addr, routes)
-            )
-
-            client_thread.daemon = True  # Đánh dấu là daemon thread
-            client_thread.start()
+        if workers > 1:
+            run_prefork(workers, make_socket, serve_worker, grace)
+        else:
+            serve_worker(make_socket(False), None)
     except socket.error as e:
       print("Socket error: {}".format(e))
 
-def create_backend(ip, port, routes={}):
+def create_backend(ip, port, routes={}, **options):
     """
     Entry point for creating and running the backend server.
 
     :param ip (str): IP address to bind the server.
     :param port (int): Port number to listen on.
     :param routes (dict, optional): Dictionary of route handlers. Defaults to empty dict.
+    :param options: serving options forwarded to :func:`run_backend`
+                    (``mode``, ``backlog``, ``workers``, ``threads``,
+                    ``pool_size``, ``queue_size``, ``grace``, ``on_stop``, ``on_shutdown`` and the
+                    per-connection settings of :class:`HttpAdapter`).
     """
 
-    run_backend(ip, port, routes)
\ No newline at end of file
+    run_backend(ip, port, routes, **options)
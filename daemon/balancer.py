@@ -0,0 +1,400 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.balancer
+~~~~~~~~~~~~~~~~~
+
+This module provides the load-balancing policies of the proxy. Every virtual
+host with several ``proxy_pass`` entries gets a :class:`Balancer` that keeps
+one :class:`Backend` per upstream, with its weight and the number of requests
+currently in flight, and asks its policy which one serves the next request.
+
+Available ``dist_policy`` values:
+
+- ``round-robin``: each backend in turn.
+- ``weighted-round-robin``: smooth weighted round robin on the ``weight=``
+  of each ``proxy_pass``.
+- ``least-conn``: the backend with the fewest in-flight requests per weight.
+- ``power-of-two``: the less loaded of two backends picked at random.
+- ``consistent-hash``: a hash ring on the session cookie, so a client sticks
+  to one backend while the backend set is unchanged.
+
+New policies are added with :func:`register_policy`.
+
+Policies only see the backends that are currently usable: ejected or
+failing backends are skipped, and re-admitted ones are offered a growing
+share of the requests, see :mod:`daemon.health`. A policy that sets
+``weighs_warmup`` gets every available backend and applies the slow start
+itself, as the hash ring does with a growing number of points.
+
+Usage Example:
+--------------
+>>> balancer = Balancer(["127.0.0.1:9001 weight=3", "127.0.0.1:9002"], "least-conn")
+>>> backend = balancer.choose()
+>>> with backend.track():
+...     forward_request(backend.host, backend.port, request)
+"""
+
+import time
+import math
+import bisect
+import hashlib
+import random
+import threading
+import contextlib
+from .health import (MAX_FAILS, EJECT_TIME, MAX_EJECT_FACTOR,
+                     SLOW_START, SLOW_START_MIN)
+
+#: Policy used when ``dist_policy`` is missing or unknown.
+DEFAULT_POLICY = "round-robin"
+
+#: Points per unit of weight on the consistent hash ring.
+VIRTUAL_NODES = 64
+#: Steps in which a backend in slow start gains its points on the ring.
+WARMUP_STEPS = 10
+
+
+class Backend:
+    """
+    One upstream of a virtual host.
+
+    :attrs host (str): IP address of the backend.
+    :attrs port (int): port of the backend.
+    :attrs weight (int): relative share of the traffic, at least 1.
+    :attrs in_flight (int): requests currently being relayed to it.
+    :attrs failures (int): consecutive failed requests.
+    :attrs probe_ok (bool): result of the last active health probe.
+    :attrs ejected_until (float): monotonic time the ejection ends.
+    :attrs recovered_at (float): start of the slow start, or None.
+    """
+
+    def __init__(self, host, port, weight=1):
+        self.host = host
+        self.port = int(port)
+        self.weight = max(1, int(weight))
+        self.in_flight = 0
+        self.failures = 0
+        self.ejections = 0
+        self.probe_ok = True
+        self.ejected_until = 0.0
+        self.recovered_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def address(self):
+        """:rtype str: ``host:port``."""
+        return "{}:{}".format(self.host, self.port)
+
+    def available(self, now):
+        """:rtype bool: whether requests may be routed to this backend."""
+        return self.probe_ok and now >= self.ejected_until
+
+    def warmup(self, now):
+        """:rtype float: share of its normal traffic the backend may take."""
+        if self.recovered_at is None:
+            return 1.0
+        progress = (now - self.recovered_at) / SLOW_START
+        if progress >= 1.0:
+            return 1.0
+        return max(SLOW_START_MIN, progress)
+
+    def record(self, ok):
+        """
+        Passive health check: account for the outcome of a relayed request.
+
+        :params ok (bool): whether the backend answered.
+        """
+        now = time.monotonic()
+        with self._lock:
+            warming = self.recovered_at is not None and now - self.recovered_at < SLOW_START
+            if ok:
+                self.failures = 0
+                if self.recovered_at is not None and not warming:
+                    self.recovered_at = None
+                    self.ejections = 0
+                return
+            self.failures += 1
+            if now < self.ejected_until:
+                return
+            if self.failures >= MAX_FAILS or warming:
+                # A backend failing again during its slow start is ejected
+                # at once, for longer each time.
+                factor = min(2 ** self.ejections, MAX_EJECT_FACTOR)
+                self.ejections += 1
+                self.failures = 0
+                self.ejected_until = now + EJECT_TIME * factor
+                self.recovered_at = self.ejected_until
+                print("[Proxy] Ejecting backend {} for {:.0f}s".format(
+                    self.address, EJECT_TIME * factor))
+
+    def record_probe(self, ok):
+        """
+        Active health check: account for the result of a probe.
+
+        :params ok (bool): whether the backend answered the probe.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if ok == self.probe_ok:
+                return
+            self.probe_ok = ok
+            if ok:
+                # Back in rotation now, through a slow start.
+                self.ejected_until = min(self.ejected_until, now)
+                self.recovered_at = now
+                self.failures = 0
+                print("[Proxy] Backend {} is healthy again".format(self.address))
+            else:
+                print("[Proxy] Backend {} failed its health check".format(self.address))
+
+    def load(self):
+        """:rtype float: in-flight requests per unit of weight."""
+        return self.in_flight / self.weight
+
+    @contextlib.contextmanager
+    def track(self):
+        """Count a request as in flight for the duration of the block."""
+        with self._lock:
+            self.in_flight += 1
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def __repr__(self):
+        return "Backend({}, weight={}, in_flight={})".format(
+            self.address, self.weight, self.in_flight)
+
+
+def parse_upstream(entry):
+    """
+    Parses a ``proxy_pass`` entry of the routes.
+
+    :params entry (str): ``"host:port"``, optionally followed by
+                         ``weight=N``, e.g. ``"127.0.0.1:9001 weight=3"``.
+
+    :rtype Backend: the upstream described by ``entry``.
+    """
+    fields = entry.split()
+    host, port = fields[0].split(":", 1)
+    options = dict(field.split("=", 1) for field in fields[1:] if "=" in field)
+    return Backend(host, port, options.get("weight", 1))
+
+
+class RoundRobin:
+    """Each backend in turn."""
+
+    def __init__(self):
+        self.counter = 0
+
+    def choose(self, backends, key=None):
+        backend = backends[self.counter % len(backends)]
+        self.counter += 1
+        return backend
+
+
+class WeightedRoundRobin:
+    """
+    Smooth weighted round robin: a backend of weight 3 next to one of weight
+    1 is chosen 3 times out of 4, interleaved rather than in bursts.
+    """
+
+    def __init__(self):
+        self.current = {}
+
+    def choose(self, backends, key=None):
+        total = 0
+        best = None
+        for backend in backends:
+            score = self.current.get(backend, 0) + backend.weight
+            self.current[backend] = score
+            total += backend.weight
+            if best is None or score > self.current[best]:
+                best = backend
+        self.current[best] -= total
+        return best
+
+
+class LeastConnections:
+    """The backend with the fewest in-flight requests per unit of weight."""
+
+    def __init__(self):
+        self.counter = 0
+
+    def choose(self, backends, key=None):
+        # Rotate the starting point so that ties do not always go first.
+        self.counter += 1
+        start = self.counter % len(backends)
+        ordered = backends[start:] + backends[:start]
+        return min(ordered, key=Backend.load)
+
+
+class PowerOfTwoChoices:
+    """The less loaded of two backends sampled at random."""
+
+    def choose(self, backends, key=None):
+        if len(backends) == 1:
+            return backends[0]
+        first, second = random.sample(backends, 2)
+        return first if first.load() <= second.load() else second
+
+
+class ConsistentHash:
+    """
+    A hash ring keyed on the client (session cookie), with ``weight``
+    times :data:`VIRTUAL_NODES` points per backend. Removing a backend only
+    moves the clients that were mapped to it.
+
+    A backend in slow start holds only the first part of its points, in
+    :data:`WARMUP_STEPS` steps of its warm-up. Points are only ever added
+    while it warms up, so clients move to it gradually and never back and
+    forth.
+    """
+
+    #: Slow start is applied on the ring, not by dropping candidates.
+    weighs_warmup = True
+
+    def __init__(self):
+        self.members = None
+        self.points = []
+        self.ring = []
+
+    def _build(self, members):
+        ring = []
+        for backend, count in members:
+            for i in range(count):
+                ring.append((_hash("{}#{}".format(backend.address, i)), backend))
+        ring.sort(key=lambda point: point[0])
+        self.members = members
+        self.points = [point for point, _ in ring]
+        self.ring = [backend for _, backend in ring]
+
+    def choose(self, backends, key=None):
+        if key is None:
+            return random.choice(backends)
+        now = time.monotonic()
+        members = []
+        for backend in backends:
+            step = math.ceil(backend.warmup(now) * WARMUP_STEPS)
+            members.append((backend, max(1, backend.weight * VIRTUAL_NODES * step // WARMUP_STEPS)))
+        members = tuple(members)
+        if self.members != members:
+            self._build(members)
+        index = bisect.bisect(self.points, _hash(key)) % len(self.ring)
+        return self.ring[index]
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode("utf-8")).digest()[:8], "big")
+
+
+#: ``dist_policy`` name -> policy class.
+POLICIES = {
+    "round-robin": RoundRobin,
+    "weighted-round-robin": WeightedRoundRobin,
+    "least-conn": LeastConnections,
+    "power-of-two": PowerOfTwoChoices,
+    "consistent-hash": ConsistentHash,
+}
+
+
+def register_policy(name, policy_class):
+    """
+    Makes a policy available as ``dist_policy name``.
+
+    :params name (str): policy name used in ``proxy.conf``.
+    :params policy_class (type): class whose instances provide
+                                 ``choose(backends, key)``.
+    """
+    POLICIES[name] = policy_class
+
+
+class Balancer:
+    """
+    The backends of one virtual host and the policy choosing among them.
+
+    :attrs backends (list): the :class:`Backend` objects, in config order.
+    :attrs policy_name (str): name of the policy in use.
+    """
+
+    def __init__(self, proxy_map, policy=DEFAULT_POLICY):
+        entries = proxy_map if isinstance(proxy_map, list) else [proxy_map]
+        self.backends = [parse_upstream(entry) for entry in entries]
+        if policy not in POLICIES:
+            print("[Proxy] Unknown dist_policy {!r}, using {}".format(policy, DEFAULT_POLICY))
+            policy = DEFAULT_POLICY
+        self.policy_name = policy
+        self.policy = POLICIES[policy]()
+        self._lock = threading.Lock()
+
+    def usable(self, sample=True):
+        """
+        The backends a request may go to: the available ones, each backend
+        in slow start being kept with a probability equal to its warm-up.
+        When every backend is down all of them are returned, as refusing
+        every request would not be better.
+
+        :params sample (bool): False to keep every available backend, for
+                               policies applying the warm-up themselves.
+
+        :rtype list: the candidate :class:`Backend` objects.
+        """
+        now = time.monotonic()
+        available = [backend for backend in self.backends if backend.available(now)]
+        if not sample:
+            return available or self.backends
+        warm = [backend for backend in available
+                if backend.recovered_at is None or random.random() < backend.warmup(now)]
+        return warm or available or self.backends
+
+    def choose(self, key=None):
+        """
+        Pick the backend for the next request.
+
+        :params key (str): client affinity key, e.g. the session cookie.
+
+        :rtype Backend: the chosen backend, or None if there is none.
+        """
+        if not self.backends:
+            return None
+        if len(self.backends) == 1:
+            return self.backends[0]
+        candidates = self.usable(not getattr(self.policy, "weighs_warmup", False))
+        with self._lock:
+            return self.policy.choose(candidates, key)
+
+
+_BALANCERS = {}
+_BALANCERS_LOCK = threading.Lock()
+
+
+def balancers():
+    """:rtype list: every :class:`Balancer` created so far."""
+    with _BALANCERS_LOCK:
+        return list(_BALANCERS.values())
+
+
+def get_balancer(hostname, proxy_map, policy):
+    """
+    The shared :class:`Balancer` of a virtual host, created on first use.
+
+    :params hostname (str): virtual host name.
+    :params proxy_map (str or list): its ``proxy_pass`` entries.
+    :params policy (str): its ``dist_policy``.
+    """
+    with _BALANCERS_LOCK:
+        balancer = _BALANCERS.get(hostname)
+        if balancer is None:
+            balancer = _BALANCERS[hostname] = Balancer(proxy_map, policy)
+        return balancer
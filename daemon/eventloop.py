@@ -0,0 +1,335 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.eventloop
+~~~~~~~~~~~~~~~~~
+
+This module provides a non-blocking serving engine for the backend daemon.
+All client sockets are multiplexed on a single ``selectors`` loop, so an idle
+or slow connection costs a few hundred bytes of buffer instead of a thread
+stack. Complete requests are dispatched to a bounded pool of worker threads
+that run the :class:`HttpAdapter <HttpAdapter>` route hooks, and the finished
+responses are handed back to the loop for writing.
+
+Requirements:
+--------------
+- selectors: readiness notification for the listening and client sockets.
+- workerpool: bounded worker pool for the (blocking) route hooks.
+- httpadapter: the class for handling HTTP requests.
+
+Notes:
+------
+- The loop thread never runs application code, it only reads, frames and
+  writes bytes.
+- A socketpair is used to wake the loop up when a worker has finished.
+- Connections are persistent as in :class:`HttpAdapter <HttpAdapter>`; a
+  connection has at most one request in flight, so pipelined requests are
+  answered in order.
+
+Usage Example:
+--------------
+>>> run_eventloop(server, "127.0.0.1", 9000, routes={}, threads=8)
+
+"""
+
+import time
+import socket
+import selectors
+import collections
+from .httpadapter import HttpAdapter, KEEPALIVE_TIMEOUT
+from .response import Response
+from .workerpool import WorkerPool, QUEUE_SIZE
+from .reader import (frame_message, HttpReadError,
+                     MAX_HEADER_SIZE, MAX_BODY_SIZE, READ_TIMEOUT)
+
+#: Default number of worker threads running the route hooks.
+THREADS = 8
+
+#: Size of a single ``recv`` on a client socket.
+RECV_SIZE = 65536
+
+#: Seconds between two sweeps for connections past their read deadline.
+SWEEP_INTERVAL = 1.0
+
+
+class _Connection:
+    """Per-socket state kept by the event loop."""
+
+    __slots__ = ("sock", "addr", "inbuf", "outbuf", "busy", "started", "closing",
+                 "served", "idle_since")
+
+    def __init__(self, sock, addr):
+        self.sock = sock
+        self.addr = addr
+        #: Bytes received but not yet dispatched.
+        self.inbuf = bytearray()
+        #: Response bytes not yet written to the socket.
+        self.outbuf = b""
+        #: True while a worker is processing a request of this connection.
+        self.busy = False
+        #: When the first byte of the pending request arrived.
+        self.started = None
+        #: Close once ``outbuf`` has been written.
+        self.closing = True
+        #: Requests answered on this connection so far.
+        self.served = 0
+        #: When the connection last became idle between two requests.
+        self.idle_since = time.monotonic()
+
+
+class EventLoopServer:
+    """
+    A single-threaded ``selectors`` loop serving the WeApRous routes.
+
+    :attrs server (socket.socket): the bound, listening server socket.
+    :attrs routes (dict): Mapping of route paths to handler functions.
+    :attrs threads (int): size of the worker pool running the hooks.
+    :attrs queue_size (int): requests allowed to wait for a worker; beyond
+                             that requests are answered 503.
+    :attrs adapter_options (dict): per-connection settings passed to
+                                   :class:`HttpAdapter` (read limits and
+                                   keep-alive policy).
+    """
+
+    def __init__(self, server, ip, port, routes, threads=THREADS, queue_size=QUEUE_SIZE,
+                 **adapter_options):
+        self.server = server
+        self.ip = ip
+        self.port = port
+        self.routes = routes
+        self.threads = threads
+        self.queue_size = queue_size
+        self.adapter_options = adapter_options
+        self.max_header_size = adapter_options.get("max_header_size", MAX_HEADER_SIZE)
+        self.max_body_size = adapter_options.get("max_body_size", MAX_BODY_SIZE)
+        self.read_timeout = adapter_options.get("read_timeout", READ_TIMEOUT)
+        self.keepalive_timeout = adapter_options.get("keepalive_timeout", KEEPALIVE_TIMEOUT)
+        #: Open client connections, for the read deadline sweep.
+        self.connections = set()
+        self.selector = selectors.DefaultSelector()
+        self.pool = WorkerPool("backend-hooks", threads, queue_size)
+        #: Responses finished by the workers, waiting to be written.
+        self.completed = collections.deque()
+        self._wakeup_r, self._wakeup_w = socket.socketpair()
+        self._wakeup_r.setblocking(False)
+        self._wakeup_w.setblocking(False)
+
+    def serve_forever(self, stop_event=None):
+        """
+        Run the event loop until the server socket fails or ``stop_event``
+        is set. After a stop no new connection is accepted, idle keep-alive
+        connections are closed and the loop returns once the requests in
+        flight have been answered.
+
+        :param stop_event (threading.Event): optional graceful stop signal.
+        """
+        self.server.setblocking(False)
+        self.selector.register(self.server, selectors.EVENT_READ, self._accept)
+        self.selector.register(self._wakeup_r, selectors.EVENT_READ, self._drain_completed)
+
+        next_sweep = time.monotonic() + SWEEP_INTERVAL
+        draining = False
+        try:
+            while True:
+                if stop_event is not None and stop_event.is_set():
+                    if not draining:
+                        draining = True
+                        self.selector.unregister(self.server)
+                    for conn in list(self.connections):
+                        if not conn.busy and not conn.outbuf:
+                            self._close(conn)
+                    if not self.connections:
+                        return
+                for key, mask in self.selector.select(SWEEP_INTERVAL):
+                    callback = key.data
+                    if isinstance(callback, _Connection):
+                        self._service(callback, mask)
+                    else:
+                        callback()
+                now = time.monotonic()
+                if now >= next_sweep:
+                    self._sweep(now)
+                    next_sweep = now + SWEEP_INTERVAL
+        finally:
+            self.pool.shutdown()
+            self.selector.close()
+
+    def _accept(self):
+        while True:
+            try:
+                sock, addr = self.server.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            sock.setblocking(False)
+            conn = _Connection(sock, addr)
+            self.connections.add(conn)
+            self.selector.register(sock, selectors.EVENT_READ, conn)
+
+    def _sweep(self, now):
+        """Answer 408 to slow requests and close expired idle connections."""
+        for conn in list(self.connections):
+            if conn.busy or conn.outbuf:
+                continue
+            if conn.started is not None:
+                if now - conn.started > self.read_timeout:
+                    self._reject(conn, HttpReadError(408, "Request Timeout"))
+            elif now - conn.idle_since > self.keepalive_timeout:
+                self._close(conn)
+
+    def _service(self, conn, mask):
+        if mask & selectors.EVENT_READ:
+            self._read(conn)
+        if mask & selectors.EVENT_WRITE and conn.sock.fileno() >= 0:
+            self._write(conn)
+
+    def _read(self, conn):
+        try:
+            data = conn.sock.recv(RECV_SIZE)
+        except (BlockingIOError, InterruptedError):
+            return
+        except socket.error:
+            self._close(conn)
+            return
+
+        if not data:
+            # Peer closed its side. A request still in flight will find the
+            # socket gone when its response comes back.
+            self._close(conn)
+            return
+
+        if conn.started is None:
+            conn.started = time.monotonic()
+        conn.inbuf += data
+        self._dispatch(conn)
+
+    def _dispatch(self, conn):
+        if conn.busy or conn.outbuf:
+            return
+        try:
+            framed = frame_message(conn.inbuf, self.max_header_size, self.max_body_size)
+        except HttpReadError as e:
+            self._reject(conn, e)
+            return
+        if framed is None:
+            return
+
+        head, body, consumed = framed
+        del conn.inbuf[:consumed]
+        conn.started = time.monotonic() if conn.inbuf else None
+        conn.busy = True
+        conn.served += 1
+        # Stop reading while the request is processed, so a client cannot
+        # pile up unbounded pipelined data; the response re-arms the socket.
+        self.selector.unregister(conn.sock)
+        msg = (head + body).decode("utf-8", errors="replace")
+        if not self.pool.submit(self._process, conn, msg):
+            # Every worker is busy and the queue is full: shed the request.
+            self._finish(conn, Response().build_unavailable(), False)
+
+    def _reject(self, conn, error):
+        """Answer a request that could not be read, then close."""
+        print("[Backend] Rejecting request from {}: {}".format(conn.addr, error))
+        conn.inbuf.clear()
+        conn.started = None
+        conn.closing = True
+        conn.outbuf = Response().build_error(error.status, error.reason)
+        self.selector.modify(conn.sock, selectors.EVENT_WRITE, conn)
+
+    def _process(self, conn, msg):
+        """Worker side: run the adapter and hand the response to the loop."""
+        adapter = HttpAdapter(self.ip, self.port, conn.sock, conn.addr, self.routes,
+                              **self.adapter_options)
+        try:
+            response = adapter.handle_request(msg, self.routes)
+        except Exception as e:
+            print("[Backend] Error while handling {}: {}".format(conn.addr, e))
+            response = adapter.response.build_server_error()
+        response, keep_alive = adapter.finish_response(response, conn.served)
+        self._finish(conn, response, keep_alive)
+
+    def _finish(self, conn, response, keep_alive):
+        """Queue a response for the loop thread and wake it up."""
+        self.completed.append((conn, response, keep_alive))
+        try:
+            self._wakeup_w.send(b"\0")
+        except (BlockingIOError, InterruptedError):
+            # The loop already has a pending wakeup.
+            pass
+
+    def _drain_completed(self):
+        try:
+            while self._wakeup_r.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+
+        while self.completed:
+            conn, response, keep_alive = self.completed.popleft()
+            if conn.sock.fileno() < 0:
+                continue
+            conn.outbuf = response
+            conn.closing = not keep_alive
+            self.selector.register(conn.sock, selectors.EVENT_WRITE, conn)
+
+    def _write(self, conn):
+        try:
+            sent = conn.sock.send(conn.outbuf)
+        except (BlockingIOError, InterruptedError):
+            return
+        except socket.error:
+            self._close(conn)
+            return
+
+        conn.outbuf = conn.outbuf[sent:]
+        if conn.outbuf:
+            return
+        if conn.closing:
+            self._close(conn)
+            return
+
+        # Persistent connection: wait for (or answer the already
+        # pipelined) next request.
+        conn.busy = False
+        conn.idle_since = time.monotonic()
+        self.selector.modify(conn.sock, selectors.EVENT_READ, conn)
+        self._dispatch(conn)
+
+    def _close(self, conn):
+        self.connections.discard(conn)
+        if conn.sock.fileno() < 0:
+            return
+        try:
+            self.selector.unregister(conn.sock)
+        except (KeyError, ValueError):
+            pass
+        conn.sock.close()
+
+
+def run_eventloop(server, ip, port, routes, threads=THREADS, queue_size=QUEUE_SIZE,
+                  stop_event=None, **adapter_options):
+    """
+    Serve the routes on an already listening socket with the event loop.
+
+    :param server (socket.socket): bound and listening server socket.
+    :param ip (str): IP address the server is bound to.
+    :param port (int): Port number the server is listening on.
+    :param routes (dict): Dictionary of route handlers.
+    :param threads (int): number of worker threads running the route hooks.
+    :param queue_size (int): requests allowed to wait for a worker.
+    :param stop_event (threading.Event): when set, stop accepting and return
+                                         once in-flight requests are answered.
+    :param adapter_options: per-connection settings, see :class:`HttpAdapter`.
+    """
+    print("[Backend] Event loop serving with {} threads, queue {}".format(threads, queue_size))
+    EventLoopServer(server, ip, port, routes, threads, queue_size,
+                    **adapter_options).serve_forever(stop_event)
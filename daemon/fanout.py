@@ -0,0 +1,191 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.fanout
+~~~~~~~~~~~~~~~~~
+
+This module provides the client side of peer-to-peer delivery: a
+:class:`PeerDispatcher` sends one request to many peer sessions at once.
+Each session gets its own job on a thread pool, so delivering to N peers
+takes about one round trip instead of N, and a slow or dead peer only
+costs its own short timeout.
+
+Connections to peers are kept alive and reused between sends, one idle
+stack per ``(ip, port)``, the way :mod:`daemon.upstream` pools backend
+connections for the proxy.
+
+Usage Example:
+--------------
+>>> dispatcher = PeerDispatcher()
+>>> for result in dispatcher.fan_out([("bob", "10.0.0.2", 9002)], "/send-peer", body):
+...     print(result.username, result.ok)
+"""
+
+import time
+import threading
+import collections
+import http.client
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+#: Threads sending to peers in parallel.
+FANOUT_WORKERS = 32
+#: Seconds allowed to connect to a peer.
+CONNECT_TIMEOUT = 1.0
+#: Seconds allowed for a peer to answer once connected.
+REQUEST_TIMEOUT = 3.0
+#: Idle connections kept per peer session.
+MAX_IDLE = 2
+#: Seconds an idle connection may be reused; below the peers' keep-alive
+#: timeout so the client closes first.
+IDLE_TIMEOUT = 4.0
+
+
+class Delivery:
+    """
+    Outcome of sending to one peer session.
+
+    :attrs username (str): the peer the session belongs to.
+    :attrs address (str): ``ip:port`` of the session.
+    :attrs status (int): HTTP status, or None when the send failed.
+    :attrs error (str): reason of the failure, or None.
+    """
+
+    __slots__ = ("username", "address", "status", "error")
+
+    def __init__(self, username, address, status=None, error=None):
+        self.username = username
+        self.address = address
+        self.status = status
+        self.error = error
+
+    @property
+    def ok(self):
+        """:rtype bool: whether the peer answered 200."""
+        return self.status == 200
+
+    def __repr__(self):
+        return "Delivery({}, {}, {})".format(self.username, self.address,
+                                             self.status or self.error)
+
+
+class PeerDispatcher:
+    """
+    Thread pool plus keep-alive connection cache for peer-to-peer sends.
+
+    :attrs connect_timeout (float): timeout to open a connection.
+    :attrs timeout (float): timeout of one request on an open connection.
+    """
+
+    def __init__(self, workers=FANOUT_WORKERS, connect_timeout=CONNECT_TIMEOUT,
+                 timeout=REQUEST_TIMEOUT, max_idle=MAX_IDLE, idle_timeout=IDLE_TIMEOUT):
+        self.connect_timeout = connect_timeout
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers,
+                                            thread_name_prefix="fanout")
+        #: (ip, port) -> deque of (HTTPConnection, idle since).
+        self._idle = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+
+    def _acquire(self, ip, port):
+        with self._lock:
+            idle = self._idle[(ip, port)]
+            while idle:
+                conn, since = idle.pop()
+                if time.monotonic() - since <= self.idle_timeout:
+                    return conn, True
+                conn.close()
+        conn = http.client.HTTPConnection(ip, port, timeout=self.connect_timeout)
+        conn.connect()
+        conn.sock.settimeout(self.timeout)
+        return conn, False
+
+    def _release(self, ip, port, conn):
+        with self._lock:
+            idle = self._idle[(ip, port)]
+            if len(idle) < self.max_idle:
+                idle.append((conn, time.monotonic()))
+                return
+        conn.close()
+
+    def send(self, username, ip, port, path, body, headers=None):
+        """
+        POST ``body`` to one session, reusing a kept-alive connection when
+        there is one. A send failing on a reused connection (other than by
+        timing out) is retried once on a new connection, as the peer may
+        have closed the idle one.
+
+        :rtype Delivery: the outcome.
+        """
+        address = "{}:{}".format(ip, port)
+        headers = dict(headers or {"Content-Type": "application/json"})
+        for attempt in range(2):
+            conn = None
+            try:
+                conn, reused = self._acquire(ip, port)
+                conn.request("POST", path, body, headers)
+                response = conn.getresponse()
+                response.read()
+                if response.will_close:
+                    conn.close()
+                else:
+                    self._release(ip, port, conn)
+                return Delivery(username, address, response.status)
+            except (OSError, http.client.HTTPException) as e:
+                if conn is not None:
+                    conn.close()
+                if (attempt == 0 and conn is not None and reused
+                        and not isinstance(e, TimeoutError)):
+                    continue
+                return Delivery(username, address, error=str(e) or e.__class__.__name__)
+
+    def submit(self, sessions, path, body, headers=None):
+        """
+        Start sending to every session without waiting.
+
+        :params sessions (iterable): ``(username, ip, port)`` tuples.
+
+        :rtype list: one ``Future`` of :class:`Delivery` per session.
+        """
+        return [self._executor.submit(self.send, username, ip, port, path, body, headers)
+                for username, ip, port in sessions]
+
+    def fan_out(self, sessions, path, body, headers=None):
+        """
+        Send to every session in parallel and yield the :class:`Delivery`
+        objects as they complete, fastest peers first.
+        """
+        for future in as_completed(self.submit(sessions, path, body, headers)):
+            yield future.result()
+
+    def close(self):
+        """Close every idle connection and stop the threads."""
+        with self._lock:
+            conns = [conn for idle in self._idle.values() for conn, _ in idle]
+            self._idle.clear()
+        for conn in conns:
+            conn.close()
+        self._executor.shutdown(wait=False)
+
+
+def sessions_of(peers):
+    """
+    Flattens a peer list into sessions.
+
+    :params peers (dict): username -> list of ``(ip, port)``.
+
+    :rtype list: ``(username, ip, port)`` tuples.
+    """
+    return [(username, ip, port) for username, addresses in peers.items()
+            for ip, port in addresses]
@@ -0,0 +1,117 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.health
+~~~~~~~~~~~~~~~~~
+
+This module provides the upstream health tracking of the proxy.
+
+- Passive: every relayed request reports its outcome to its
+  :class:`Backend <daemon.balancer.Backend>`. After ``MAX_FAILS`` failures in
+  a row the backend is ejected for ``EJECT_TIME`` seconds, doubled on each
+  consecutive ejection.
+- Active: a :class:`HealthChecker` thread probes every backend with
+  ``GET /health`` (the tracker's health route). A backend that does not
+  answer, or answers 5xx, is taken out of rotation until a probe succeeds.
+
+A backend coming back is re-admitted with a slow start: during
+``SLOW_START`` seconds it receives a growing share of its normal traffic.
+
+Usage Example:
+--------------
+>>> HealthChecker([balancer], path="/health", interval=5).start()
+"""
+
+import socket
+import threading
+
+#: Consecutive failed requests before a backend is ejected.
+MAX_FAILS = 3
+#: Seconds of the first ejection; doubled on each consecutive ejection.
+EJECT_TIME = 10.0
+#: Largest multiplier applied to ``EJECT_TIME``.
+MAX_EJECT_FACTOR = 8
+#: Seconds over which a re-admitted backend ramps up to its full share.
+SLOW_START = 10.0
+#: Share of traffic a backend gets right after re-admission.
+SLOW_START_MIN = 0.1
+
+#: Path probed by the active health checker.
+HEALTH_PATH = "/health"
+#: Seconds between two probes of a backend.
+HEALTH_INTERVAL = 5.0
+#: Seconds allowed for one probe.
+HEALTH_TIMEOUT = 2.0
+
+
+def probe(host, port, path=HEALTH_PATH, timeout=HEALTH_TIMEOUT):
+    """
+    Sends ``GET path`` to a backend.
+
+    :rtype bool: True when it answers with a status below 500. A 404 still
+                 shows a live server, for backends without a health route.
+    """
+    request = ("GET {} HTTP/1.1\r\n"
+               "Host: {}:{}\r\n"
+               "Connection: close\r\n"
+               "\r\n").format(path, host, port).encode()
+    try:
+        with socket.create_connection((host, port), timeout=timeout) as sock:
+            sock.sendall(request)
+            data = b""
+            while b"\r\n" not in data:
+                chunk = sock.recv(1024)
+                if not chunk:
+                    break
+                data += chunk
+    except socket.error:
+        return False
+    try:
+        return int(data.split(b" ", 2)[1]) < 500
+    except (IndexError, ValueError):
+        return False
+
+
+class HealthChecker(threading.Thread):
+    """
+    Background thread probing the backends of the given balancers.
+
+    :attrs balancers (list): :class:`Balancer <daemon.balancer.Balancer>`
+                             objects whose backends are checked.
+    :attrs path (str): probed path.
+    :attrs interval (float): seconds between two rounds of probes.
+    """
+
+    def __init__(self, balancers, path=HEALTH_PATH, interval=HEALTH_INTERVAL,
+                 timeout=HEALTH_TIMEOUT):
+        threading.Thread.__init__(self, name="health-checker")
+        self.daemon = True
+        self.balancers = balancers
+        self.path = path
+        self.interval = interval
+        self.timeout = timeout
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while True:
+            for balancer in self.balancers:
+                for backend in balancer.backends:
+                    backend.record_probe(probe(backend.host, backend.port,
+                                               self.path, self.timeout))
+            if self._stop_event.wait(self.interval):
+                return
+
+    def stop(self):
+        """Stop probing after the current round."""
+        self._stop_event.set()
+
@@ -21,11 +21,18 @@ Request and Response objects to handle client-server communication.
 """
 
 from .request import Request
-from .response import Response
+from .response import Response, set_connection_header
 from .dictionary import CaseInsensitiveDict
-import time
+from .reader import (read_message, HttpReadError,
+                     MAX_HEADER_SIZE, MAX_BODY_SIZE, READ_TIMEOUT)
+import socket
 import sqlite3
 
+#: Seconds an idle persistent connection is kept open between requests.
+KEEPALIVE_TIMEOUT = 5
+#: Requests served on one persistent connection before it is closed.
+MAX_KEEPALIVE_REQUESTS = 100
+
 class HttpAdapter:
     """
     A mutable :class:`HTTP adapter <HTTP adapter>` for managing client connections
@@ -44,6 +51,11 @@ class HttpAdapter:
         routes (dict): Mapping of route paths to handler functions.
         request (Request): Request object for parsing incoming data.
         response (Response): Response object for building and sending replies.
+        max_header_size (int): Largest accepted header block, in bytes.
+        max_body_size (int): Largest accepted request body, in bytes.
+        read_timeout (float): Seconds allowed to receive one request.
+        keepalive_timeout (float): Idle seconds allowed between two requests.
+        max_keepalive_requests (int): Requests served per persistent connection.
     """
 
     __attrs__ = [
@@ -54,9 +66,17 @@ class HttpAdapter:
         "routes",
         "request",
         "response",
+        "max_header_size",
+        "max_body_size",
+        "read_timeout",
+        "keepalive_timeout",
+        "max_keepalive_requests",
     ]
 
-    def __init__(self, ip, port, conn, connaddr, routes):
+    def __init__(self, ip, port, conn, connaddr, routes,
+                 max_header_size=MAX_HEADER_SIZE, max_body_size=MAX_BODY_SIZE,
+                 read_timeout=READ_TIMEOUT, keepalive_timeout=KEEPALIVE_TIMEOUT,
+                 max_keepalive_requests=MAX_KEEPALIVE_REQUESTS):
         """
         Initialize a new HttpAdapter instance.
 
@@ -65,6 +85,12 @@ class HttpAdapter:
         :param conn (socket): Active socket connection.
         :param connaddr (tuple): Address of the connected client.
         :param routes (dict): Mapping of route paths to handler functions.
+        :param max_header_size (int): Largest accepted header block, in bytes.
+        :param max_body_size (int): Largest accepted request body, in bytes.
+        :param read_timeout (float): Seconds allowed to receive one request.
+        :param keepalive_timeout (float): Idle seconds allowed between two requests.
+        :param max_keepalive_requests (int): Requests served per persistent
+                                             connection, 1 disables keep-alive.
         """
 
         #: IP address.
@@ -81,60 +107,147 @@ class HttpAdapter:
         self.request = Request()
         #: Response
         self.response = Response()
+        #: Read limits
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        self.read_timeout = read_timeout
+        #: Persistent connection policy
+        self.keepalive_timeout = keepalive_timeout
+        self.max_keepalive_requests = max_keepalive_requests
 
     def handle_client(self, conn, addr, routes):
         """
         Handle an incoming client connection.
-        ... (các mô tả khác) ...
+
+        Requests are read and answered one after another on the same socket
+        for as long as the client asks for a persistent connection (HTTP/1.1
+        default, or ``Connection: keep-alive`` on HTTP/1.0), up to
+        ``max_keepalive_requests`` and while no more than ``keepalive_timeout``
+        idle seconds pass between requests. Pipelined requests already in the
+        buffer are answered in order.
+
+        :param conn (socket.socket): Client connection socket.
+        :param addr (tuple): client address (IP, port).
+        :param routes (dict): Mapping of route paths to handler functions.
         """
 
         # Connection handler.
         self.conn = conn        
         # Connection address.
         self.connaddr = addr
+
+        buf = bytearray()
+        served = 0
+        try:
+            while True:
+                # Read the full header block and body, however many
+                # segments they arrive in.
+                try:
+                    message = read_message(
+                        conn, buf, self.max_header_size, self.max_body_size,
+                        self.read_timeout,
+                        idle_timeout=self.keepalive_timeout if served else None)
+                except HttpReadError as e:
+                    print("[HttpAdapter] Rejecting request from {}: {}".format(addr, e))
+                    conn.sendall(self.response.build_error(e.status, e.reason))
+                    return
+                if message is None:
+                    return
+
+                head, body = message
+                msg = (head + body).decode('utf-8', errors='replace')
+                served += 1
+                try:
+                    response = self.handle_request(msg, routes)
+                except Exception as e:
+                    print("[HttpAdapter] Error while handling {}: {}".format(addr, e))
+                    response = self.response.build_server_error()
+
+                response, keep_alive = self.finish_response(response, served)
+                conn.sendall(response)
+                if not keep_alive:
+                    return
+        except socket.error as e:
+            print("[HttpAdapter] Socket error with {}: {}".format(addr, e))
+        finally:
+            conn.close()
+
+    def keep_alive_requested(self, req):
+        """
+        Tell whether the client wants the connection kept open after ``req``.
+
+        :param req (Request): the request just processed.
+
+        :rtype bool: True for HTTP/1.1 without ``Connection: close``, or for
+                     HTTP/1.0 with ``Connection: keep-alive``.
+        """
+        if req.headers is None:
+            # The request could not even be parsed.
+            return False
+        token = req.headers.get('connection', '').lower()
+        if getattr(req, 'version', None) == 'HTTP/1.1':
+            return 'close' not in token
+        return 'keep-alive' in token
+
+    def finish_response(self, response, served):
+        """
+        Apply the connection policy to a response before it is sent.
+
+        :param response (bytes): full response built for the current request.
+        :param served (int): number of requests served on this connection,
+                             the current one included.
+
+        :rtype tuple: (bytes, bool) response with its ``Connection`` header
+                      and whether the connection stays open.
+        """
+        keep_alive = (served < self.max_keepalive_requests
+                      and self.keep_alive_requested(self.request))
+        return set_connection_header(response, keep_alive, self.keepalive_timeout,
+                                     self.max_keepalive_requests - served)
+
+    def handle_request(self, msg, routes):
+        """
+        Dispatch one complete request message and build its response.
+
+        The message is parsed into a fresh :class:`Request <Request>`. A matching
+        route hook produces the full response bytes by itself, otherwise the
+        request is served as an unprotected static file. This method does no
+        socket I/O, so it can run on any worker thread.
+
+        :param msg (str): the raw request (request line, headers and body).
+        :param routes (dict): Mapping of route paths to handler functions.
+
+        :rtype bytes: complete HTTP response for the request.
+        """
         # Request handler
-        req = self.request
+        req = self.request = Request()
         # Response handler
-        resp = self.response
+        resp = self.response = Response()
 
-        time.sleep(0.1)
-        # Handle the request
-        msg = conn.recv(4096).decode()
-        if not msg:
-            conn.close()
-            return
-            
         req.prepare(msg, routes) # <-- req.cookies được parse ở đây
 
-
         if req.hook:
             # Hook (ví dụ: handle_login, submit_info, send_peer)
             # phải tự chịu trách nhiệm 100%
             # và trả về full response (dạng bytes)
             try:
-                response_bytes = req.hook(req) 
-                conn.sendall(response_bytes)
+                response_bytes = req.hook(req)
+                if not isinstance(response_bytes, bytes):
+                    raise TypeError("hook returned {}".format(type(response_bytes).__name__))
+                return response_bytes
             except Exception as e:
                 print(f"[HttpAdapter] Lỗi khi thực thi hook {req.path}: {e}")
                 # Gửi lỗi 500 Internal Server Error
-                conn.sendall(resp.build_server_error())
-            finally:
-                conn.close()
-                return
+                return resp.build_server_error()
 
         # 2. Xử lý File Tĩnh (Không khớp hook)
         # Chỉ phục vụ các file tĩnh không cần bảo vệ
-        else:
-            if req.method == 'GET':
-                # resp.build_response sẽ tự xử lý 404 nếu không tìm thấy file
-                response_bytes = resp.build_response(req)
-                conn.sendall(response_bytes)
-            else:
-                # Không phải hook, cũng không phải GET (ví dụ POST /random)
-                conn.sendall(resp.build_notfound())
-            
-            conn.close()
-            return
+        if req.method == 'GET':
+            # resp.build_response sẽ tự xử lý 404 nếu không tìm thấy file
+            return resp.build_response(req)
+
+        # Không phải hook, cũng không phải GET (ví dụ POST /random)
+        return resp.build_notfound()
 
     @property
     def extract_cookies(self, req, resp):
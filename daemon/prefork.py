@@ -0,0 +1,247 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.prefork
+~~~~~~~~~~~~~~~~~
+
+This module provides a pre-forking supervisor for the backend daemon. The
+parent process forks ``workers`` children that each run the normal serving
+loop, so route hooks execute on every CPU core instead of behind one GIL.
+
+Where the platform offers ``SO_REUSEPORT`` every child binds its own
+listening socket on the same port and the kernel balances new connections
+between them. Elsewhere the parent binds a single socket before forking and
+the children share (inherit) it.
+
+Signals handled by the parent:
+
+- ``SIGTERM`` / ``SIGINT``: graceful shutdown. Every child stops accepting,
+  finishes the requests in flight and exits; children still alive after the
+  grace period are killed.
+- ``SIGHUP``: rolling restart. A new generation of children is started, then
+  the old one is shut down gracefully, so the port is never left unserved.
+
+A child that dies on its own is replaced.
+
+Notes:
+------
+- Children are forked copies of the parent, so a rolling restart recycles
+  the workers (fresh memory, fresh connections) but does not reload code.
+- Anything kept in process memory (caches, counters) is per-child.
+- Without ``os.fork`` (Windows) the server falls back to a single process.
+
+Usage Example:
+--------------
+>>> run_prefork(4, make_socket, serve)
+"""
+
+import os
+import time
+import errno
+import signal
+import socket
+import threading
+
+#: Seconds a child is given to finish its requests after ``SIGTERM``.
+GRACE_PERIOD = 10.0
+
+#: Seconds between two checks of the children by the parent.
+POLL_INTERVAL = 0.2
+
+#: A child exiting sooner than this after its start is considered crashing,
+#: and is respawned only after the same delay.
+RESPAWN_DELAY = 1.0
+
+
+def fork_supported():
+    """:rtype bool: whether this platform can run a pre-forked server."""
+    return hasattr(os, "fork")
+
+
+def reuse_port_supported():
+    """:rtype bool: whether each child can bind its own socket to the port."""
+    return hasattr(socket, "SO_REUSEPORT")
+
+
+class Supervisor:
+    """
+    Parent side of the pre-forked server.
+
+    :attrs workers (int): number of child processes to keep running.
+    :attrs make_socket (callable): ``make_socket(reuse_port)`` returns a bound,
+                                   listening server socket.
+    :attrs serve (callable): ``serve(server, stop_event)`` serves until the
+                             event is set, then drains and returns.
+    :attrs grace (float): seconds a stopping child may take before ``SIGKILL``.
+    """
+
+    def __init__(self, workers, make_socket, serve, grace=GRACE_PERIOD):
+        if workers < 1:
+            raise ValueError("Supervisor needs at least one worker")
+        self.workers = workers
+        self.make_socket = make_socket
+        self.serve = serve
+        self.grace = grace
+        self.reuse_port = reuse_port_supported()
+        #: Inherited listening socket when ``SO_REUSEPORT`` is not available.
+        self.shared = None
+        #: pid -> (slot, start time) of the current generation.
+        self.children = {}
+        #: pid -> kill deadline of children asked to stop.
+        self.retiring = {}
+        self._stopping = False
+        self._reload = False
+
+    def run(self):
+        """Start the children and supervise them until asked to stop."""
+        if self.reuse_port:
+            # Fail fast (e.g. port in use) instead of crash-looping children.
+            self.make_socket(True).close()
+        else:
+            self.shared = self.make_socket(False)
+
+        signal.signal(signal.SIGTERM, self._on_stop)
+        signal.signal(signal.SIGINT, self._on_stop)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, self._on_reload)
+
+        print("[Backend] Supervisor {} starting {} workers ({})".format(
+            os.getpid(), self.workers,
+            "SO_REUSEPORT" if self.reuse_port else "shared socket"))
+        for slot in range(self.workers):
+            self._spawn(slot)
+
+        while not self._stopping:
+            if self._reload:
+                self._reload = False
+                self._restart()
+            self._reap()
+            time.sleep(POLL_INTERVAL)
+
+        self._shutdown()
+
+    def _on_stop(self, signum, frame):
+        self._stopping = True
+
+    def _on_reload(self, signum, frame):
+        self._reload = True
+
+    def _spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            self._child(slot)
+        self.children[pid] = (slot, time.monotonic())
+
+    def _child(self, slot):
+        """Child side: serve until ``SIGTERM``, then exit without returning."""
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop.set())
+        # Ctrl-C reaches the whole process group; the parent handles it.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+        code = 0
+        try:
+            server = self.shared if self.shared is not None else self.make_socket(True)
+            print("[Backend] Worker {} (pid {}) serving".format(slot, os.getpid()))
+            self.serve(server, stop)
+        except Exception as e:
+            print("[Backend] Worker {} failed: {}".format(slot, e))
+            code = 1
+        finally:
+            os._exit(code)
+
+    def _restart(self):
+        """Start a new generation of children, then retire the old one."""
+        print("[Backend] Rolling restart of {} workers".format(len(self.children)))
+        old = list(self.children)
+        slots = [self.children[pid][0] for pid in old]
+        for pid in old:
+            del self.children[pid]
+        for slot in slots:
+            self._spawn(slot)
+        for pid in old:
+            self._terminate(pid)
+
+    def _terminate(self, pid):
+        self.retiring[pid] = time.monotonic() + self.grace
+        self._signal(pid, signal.SIGTERM)
+
+    def _signal(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except OSError as e:
+            if e.errno != errno.ESRCH:
+                raise
+
+    def _reap(self):
+        """Collect exited children, respawn crashed ones, kill late ones."""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+
+            if pid in self.retiring:
+                del self.retiring[pid]
+            elif pid in self.children:
+                slot, started = self.children.pop(pid)
+                print("[Backend] Worker {} (pid {}) exited with status {}, respawning".format(
+                    slot, pid, status))
+                if time.monotonic() - started < RESPAWN_DELAY:
+                    time.sleep(RESPAWN_DELAY)
+                if not self._stopping:
+                    self._spawn(slot)
+
+        now = time.monotonic()
+        for pid, deadline in list(self.retiring.items()):
+            if now >= deadline:
+                print("[Backend] Worker pid {} did not stop in time, killing".format(pid))
+                self._signal(pid, signal.SIGKILL)
+                # Reaped on a later pass; do not kill it twice.
+                self.retiring[pid] = float("inf")
+
+    def _shutdown(self):
+        """Stop every child gracefully, then kill the ones left."""
+        print("[Backend] Shutting down {} workers".format(len(self.children)))
+        for pid in list(self.children):
+            self._terminate(pid)
+        self.children.clear()
+
+        while self.retiring:
+            self._reap()
+            time.sleep(POLL_INTERVAL)
+
+        if self.shared is not None:
+            self.shared.close()
+        print("[Backend] Supervisor stopped")
+
+
+def run_prefork(workers, make_socket, serve, grace=GRACE_PERIOD):
+    """
+    Serve with ``workers`` pre-forked processes, see :class:`Supervisor`.
+
+    :param workers (int): number of child processes.
+    :param make_socket (callable): ``make_socket(reuse_port)`` returns a bound,
+                                   listening server socket.
+    :param serve (callable): ``serve(server, stop_event)`` runs one worker.
+    :param grace (float): seconds allowed for a graceful stop.
+    """
+    if not fork_supported():
+        print("[Backend] os.fork is not available, serving from a single process")
+        serve(make_socket(False), None)
+        return
+    Supervisor(workers, make_socket, serve, grace).run()
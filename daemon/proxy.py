@@ -22,6 +22,12 @@ Requirement:
 -----------------
 - socket: provides socket networking interface.
 - threading: enables concurrent client handling via threads.
+- workerpool: optional bounded worker pool with admission control.
+- upstream: keep-alive connection pool to the backends.
+- reader: HTTP message framing for requests and the pooled connections.
+- relay: streaming copy between the client and backend sockets.
+- balancer: load-balancing policies and per-backend in-flight counters.
+- health: active health checks and passive ejection of backends.
 - response: customized :class: `Response <Response>` utilities.
 - httpadapter: :class: `HttpAdapter <HttpAdapter >` adapter for HTTP request processing.
 - dictionary: :class: `CaseInsensitiveDict <CaseInsensitiveDict>` for managing headers and cookies.
@@ -32,6 +38,14 @@ import threading
 from .response import *
 from .httpadapter import HttpAdapter
 from .dictionary import CaseInsensitiveDict
+from .workerpool import WorkerPool, QUEUE_SIZE
+from .backend import reject_connection
+from .upstream import UpstreamPool
+from .reader import (parse_head, body_framing, response_framing,
+                     response_keeps_alive, HttpReadError, READ_TIMEOUT)
+from .relay import SocketReader, relay_body
+from .balancer import get_balancer, balancers
+from .health import HealthChecker, HEALTH_PATH, HEALTH_INTERVAL
 
 #: A dictionary mapping hostnames to backend IP and port tuples.
 #: Used to determine routing targets for incoming requests.
@@ -41,87 +55,275 @@ PROXY_PASS = {
     "app2.local": ('192.168.56.103', 9002),
 }
 
+#: Route used for a hostname missing from the routes.
+DEFAULT_ROUTE = ('127.0.0.1:9000', 'round-robin')
 
-def forward_request(host, port, request):
+#: Seconds a backend may stay silent while a response is relayed.
+UPSTREAM_TIMEOUT = 30.0
+
+#: Backend statuses counted as failures by the passive health check.
+UNHEALTHY_STATUSES = (502, 503, 504)
+
+#: Request bodies up to this size are read before forwarding, so the request
+#: can be retried on a fresh connection; larger ones are streamed.
+REPLAY_LIMIT = 64 * 1024
+
+#: Keep-alive connections to the backends, shared by every client thread.
+UPSTREAMS = UpstreamPool()
+
+#: Hop-by-hop headers replaced when a request is sent upstream.
+HOP_HEADERS = ("connection", "keep-alive", "proxy-connection")
+
+
+def upstream_head(head):
+    """
+    Prepares a client header block for a pooled backend connection: the
+    client's connection headers are dropped and ``Connection: keep-alive``
+    is asked.
+
+    :params head (bytes): request line and headers, blank line included.
+
+    :rtype bytes: the header block to send upstream.
+    """
+    lines = [line for line in head[:-4].split(b"\r\n")
+             if line.split(b":", 1)[0].strip().lower().decode("latin-1") not in HOP_HEADERS]
+    lines.append(b"Connection: keep-alive")
+    return b"\r\n".join(lines) + b"\r\n\r\n"
+
+
+class _Collector:
+    """``sendall`` target gathering a relayed response in memory."""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def sendall(self, data):
+        self.data += data
+
+
+class _BackendError(Exception):
+    """A send to the backend failed, as opposed to a read from the client."""
+
+
+class _BackendSink:
+    """``sendall`` target tagging the errors of the backend socket."""
+
+    def __init__(self, sock):
+        self.sock = sock
+
+    def sendall(self, data):
+        try:
+            self.sock.sendall(data)
+        except socket.error as e:
+            raise _BackendError(e)
+
+
+def _client_error(dst, e):
+    """Answers a request whose body could not be read from the client."""
+    status, reason = (408, "Request Timeout") if isinstance(e, socket.timeout) \
+        else (400, "Bad Request")
+    try:
+        dst.sendall(Response().build_error(status, reason))
+    except socket.error:
+        pass
+
+
+def relay_request(host, port, head, client, dst, pool=UPSTREAMS):
+    """
+    Relays one request to a backend and streams the response back.
+
+    The request body is read from ``client`` and the response body written
+    to ``dst`` as the bytes arrive, through the fixed buffers of
+    :class:`SocketReader`, so memory use does not grow with the payload.
+    The request goes over a pooled keep-alive connection, which returns to
+    the pool once the response has been delimited by its ``Content-Length``
+    or chunked encoding.
+
+    A small request body (up to ``REPLAY_LIMIT``) is read before sending,
+    so that when a pooled connection turns out to be closed by the backend
+    the request can be retried once on a newly opened one (never on
+    another pooled connection, which may be just as stale).
+
+    :params host (str): IP address of the backend server.
+    :params port (int): port number of the backend server.
+    :params head (bytes): request line and headers from the client.
+    :params client (SocketReader): reader positioned at the request body.
+    :params dst (socket.socket): where the response is written.
+    :params pool (UpstreamPool): connection pool to use.
+
+    :rtype bool: whether the backend answered properly, for the passive
+                 health check; None when the outcome says nothing about it
+                 (bad client request, client gone mid-relay).
+    """
+    _, headers = parse_head(head)
+    method = head.split(b" ", 1)[0].decode("latin-1")
+    try:
+        kind, length = body_framing(headers)
+    except HttpReadError as e:
+        dst.sendall(Response().build_error(e.status, e.reason))
+        return None
+
+    request = upstream_head(head)
+    replayable = kind == "length" and length <= REPLAY_LIMIT
+    if replayable:
+        try:
+            request += client.read_exact(length)
+        except (socket.error, HttpReadError):
+            dst.sendall(Response().build_error(400, "Bad Request"))
+            return None
+
+    for attempt in range(2):
+        try:
+            backend, reused = pool.acquire(host, port, fresh=attempt > 0)
+        except socket.error as e:
+            print("[Proxy] Cannot connect to {}:{}: {}".format(host, port, e))
+            dst.sendall(Response().build_error(502, "Bad Gateway"))
+            return False
+        backend.settimeout(UPSTREAM_TIMEOUT)
+        upstream = SocketReader(backend)
+
+        sink = _BackendSink(backend)
+        try:
+            sink.sendall(request)
+            if not replayable:
+                relay_body(client, sink, kind, length)
+        except _BackendError as e:
+            pool.discard(backend)
+            if reused and replayable:
+                continue
+            print("[Proxy] Request to {}:{} failed: {}".format(host, port, e))
+            dst.sendall(Response().build_error(502, "Bad Gateway"))
+            return False
+        except (socket.error, HttpReadError) as e:
+            # Slow, aborted or malformed upload: says nothing about the backend.
+            print("[Proxy] Client body for {}:{} not relayed: {}".format(host, port, e))
+            pool.discard(backend)
+            _client_error(dst, e)
+            return None
+
+        try:
+            response_head = upstream.read_head()
+        except socket.timeout:
+            pool.discard(backend)
+            dst.sendall(Response().build_error(504, "Gateway Timeout"))
+            return False
+        except (socket.error, HttpReadError) as e:
+            response_head = None
+        if response_head is None:
+            # Closed without answering: a stale keep-alive connection.
+            pool.discard(backend)
+            if reused and replayable:
+                continue
+            dst.sendall(Response().build_error(502, "Bad Gateway"))
+            return False
+
+        _, response_headers = parse_head(response_head)
+        status_line = response_head[:response_head.find(b"\r\n")]
+        try:
+            status = int(status_line.split(b" ", 2)[1])
+            response_kind, response_length = response_framing(status, response_headers, method)
+        except (IndexError, ValueError, HttpReadError):
+            pool.discard(backend)
+            dst.sendall(Response().build_error(502, "Bad Gateway"))
+            return False
+        reusable = response_keeps_alive(status_line, response_headers)
+
+        try:
+            # The client connection is closed afterwards, whatever the backend said.
+            dst.sendall(set_connection_header(response_head, False)[0])
+            relay_body(upstream, dst, response_kind, response_length)
+        except (socket.error, HttpReadError) as e:
+            # Part of the response may be out already: nothing left to answer.
+            print("[Proxy] Relay from {}:{} interrupted: {}".format(host, port, e))
+            pool.discard(backend)
+            return None
+
+        if reusable and not upstream.pending():
+            pool.release(host, port, backend)
+        else:
+            pool.discard(backend)
+        # An overloaded or broken backend answers with one of these itself.
+        return status not in UNHEALTHY_STATUSES
+
+    # Not reached: the retry uses a new connection, which never loops again.
+    dst.sendall(Response().build_error(502, "Bad Gateway"))
+    return False
+
+
+def forward_request(host, port, request, pool=UPSTREAMS):
     """
     Forwards an HTTP request to a backend server and retrieves the response.
 
     :params host (str): IP address of the backend server.
     :params port (int): port number of the backend server.
     :params request (str): incoming HTTP request.
+    :params pool (UpstreamPool): connection pool to use.
 
-    :rtype bytes: Raw HTTP response from the backend server. If the connection
-                  fails, returns a 404 Not Found response.
+    :rtype bytes: Raw HTTP response from the backend server. If the backend
+                  cannot be reached or answers badly, a 502 (or 504 on
+                  timeout) response.
     """
+    if isinstance(request, str):
+        request = request.encode()
+    client = SocketReader(None, initial=request)
+    head = client.read_head()
+    if head is None:
+        return Response().build_error(400, "Bad Request")
+    response = _Collector()
+    relay_request(host, port, head, client, response, pool)
+    return bytes(response.data)
+
+
+def session_key(head, addr):
+    """
+    Client affinity key of a request: its ``session`` cookie, or the client
+    IP address before login.
 
-    backend = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-
-    try:
-        backend.connect((host, port))
-        backend.sendall(request.encode())
-        response = b""
-        while True:
-            chunk = backend.recv(4096)
-            if not chunk:
-                break
-            response += chunk
-        return response
-    except socket.error as e:
-      print("Socket error: {}".format(e))
-      return (
-            "HTTP/1.1 404 Not Found\r\n"
-            "Content-Type: text/plain\r\n"
-            "Content-Length: 13\r\n"
-            "Connection: close\r\n"
-            "\r\n"
-            "404 Not Found"
-        ).encode('utf-8')
+    :params head (bytes): request line and headers.
+    :params addr (tuple): client address (IP, port).
+    """
+    for pair in parse_head(head)[1].get('cookie', '').split(';'):
+        name, sep, value = pair.partition('=')
+        if sep and name.strip() == 'session' and value.strip():
+            return value.strip()
+    return addr[0]
 
 
-def resolve_routing_policy(hostname, routes):
+def resolve_backend(hostname, routes, key=None):
     """
-    Handles an routing policy to return the matching proxy_pass.
+    Handles an routing policy to return the matching backend.
     It determines the target backend to forward the request to.
 
-    :params host (str): IP address of the request target server.
-    :params port (int): port number of the request target server.
+    :params hostname (str): Host header of the request.
     :params routes (dict): dictionary mapping hostnames and location.
+    :params key (str): client affinity key for ``consistent-hash``.
+
+    :rtype Backend: the chosen backend, or None for an empty proxy_pass list.
     """
+    proxy_map, policy = routes.get(hostname, DEFAULT_ROUTE)
+    if hostname not in routes:
+        # Unknown hosts share one balancer instead of one per Host value.
+        hostname = None
+    backend = get_balancer(hostname, proxy_map, policy).choose(key)
+    if backend is None:
+        print("[Proxy] Emtpy resolved routing of hostname {}".format(hostname))
+    return backend
 
-    print(hostname)
-    proxy_map, policy = routes.get(hostname,('127.0.0.1:9000','round-robin'))
-    print (proxy_map)
-    print (policy)
-
-    proxy_host = ''
-    proxy_port = '9000'
-    if isinstance(proxy_map, list):
-        if len(proxy_map) == 0:
-            print("[Proxy] Emtpy resolved routing of hostname {}".format(hostname))
-            print ("Empty proxy_map result")
-            # TODO: implement the error handling for non mapped host
-            #       the policy is design by team, but it can be 
-            #       basic default host in your self-defined system
-            # Use a dummy host to raise an invalid connection
-            proxy_host = '127.0.0.1'
-            proxy_port = '9000'
-        elif len(proxy_map) == 1:
-            proxy_host, proxy_port = proxy_map[0].split(":", 2)
-        #elif: # apply the policy handling 
-        #   proxy_map
-        #   policy
-        else:
-            if policy == 'round-robin':
-                proxy_host, proxy_port = resolve_routing_policy_roundrobin(hostname, routes)
-            # Out-of-handle mapped host
-            else: 
-                proxy_host = '127.0.0.1'
-                proxy_port = '9000'
-    else:
-        print("[Proxy] resolve route of hostname {} is a singulair to".format(hostname))
-        proxy_host, proxy_port = proxy_map.split(":", 2)
 
-    return proxy_host, proxy_port
+def resolve_routing_policy(hostname, routes, key=None):
+    """
+    Handles an routing policy to return the matching proxy_pass.
+
+    :params hostname (str): Host header of the request.
+    :params routes (dict): dictionary mapping hostnames and location.
+    :params key (str): client affinity key for ``consistent-hash``.
+
+    :rtype tuple: ``(host, port)`` of the chosen backend, ``('', 0)`` if none.
+    """
+    backend = resolve_backend(hostname, routes, key)
+    if backend is None:
+        return '', 0
+    return backend.host, backend.port
 
 def handle_client(ip, port, conn, addr, routes):
     """
@@ -142,14 +344,25 @@ def handle_client(ip, port, conn, addr, routes):
     :params routes (dict): dictionary mapping hostnames and location.
     """
 
-    request = conn.recv(1024).decode()
+    client = SocketReader(conn)
+    conn.settimeout(READ_TIMEOUT)
+    error = None
+    try:
+        head = client.read_head()
+    except socket.timeout:
+        head, error = None, HttpReadError(408, "Request Timeout")
+    except socket.error:
+        head = None
+    except HttpReadError as e:
+        head, error = None, e
+    if head is None:
+        if error is not None:
+            conn.sendall(Response().build_error(error.status, error.reason))
+        conn.close()
+        return
 
     # Extract hostname
-    for line in request.splitlines():
-        if line.lower().startswith('host:'):
-            hostname = line.split(':', 1)[1].strip()
-            break
-
+    hostname = parse_head(head)[1].get('host', '')
 
     if not hostname:
         print("[Proxy] ERROR: No Host header found")
@@ -168,17 +381,21 @@ def handle_client(ip, port, conn, addr, routes):
     
     print("[Proxy] {} at Host: {}".format(addr, hostname))
 
-    # Resolve the matching destination in routes and need conver port
-    # to integer value
-    resolved_host, resolved_port = resolve_routing_policy(hostname, routes)
-    try:
-        resolved_port = int(resolved_port)
-    except ValueError:
-        print("Not a valid integer")
-
-    if resolved_host:
-        print("[Proxy] Host name {} is forwarded to {}:{}".format(hostname,resolved_host, resolved_port))
-        response = forward_request(resolved_host, resolved_port, request)        
+    # Resolve the matching destination in routes; the session cookie
+    # keeps a client on one backend with the consistent-hash policy.
+    backend = resolve_backend(hostname, routes, session_key(head, addr))
+
+    if backend is not None:
+        print("[Proxy] Host name {} is forwarded to {}".format(hostname, backend.address))
+        try:
+            with backend.track():
+                ok = relay_request(backend.host, backend.port, head, client, conn)
+            if ok is not None:
+                backend.record(ok)
+        except socket.error as e:
+            print("[Proxy] Client {} went away: {}".format(addr, e))
+        conn.close()
+        return
     else:
         response = (
             "HTTP/1.1 404 Not Found\r\n"
@@ -191,29 +408,62 @@ def handle_client(ip, port, conn, addr, routes):
     conn.sendall(response)
     conn.close()
 
-def run_proxy(ip, port, routes):
+def run_proxy(ip, port, routes, pool_size=None, queue_size=QUEUE_SIZE,
+              health_path=HEALTH_PATH, health_interval=HEALTH_INTERVAL):
     """
     Starts the proxy server and listens for incoming connections. 
 
     The process dinds the proxy server to the specified IP and port.
     In each incomping connection, it accepts the connections and
     spawns a new thread for each client using `handle_client`.
+
+    With ``pool_size`` set, clients are handled by a fixed :class:`WorkerPool`
+    and connections that find ``queue_size`` others already waiting are
+    answered 503 with ``Retry-After``.
+
+    The backends of every host with several ``proxy_pass`` entries are
+    probed with ``GET health_path`` every ``health_interval`` seconds.
  
 
     :params ip (str): IP address to bind the proxy server.
     :params port (int): port number to listen on.
     :params routes (dict): dictionary mapping hostnames and location.
+    :params pool_size (int): worker threads, or None for one thread per client.
+    :params queue_size (int): connections allowed to wait for a worker.
+    :params health_path (str): path probed by the active health checks.
+    :params health_interval (float): seconds between probes, 0 disables them.
 
     """
 
     proxy = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
 
+    pool = None
+    if pool_size:
+        pool = WorkerPool("proxy", pool_size, queue_size)
+
+    for hostname, (proxy_map, policy) in routes.items():
+        get_balancer(hostname, proxy_map, policy)
+    checked = [balancer for balancer in balancers() if len(balancer.backends) > 1]
+    if health_interval and checked:
+        HealthChecker(checked, health_path, health_interval).start()
+        print("[Proxy] Health checking {} backends every {}s".format(
+            sum(len(balancer.backends) for balancer in checked), health_interval))
+
     try:
         proxy.bind((ip, port))
         proxy.listen(50)
         print("[Proxy] Listening on IP {} port {}".format(ip,port))
+        if pool is not None:
+            print("[Proxy] Worker pool of {} threads, queue {}".format(pool_size, queue_size))
         while True:
             conn, addr = proxy.accept()
+            if pool is not None:
+                if not pool.submit(handle_client, ip, port, conn, addr, routes):
+                    stats = pool.stats()
+                    print("[Proxy] Queue full, shedding {} ({} rejected so far)".format(
+                        addr, stats["rejected"]))
+                    reject_connection(conn)
+                continue
             #
             #  TODO: implement the step of the client incomping connection
             #        using multi-thread programming with the
@@ -228,44 +478,16 @@ def run_proxy(ip, port, routes):
     except socket.error as e:
       print("Socket error: {}".format(e))
 
-def create_proxy(ip, port, routes):
+def create_proxy(ip, port, routes, **options):
     """
     Entry point for launching the proxy server.
 
     :params ip (str): IP address to bind the proxy server.
     :params port (int): port number to listen on.
     :params routes (dict): dictionary mapping hostnames and location.
+    :params options: forwarded to :func:`run_proxy` (``pool_size``, ``queue_size``,
+                     ``health_path``, ``health_interval``).
     """
 
-    run_proxy(ip, port, routes)
-
+    run_proxy(ip, port, routes, **options)
 
-round_robin_counters = {}
-
-def resolve_routing_policy_roundrobin(hostname, routes):
-    global round_robin_counters
-    
-    proxy_map, policy = routes.get(hostname, ('127.0.0.1:9000', 'round-robin'))
-    
-    if isinstance(proxy_map, list) and len(proxy_map) > 1:
-        # Initialize counter cho hostname này
-        if hostname not in round_robin_counters:
-            round_robin_counters[hostname] = 0
-        
-        # Lấy index hiện tại
-        idx = round_robin_counters[hostname] % len(proxy_map)
-        
-        # Chọn backend
-        backend = proxy_map[idx]
-        
-        # Increment counter cho lần sau
-        round_robin_counters[hostname] += 1
-        
-        # Parse backend
-        proxy_host, proxy_port = backend.split(":", 1)
-        
-        return proxy_host, proxy_port
-    
-    # Single backend
-    proxy_host, proxy_port = proxy_map.split(":", 1)
-    return proxy_host, proxy_port
\ No newline at end of file
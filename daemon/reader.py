@@ -0,0 +1,254 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.reader
+~~~~~~~~~~~~~~~~~
+
+This module provides incremental HTTP/1.1 message framing. It finds the end of
+the header block, then delimits the body by ``Content-Length`` or decodes a
+``Transfer-Encoding: chunked`` body, while enforcing header/body size limits.
+
+The pure :func:`frame_message` works on any byte buffer (used by the event
+loop), and :func:`read_message` drives it from a blocking socket with a read
+deadline (used by the thread-per-connection adapter).
+
+:func:`response_framing` and :func:`response_keeps_alive` apply the response
+rules, for the proxy's pooled keep-alive connections to its backends.
+
+Usage Example:
+--------------
+>>> buf = bytearray()
+>>> head, body = read_message(conn, buf)
+"""
+
+import time
+import socket
+
+#: Largest accepted request line + header block, in bytes.
+MAX_HEADER_SIZE = 64 * 1024
+#: Largest accepted (decoded) body, in bytes.
+MAX_BODY_SIZE = 16 * 1024 * 1024
+#: Seconds allowed to receive one complete message.
+READ_TIMEOUT = 10.0
+
+#: Size of a single ``recv``.
+RECV_SIZE = 65536
+
+
+class HttpReadError(Exception):
+    """A message could not be read; ``status`` is the HTTP code to answer with."""
+
+    def __init__(self, status, reason):
+        Exception.__init__(self, "{} {}".format(status, reason))
+        self.status = status
+        self.reason = reason
+
+
+def parse_head(buf, max_header_size=MAX_HEADER_SIZE):
+    """
+    Locate and parse the header block at the start of ``buf``.
+
+    :param buf (bytes): received bytes.
+    :param max_header_size (int): limit for the header block.
+
+    :rtype tuple: ``(header_len, headers)`` with lower-cased header names, or
+                  ``None`` when the block is not complete yet.
+    :raises HttpReadError: 431 when the block exceeds ``max_header_size``.
+    """
+    end = buf.find(b"\r\n\r\n", 0, max_header_size + 4)
+    if end < 0:
+        if len(buf) > max_header_size:
+            raise HttpReadError(431, "Request Header Fields Too Large")
+        return None
+
+    headers = {}
+    for line in bytes(buf[:end]).split(b"\r\n")[1:]:
+        key, sep, val = line.partition(b":")
+        if sep:
+            headers[key.strip().lower().decode("latin-1")] = val.strip().decode("latin-1")
+    return end + 4, headers
+
+
+def body_framing(headers):
+    """
+    Decide how the body following ``headers`` is delimited.
+
+    :rtype tuple: ``("chunked", None)`` or ``("length", n)``.
+    :raises HttpReadError: 400 on an invalid ``Content-Length``.
+    """
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        return "chunked", None
+    try:
+        length = int(headers.get("content-length", "0") or 0)
+    except ValueError:
+        raise HttpReadError(400, "Bad Request")
+    if length < 0:
+        raise HttpReadError(400, "Bad Request")
+    return "length", length
+
+
+def decode_chunked(buf, start, max_body_size=MAX_BODY_SIZE):
+    """
+    Decode a chunked body that begins at offset ``start`` of ``buf``.
+
+    :rtype tuple: ``(body, end)`` where ``end`` is the offset just past the
+                  trailer, or ``None`` when more bytes are needed.
+    :raises HttpReadError: 400 on bad chunk sizes, 413 above ``max_body_size``.
+    """
+    body = bytearray()
+    pos = start
+    while True:
+        line_end = buf.find(b"\r\n", pos)
+        if line_end < 0:
+            return None
+        size_field = bytes(buf[pos:line_end]).split(b";", 1)[0].strip()
+        try:
+            size = int(size_field, 16)
+        except ValueError:
+            raise HttpReadError(400, "Bad Request")
+        pos = line_end + 2
+
+        if size == 0:
+            # Skip optional trailer fields up to the final empty line.
+            while True:
+                line_end = buf.find(b"\r\n", pos)
+                if line_end < 0:
+                    return None
+                if line_end == pos:
+                    return bytes(body), line_end + 2
+                pos = line_end + 2
+
+        if len(body) + size > max_body_size:
+            raise HttpReadError(413, "Payload Too Large")
+        if len(buf) < pos + size + 2:
+            return None
+        body += buf[pos:pos + size]
+        pos += size + 2
+
+
+def frame_message(buf, max_header_size=MAX_HEADER_SIZE, max_body_size=MAX_BODY_SIZE):
+    """
+    Extract the first complete message from ``buf`` without consuming it.
+
+    :param buf (bytes): received bytes, possibly holding several messages.
+
+    :rtype tuple: ``(head, body, consumed)`` where ``head`` includes the blank
+                  line and ``body`` is de-chunked, or ``None`` if incomplete.
+    :raises HttpReadError: on malformed or oversized messages.
+    """
+    parsed = parse_head(buf, max_header_size)
+    if parsed is None:
+        return None
+    header_len, headers = parsed
+    head = bytes(buf[:header_len])
+
+    kind, length = body_framing(headers)
+    if kind == "chunked":
+        decoded = decode_chunked(buf, header_len, max_body_size)
+        if decoded is None:
+            return None
+        body, end = decoded
+        return head, body, end
+
+    if length > max_body_size:
+        raise HttpReadError(413, "Payload Too Large")
+    end = header_len + length
+    if len(buf) < end:
+        return None
+    return head, bytes(buf[header_len:end]), end
+
+
+def read_message(conn, buf, max_header_size=MAX_HEADER_SIZE,
+                 max_body_size=MAX_BODY_SIZE, timeout=READ_TIMEOUT, idle_timeout=None):
+    """
+    Read one complete message from a blocking socket.
+
+    Bytes are appended to ``buf`` as they arrive, and whatever follows the
+    message (e.g. a pipelined request) is left in ``buf`` for the next call.
+
+    :param conn (socket.socket): connected socket.
+    :param buf (bytearray): carry-over buffer of the connection.
+    :param timeout (float): seconds allowed for the whole message.
+    :param idle_timeout (float): when ``buf`` is empty, seconds to wait for
+                                 the first byte before giving up quietly
+                                 (keep-alive idle time). Defaults to ``timeout``.
+
+    :rtype tuple: ``(head, body)``, or ``None`` if the peer closed the
+                  connection (or stayed idle) before sending anything.
+    :raises HttpReadError: 408 on timeout, 400 on a truncated message, or the
+                           errors of :func:`frame_message`.
+    """
+    if not buf and idle_timeout is not None:
+        conn.settimeout(idle_timeout)
+        try:
+            chunk = conn.recv(RECV_SIZE)
+        except socket.timeout:
+            return None
+        if not chunk:
+            return None
+        buf += chunk
+
+    deadline = time.monotonic() + timeout
+    while True:
+        framed = frame_message(buf, max_header_size, max_body_size)
+        if framed is not None:
+            head, body, consumed = framed
+            del buf[:consumed]
+            return head, body
+
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise HttpReadError(408, "Request Timeout")
+        conn.settimeout(remaining)
+        try:
+            chunk = conn.recv(RECV_SIZE)
+        except socket.timeout:
+            raise HttpReadError(408, "Request Timeout")
+
+        if not chunk:
+            if not buf:
+                return None
+            raise HttpReadError(400, "Bad Request")
+        buf += chunk
+
+
+def response_framing(status, headers, request_method="GET"):
+    """
+    Decide how the body of a response is delimited (RFC 7230 section 3.3.3).
+
+    :param status (int): response status code.
+    :param headers (dict): lower-cased response headers.
+    :param request_method (str): method of the request being answered.
+
+    :rtype tuple: ``("none", 0)``, ``("chunked", None)``, ``("length", n)``
+                  or ``("close", None)`` for a body delimited by EOF.
+    """
+    if request_method == "HEAD" or 100 <= status < 200 or status in (204, 304):
+        return "none", 0
+    if "chunked" in headers.get("transfer-encoding", "").lower():
+        return "chunked", None
+    if "content-length" in headers:
+        return body_framing(headers)
+    return "close", None
+
+
+def response_keeps_alive(status_line, headers):
+    """
+    :rtype bool: whether the server keeps the connection open after the
+                 response described by ``status_line`` and ``headers``.
+    """
+    connection = headers.get("connection", "").lower()
+    if status_line.startswith(b"HTTP/1.1"):
+        return "close" not in connection
+    return "keep-alive" in connection
+
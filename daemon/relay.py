@@ -0,0 +1,179 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.relay
+~~~~~~~~~~~~~~~~~
+
+This module provides the streaming primitives of the proxy. A
+:class:`SocketReader` reads a socket into one fixed ``bytearray`` through
+``recv_into`` and hands slices of it out as ``memoryview`` objects, so a
+message body is copied from one socket to the other as it arrives and a
+relay uses constant memory whatever the size of the payload.
+
+Usage Example:
+--------------
+>>> reader = SocketReader(client_sock)
+>>> head = reader.read_head()
+>>> relay_body(reader, backend_sock, "length", 1048576)
+"""
+
+from .reader import HttpReadError
+
+#: Size of the buffer of a :class:`SocketReader`; a header block must fit.
+BUFFER_SIZE = 64 * 1024
+
+#: Longest accepted chunk-size or trailer line of a chunked body.
+MAX_LINE = 4096
+
+
+class SocketReader:
+    """
+    Buffered reader over a blocking socket, built on one reusable buffer.
+
+    :attrs sock (socket.socket): the socket read from, or None when the
+                                 reader only serves ``initial`` bytes.
+    """
+
+    def __init__(self, sock, size=BUFFER_SIZE, initial=b""):
+        self.sock = sock
+        self.buf = bytearray(max(size, len(initial)))
+        self.view = memoryview(self.buf)
+        self.buf[:len(initial)] = initial
+        self.start = 0
+        self.end = len(initial)
+
+    def pending(self):
+        """:rtype int: bytes buffered but not consumed yet."""
+        return self.end - self.start
+
+    def fill(self):
+        """
+        Receive more bytes after the pending ones.
+
+        :rtype int: number of bytes received, 0 at end of stream.
+        :raises HttpReadError: 431 when the buffer is full of pending bytes.
+        """
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif self.end == len(self.buf):
+            pending = self.end - self.start
+            if pending == len(self.buf):
+                raise HttpReadError(431, "Request Header Fields Too Large")
+            self.buf[:pending] = self.view[self.start:self.end]
+            self.start, self.end = 0, pending
+        if self.sock is None:
+            return 0
+        received = self.sock.recv_into(self.view[self.end:])
+        self.end += received
+        return received
+
+    def _read_until(self, delimiter, limit):
+        while True:
+            found = self.buf.find(delimiter, self.start, self.end)
+            if found >= 0:
+                found += len(delimiter)
+                data = bytes(self.view[self.start:found])
+                self.start = found
+                return data
+            if self.pending() > limit:
+                raise HttpReadError(431, "Request Header Fields Too Large")
+            if not self.fill():
+                if not self.pending():
+                    return None
+                raise HttpReadError(400, "Bad Request")
+
+    def read_head(self):
+        """
+        Read a header block, up to and including its blank line.
+
+        :rtype bytes: the header block, or None if the peer closed the
+                      connection before sending anything.
+        """
+        return self._read_until(b"\r\n\r\n", len(self.buf))
+
+    def read_line(self):
+        """:rtype bytes: one CRLF terminated line, or None at end of stream."""
+        return self._read_until(b"\r\n", MAX_LINE)
+
+    def read_exact(self, size):
+        """:rtype bytes: exactly ``size`` bytes (for small bodies)."""
+        data = bytearray()
+        while len(data) < size:
+            if not self.pending() and not self.fill():
+                raise HttpReadError(400, "Bad Request")
+            take = min(size - len(data), self.pending())
+            data += self.view[self.start:self.start + take]
+            self.start += take
+        return bytes(data)
+
+    def copy(self, dst, size):
+        """
+        Send the next ``size`` bytes to ``dst`` as they arrive.
+
+        :raises HttpReadError: 502 if the stream ends early.
+        """
+        while size > 0:
+            if not self.pending() and not self.fill():
+                raise HttpReadError(502, "Bad Gateway")
+            take = min(size, self.pending())
+            dst.sendall(self.view[self.start:self.start + take])
+            self.start += take
+            size -= take
+
+    def copy_until_eof(self, dst):
+        """Send everything up to the end of the stream to ``dst``."""
+        while True:
+            if self.pending():
+                dst.sendall(self.view[self.start:self.end])
+                self.start = self.end
+            if not self.fill():
+                return
+
+    def copy_chunked(self, dst):
+        """Send a chunked body, chunk headers and trailer included, to ``dst``."""
+        while True:
+            line = self.read_line()
+            if line is None:
+                raise HttpReadError(502, "Bad Gateway")
+            dst.sendall(line)
+            try:
+                size = int(line.split(b";", 1)[0].strip(), 16)
+            except ValueError:
+                raise HttpReadError(400, "Bad Request")
+            if size == 0:
+                while True:
+                    line = self.read_line()
+                    if line is None:
+                        raise HttpReadError(502, "Bad Gateway")
+                    dst.sendall(line)
+                    if line == b"\r\n":
+                        return
+            self.copy(dst, size + 2)
+
+
+def relay_body(reader, dst, kind, length=None):
+    """
+    Stream a message body from ``reader`` to ``dst``.
+
+    :param reader (SocketReader): source, positioned at the start of the body.
+    :param dst (socket.socket): destination, anything with ``sendall``.
+    :param kind (str): framing from :func:`body_framing <daemon.reader.body_framing>`
+                       or :func:`response_framing <daemon.reader.response_framing>`.
+    :param length (int): body length for the ``length`` framing.
+    """
+    if kind == "length":
+        reader.copy(dst, length)
+    elif kind == "chunked":
+        reader.copy_chunked(dst)
+    elif kind == "close":
+        reader.copy_until_eof(dst)
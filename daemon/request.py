@@ -17,6 +17,7 @@ daemon.request
 This module provides a Request object to manage and persist 
 request settings (cookies, auth, proxies).
 """
+from urllib.parse import parse_qsl
 from .dictionary import CaseInsensitiveDict
 
 class Request():
@@ -44,6 +45,7 @@ class Request():
         "reason",
         "cookies",
         "body",
+        "query",
         "routes",
         "hook",
     ]
@@ -57,6 +59,8 @@ class Request():
         self.headers = None
         #: HTTP path
         self.path = None        
+        #: query string parameters, e.g. ``{"version": "12"}``.
+        self.query = {}
         # The cookies set used to create Cookie header
         self.cookies = None
         #: request body to send to the server.
@@ -101,6 +105,10 @@ class Request():
 
         # Prepare the request line from the request header
         self.method, self.path, self.version = self.extract_request_line(request)
+        # Routes are matched on the path alone; "?a=1&b=2" goes to self.query
+        if self.path and '?' in self.path:
+            self.path, query_string = self.path.split('?', 1)
+            self.query = dict(parse_qsl(query_string))
         print("[Request] {} path {} version {}".format(self.method, self.path, self.version))
 
         #
@@ -268,6 +268,7 @@ class Response():
             200: "OK",
             201: "Created",
             204: "No Content",
+            304: "Not Modified",
             400: "Bad Request",
             401: "Unauthorized",
             403: "Forbidden",
@@ -377,4 +378,121 @@ class Response():
             "\r\n"
             "{}"
         ).format(len(body), body)
-        return response_str.encode('utf-8')
\ No newline at end of file
+        return response_str.encode('utf-8')
+
+    def build_error(self, status_code, reason):
+        """
+        Constructs a plain error response for the given status.
+
+        :params status_code (int): HTTP status code, e.g. 400 or 413.
+        :params reason (str): reason phrase, e.g. "Bad Request".
+
+        :rtype bytes: Encoded error response.
+        """
+        body = "{} {}".format(status_code, reason)
+        response_str = (
+            "HTTP/1.1 {} {}\r\n"
+            "Content-Type: text/html\r\n"
+            "Content-Length: {}\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+            "{}"
+        ).format(status_code, reason, len(body), body)
+        return response_str.encode('utf-8')
+
+
+    def build_not_modified(self, etag, headers=None):
+        """
+        Constructs a 304 Not Modified response for a conditional request
+        whose ``If-None-Match`` matched the current representation.
+
+        :params etag (str): entity tag of the current representation.
+        :params headers (dict): extra headers, e.g. ones the client tracks
+                                on every response.
+
+        :rtype bytes: Encoded 304 response, without a body.
+        """
+        extra = "".join("{}: {}\r\n".format(name, value)
+                        for name, value in (headers or {}).items())
+        response_str = (
+            "HTTP/1.1 304 Not Modified\r\n"
+            "ETag: {}\r\n"
+            "Cache-Control: no-cache\r\n"
+            "{}"
+            "\r\n"
+        ).format(etag, extra)
+        return response_str.encode('utf-8')
+
+
+    def build_unavailable(self, retry_after=1):
+        """
+        Constructs a 503 Service Unavailable response used to shed load.
+
+        :params retry_after (int): seconds the client should wait, sent as
+                                   ``Retry-After``.
+
+        :rtype bytes: Encoded 503 response.
+        """
+        body = "503 Service Unavailable"
+        response_str = (
+            "HTTP/1.1 503 Service Unavailable\r\n"
+            "Content-Type: text/html\r\n"
+            "Content-Length: {}\r\n"
+            "Retry-After: {}\r\n"
+            "Connection: close\r\n"
+            "\r\n"
+            "{}"
+        ).format(len(body), retry_after, body)
+        return response_str.encode('utf-8')
+
+def set_connection_header(response, keep_alive, timeout=None, max_requests=None):
+    """
+    Rewrites the ``Connection`` header of a complete response.
+
+    Route hooks build their own response bytes, often with a hard-coded
+    ``Connection: close``; the adapter uses this to state the connection
+    policy it actually applies. A response whose body length cannot be
+    determined (no ``Content-Length``, not chunked) always closes.
+
+    :params response (bytes): full response, header block and body.
+    :params keep_alive (bool): whether the connection should stay open.
+    :params timeout (int): idle timeout advertised in ``Keep-Alive``.
+    :params max_requests (int): requests left, advertised in ``Keep-Alive``.
+
+    :rtype tuple: (bytes, bool) the rewritten response and the effective
+                  keep-alive decision.
+    """
+    end = response.find(b"\r\n\r\n")
+    if end < 0:
+        return response, False
+
+    lines = response[:end].split(b"\r\n")
+    status_line, fields = lines[0], []
+    framed = False
+    for line in lines[1:]:
+        name = line.split(b":", 1)[0].strip().lower()
+        if name in (b"connection", b"keep-alive"):
+            continue
+        if name == b"content-length" or (name == b"transfer-encoding" and b"chunked" in line.lower()):
+            framed = True
+        fields.append(line)
+
+    status = status_line.split(b" ", 2)[1:2]
+    if status and status[0] in (b"204", b"304"):
+        framed = True
+    keep_alive = keep_alive and framed
+
+    if keep_alive:
+        fields.append(b"Connection: keep-alive")
+        params = []
+        if timeout is not None:
+            params.append("timeout={}".format(int(timeout)))
+        if max_requests is not None:
+            params.append("max={}".format(max_requests))
+        if params:
+            fields.append("Keep-Alive: {}".format(", ".join(params)).encode("ascii"))
+    else:
+        fields.append(b"Connection: close")
+
+    head = b"\r\n".join([status_line] + fields)
+    return head + response[end:], keep_alive
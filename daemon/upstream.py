@@ -0,0 +1,165 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.upstream
+~~~~~~~~~~~~~~~~~
+
+This module provides a pool of persistent connections from the proxy to its
+backends. Idle sockets are kept per upstream ``(host, port)`` so consecutive
+requests skip the TCP handshake and reuse the backend's HTTP/1.1 keep-alive.
+
+Notes:
+------
+- At most ``max_idle`` sockets are kept per upstream; extra ones are closed.
+- Sockets idle for longer than ``idle_timeout`` are evicted. The default is
+  below the backend's own keep-alive timeout so the pool closes first.
+- A pooled socket is checked before reuse: if the backend closed it or sent
+  unsolicited bytes it is discarded instead of handed out.
+
+Usage Example:
+--------------
+>>> pool = UpstreamPool()
+>>> sock, reused = pool.acquire("127.0.0.1", 9000)
+>>> pool.release("127.0.0.1", 9000, sock)
+"""
+
+import time
+import socket
+import threading
+import collections
+
+#: Idle sockets kept per upstream.
+MAX_IDLE = 16
+#: Seconds an idle socket may stay in the pool.
+IDLE_TIMEOUT = 4.0
+#: Seconds allowed to open a new upstream connection.
+CONNECT_TIMEOUT = 3.0
+
+
+class UpstreamPool:
+    """
+    Thread-safe keep-alive connection pool keyed by ``(host, port)``.
+
+    :attrs max_idle (int): idle sockets kept per upstream.
+    :attrs idle_timeout (float): seconds before an idle socket is evicted.
+    :attrs connect_timeout (float): timeout of a new connection.
+    """
+
+    def __init__(self, max_idle=MAX_IDLE, idle_timeout=IDLE_TIMEOUT,
+                 connect_timeout=CONNECT_TIMEOUT):
+        self.max_idle = max_idle
+        self.idle_timeout = idle_timeout
+        self.connect_timeout = connect_timeout
+        #: (host, port) -> deque of (socket, idle since), most recent last.
+        self._idle = collections.defaultdict(collections.deque)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._reused = 0
+        self._discarded = 0
+
+    def acquire(self, host, port, fresh=False):
+        """
+        Take a connection to ``(host, port)``, reusing an idle one if possible.
+
+        :params fresh (bool): always open a new connection, e.g. to retry a
+                              request that failed on a reused one.
+
+        :rtype tuple: ``(socket, reused)``.
+        :raises socket.error: when a new connection cannot be opened.
+        """
+        key = (host, port)
+        while not fresh:
+            with self._lock:
+                idle = self._idle[key]
+                if not idle:
+                    break
+                sock, since = idle.pop()
+            if time.monotonic() - since > self.idle_timeout or not self._usable(sock):
+                self.discard(sock)
+                continue
+            with self._lock:
+                self._reused += 1
+            return sock, True
+
+        sock = socket.create_connection(key, timeout=self.connect_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._lock:
+            self._created += 1
+        return sock, False
+
+    def release(self, host, port, sock):
+        """Return a healthy connection whose last response was fully read."""
+        now = time.monotonic()
+        evicted = []
+        with self._lock:
+            idle = self._idle[(host, port)]
+            while idle and now - idle[0][1] > self.idle_timeout:
+                evicted.append(idle.popleft()[0])
+            if len(idle) < self.max_idle:
+                idle.append((sock, now))
+                sock = None
+        if sock is not None:
+            evicted.append(sock)
+        for stale in evicted:
+            self.discard(stale)
+
+    def discard(self, sock):
+        """Close a connection that must not be reused."""
+        with self._lock:
+            self._discarded += 1
+        try:
+            sock.close()
+        except socket.error:
+            pass
+
+    def _usable(self, sock):
+        """
+        A pooled socket must have nothing to read: EOF means the backend
+        closed it, data means it is out of sync with the request/response
+        sequence.
+        """
+        try:
+            sock.setblocking(False)
+            try:
+                sock.recv(1, socket.MSG_PEEK)
+            finally:
+                sock.setblocking(True)
+        except (BlockingIOError, InterruptedError):
+            return True
+        except socket.error:
+            return False
+        return False
+
+    def stats(self):
+        """
+        Snapshot of the pool counters.
+
+        :rtype dict: ``idle`` sockets per upstream, ``created``, ``reused``,
+                     ``discarded``.
+        """
+        with self._lock:
+            return {
+                "idle": {"{}:{}".format(*key): len(idle)
+                         for key, idle in self._idle.items() if idle},
+                "created": self._created,
+                "reused": self._reused,
+                "discarded": self._discarded,
+            }
+
+    def close(self):
+        """Close every idle connection."""
+        with self._lock:
+            socks = [sock for idle in self._idle.values() for sock, _ in idle]
+            self._idle.clear()
+        for sock in socks:
+            sock.close()
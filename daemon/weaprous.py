@@ -50,6 +50,9 @@ class WeApRous:
         Sets up an empty route registry and prepares placeholders for IP and port.
         """
         self.routes = {}
+        self.teardown_funcs = []
+        self.stop_funcs = []
+        self.shutdown_funcs = []
         self.ip = None
         self.port = None
         return
@@ -74,8 +77,17 @@ class WeApRous:
         :rtype: function - A decorator that registers the handler function.
         """
         def decorator(func):
+            def hook(*args, **kwargs):
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    for teardown in self.teardown_funcs:
+                        teardown()
+
+            hook.__name__ = func.__name__
+            hook.__doc__ = func.__doc__
             for method in methods:
-                self.routes[(method.upper(), path)] = func
+                self.routes[(method.upper(), path)] = hook
 
             # Optional attach route metadata to the function
             func._route_path = path
@@ -84,18 +96,79 @@ class WeApRous:
             return func
         return decorator
 
-    def run(self):
+    def teardown_request(self, func):
+        """
+        Decorator to register a function called without arguments after
+        every route handler, even when the handler raised. Used to release
+        per-request resources such as database transactions.
+
+        :param func (function): the teardown function.
+
+        :rtype: function - ``func`` itself.
+        """
+        self.teardown_funcs.append(func)
+        return func
+
+    def on_stop(self, func):
+        """
+        Decorator to register a function called without arguments as soon
+        as a pre-forked worker receives SIGTERM, before the requests in
+        flight are drained. Used to answer long-polls early, so that the
+        drain ends well within the grace period.
+
+        :param func (function): the stop function.
+
+        :rtype: function - ``func`` itself.
+        """
+        self.stop_funcs.append(func)
+        return func
+
+    def _stop(self):
+        for func in self.stop_funcs:
+            try:
+                func()
+            except Exception as e:
+                print("[WeApRous] Stop function {} failed: {}".format(func.__name__, e))
+
+    def on_shutdown(self, func):
+        """
+        Decorator to register a function called without arguments when a
+        serving process stops (Ctrl-C, or SIGTERM to a pre-forked worker),
+        after the requests in flight have been answered. Used to flush
+        buffered writes.
+
+        :param func (function): the shutdown function.
+
+        :rtype: function - ``func`` itself.
+        """
+        self.shutdown_funcs.append(func)
+        return func
+
+    def _shutdown(self):
+        for func in self.shutdown_funcs:
+            try:
+                func()
+            except Exception as e:
+                print("[WeApRous] Shutdown function {} failed: {}".format(func.__name__, e))
+
+    def run(self, **options):
         """
         Start the backend server and begin handling requests.
 
         This method launches the TCP server using the configured IP and port,
         and dispatches incoming requests to the registered route handlers.
 
+        :param options: serving options passed to :func:`create_backend`, e.g.
+                        ``mode="eventloop"``, ``backlog=1024``, ``threads=16``,
+                        ``workers=4`` (processes),
+                        ``max_body_size=1 << 20``, ``read_timeout=5``.
+
         :raise: Error if IP or port has not been configured.
         """
         if not self.ip or not self.port:
             print("Rous app need to preapre address"
                   "by calling app.prepare_address(ip,port)")
         
-        create_backend(self.ip, self.port, self.routes)
+        create_backend(self.ip, self.port, self.routes, on_stop=self._stop,
+                       on_shutdown=self._shutdown, **options)
         
@@ -0,0 +1,154 @@
+#
+# Copyright (C) 2025 pdnguyen of HCMC University of Technology VNU-HCM.
+# All rights reserved.
+# This file is part of the CO3093/CO3094 course.
+#
+# WeApRous release
+#
+# The authors hereby grant to Licensee personal permission to use
+# and modify the Licensed Source Code for the sole purpose of studying
+# while attending the course
+#
+
+"""
+daemon.workerpool
+~~~~~~~~~~~~~~~~~
+
+This module provides a fixed-size pool of worker threads fed by a bounded
+queue. It gives the backend and the proxy back-pressure: when every worker is
+busy and the queue is full, :meth:`WorkerPool.submit` refuses the job at once
+so the caller can answer ``503 Service Unavailable`` instead of spawning yet
+another thread.
+
+Every pool registers itself by name, and :func:`pool_stats` returns the
+counters of all pools in the process (size, queue depth, active workers,
+submitted/completed/rejected/failed jobs) for sizing deployments.
+
+Usage Example:
+--------------
+>>> pool = WorkerPool("backend", size=32, queue_size=128)
+>>> if not pool.submit(handle_client, conn, addr):
+...     conn.sendall(Response().build_unavailable())
+"""
+
+import queue
+import threading
+
+#: Default number of worker threads.
+POOL_SIZE = 32
+#: Default number of jobs waiting for a worker.
+QUEUE_SIZE = 128
+
+#: All pools of the process, by name.
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+
+class WorkerPool:
+    """
+    A fixed set of daemon threads consuming jobs from a bounded queue.
+
+    :attrs name (str): name of the pool, used for threads and statistics.
+    :attrs size (int): number of worker threads.
+    :attrs queue_size (int): capacity of the waiting queue.
+    """
+
+    def __init__(self, name, size=POOL_SIZE, queue_size=QUEUE_SIZE):
+        if size < 1:
+            raise ValueError("WorkerPool size must be at least 1")
+        if queue_size < 1:
+            # queue.Queue treats 0 as unbounded, which defeats the purpose.
+            raise ValueError("WorkerPool queue_size must be at least 1")
+        self.name = name
+        self.size = size
+        self.queue_size = queue_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._active = 0
+        self._submitted = 0
+        self._completed = 0
+        self._rejected = 0
+        self._failed = 0
+
+        self._threads = []
+        for i in range(size):
+            worker = threading.Thread(target=self._run, name="{}-{}".format(name, i))
+            worker.daemon = True
+            worker.start()
+            self._threads.append(worker)
+
+        with _POOLS_LOCK:
+            _POOLS[name] = self
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue ``fn(*args, **kwargs)`` for a worker, without blocking.
+
+        :rtype bool: False when the queue is full and the job was rejected.
+        """
+        try:
+            self._queue.put_nowait((fn, args, kwargs))
+        except queue.Full:
+            with self._lock:
+                self._rejected += 1
+            return False
+        with self._lock:
+            self._submitted += 1
+        return True
+
+    def _run(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            fn, args, kwargs = job
+            with self._lock:
+                self._active += 1
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                print("[WorkerPool] {} job failed: {}".format(self.name, e))
+                with self._lock:
+                    self._failed += 1
+            finally:
+                with self._lock:
+                    self._active -= 1
+                    self._completed += 1
+
+    def stats(self):
+        """
+        Snapshot of the pool counters.
+
+        :rtype dict: ``size``, ``queue_capacity``, ``queue_depth``, ``active``,
+                     ``submitted``, ``completed``, ``rejected``, ``failed``.
+        """
+        with self._lock:
+            return {
+                "size": self.size,
+                "queue_capacity": self.queue_size,
+                "queue_depth": self._queue.qsize(),
+                "active": self._active,
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "rejected": self._rejected,
+                "failed": self._failed,
+            }
+
+    def shutdown(self):
+        """Stop the workers once the jobs already queued are done."""
+        for _ in self._threads:
+            self._queue.put(None)
+        with _POOLS_LOCK:
+            if _POOLS.get(self.name) is self:
+                del _POOLS[self.name]
+
+
+def pool_stats():
+    """
+    Counters of every pool in the process.
+
+    :rtype dict: pool name -> :meth:`WorkerPool.stats`.
+    """
+    with _POOLS_LOCK:
+        pools = list(_POOLS.values())
+    return {pool.name: pool.stats() for pool in pools}
@@ -39,11 +39,18 @@ CREATE TABLE IF NOT EXISTS peers (
     ip TEXT NOT NULL,
     port INTEGER NOT NULL,
     username TEXT NOT NULL, 
+    lease_expires REAL,
     PRIMARY KEY (ip, port) 
 )
 ''')
 print("✓ Tạo bảng 'peers'...")
 
+# Index cho reaper tìm các session hết lease
+cursor.execute('''
+CREATE INDEX IF NOT EXISTS idx_peers_lease 
+ON peers(lease_expires)
+''')
+
 # Bảng 3: Channels WITH ACCESS CONTROL
 cursor.execute('''
 CREATE TABLE IF NOT EXISTS channels (
@@ -113,6 +120,29 @@ CREATE TABLE IF NOT EXISTS direct_messages (
 ''')
 print("✓ Tạo bảng 'direct_messages'...")
 
+# Bảng 6: Presence log (thay đổi của bảng peers, cho /presence/)
+cursor.execute('''
+CREATE TABLE IF NOT EXISTS presence_log (
+    version INTEGER PRIMARY KEY AUTOINCREMENT,
+    op TEXT NOT NULL,
+    username TEXT NOT NULL,
+    ip TEXT NOT NULL,
+    port INTEGER NOT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+)
+''')
+print("✓ Tạo bảng 'presence_log'...")
+
+# Bảng 7: ACL version (tăng mỗi khi quyền channel thay đổi)
+cursor.execute('''
+CREATE TABLE IF NOT EXISTS acl_version (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    version INTEGER NOT NULL
+)
+''')
+cursor.execute("INSERT OR IGNORE INTO acl_version (id, version) VALUES (1, 0)")
+print("✓ Tạo bảng 'acl_version'...")
+
 # Index để tìm kiếm DM nhanh hơn
 cursor.execute('''
 CREATE INDEX IF NOT EXISTS idx_dm_users 
@@ -120,6 +150,13 @@ ON direct_messages(sender_id, receiver_id)
 ''')
 print("✓ Tạo index cho direct_messages...")
 
+# Index cho phân trang history theo channel (keyset trên id)
+cursor.execute('''
+CREATE INDEX IF NOT EXISTS idx_messages_channel 
+ON messages(channel_id, id)
+''')
+print("✓ Tạo index cho messages (channel_id, id)...")
+
 # Index cho channel members
 cursor.execute('''
 CREATE INDEX IF NOT EXISTS idx_channel_members 
@@ -140,6 +177,8 @@ print("  • channels: Chat channels (public/private)")
 print("  • channel_members: Access control for private channels")
 print("  • messages: Channel message history")
 print("  • direct_messages: DM history")
+print("  • presence_log: Peer join/leave versions")
+print("  • acl_version: Channel permission version")
 print("=" * 70)
 print("🔒 ACCESS CONTROL:")
 print("  • Public channels: Everyone can join")
@@ -8,6 +8,7 @@ from daemon.weaprous import WeApRous
 import urllib.parse
 import time # Thêm time
 from daemon.response import Response
+from daemon.fanout import PeerDispatcher, sessions_of
 
 # --- Cấu hình ---
 TRACKER_HOST = '127.0.0.1'
@@ -24,6 +25,7 @@ my_real_ip = "127.0.0.1" # Sẽ được cập nhật
 peer_list = {} # THAY ĐỔI: Dùng dictionary để map username -> (ip, port)
 lock = threading.Lock()
 app = WeApRous()
+dispatcher = PeerDispatcher() # Gửi P2P song song, giữ kết nối keep-alive
 
 # --- 1. P2P API Endpoint (Server của Peer) ---
 
@@ -67,7 +69,7 @@ def get_my_ip():
     finally: s.close()
     return IP
 
-def http_request(method, host, port, path, body_bytes=None, headers=None, cookie_str=None):
+def http_request(method, host, port, path, body_bytes=None, headers=None, cookie_str=None, verbose=True):
     # ... (Hàm này giữ nguyên, nó đã hỗ trợ cookie) ...
     try:
         conn = httplib.HTTPConnection(host, port, timeout=5)
@@ -81,7 +83,8 @@ def http_request(method, host, port, path, body_bytes=None, headers=None, cookie
         set_cookie_header = response.getheader('Set-Cookie')
         conn.close()
         
-        print(f"[HTTP Client] {method} {host}:{port}{path} - Status: {response.status}")
+        if verbose:
+            print(f"[HTTP Client] {method} {host}:{port}{path} - Status: {response.status}")
         return data, response.status, set_cookie_header
     except Exception as e:
         print(f"[HTTP Client] Lỗi khi kết nối {host}:{port}. Lỗi: {e}")
@@ -120,6 +123,7 @@ def perform_login():
 def perform_logout():
     """(Task 2) Gọi POST /logout/ để xóa peer khỏi Tracker DB."""
     print(f"[Tracker] Đang hủy đăng ký (logout)...")
+    heartbeat_stop.set()
     
     # --- THAY ĐỔI: Gửi kèm ip/port trong body ---
     payload = {"ip": my_real_ip, "port": MY_PORT}
@@ -152,6 +156,19 @@ def register_with_tracker():
     data, status, _ = http_request("POST", TRACKER_HOST, TRACKER_PORT, "/submit-info/", body_bytes=body_bytes, headers=headers, cookie_str=auth_cookie)
     if status == 200: print("[Tracker] Đăng ký thành công.")
     else: print(f"[Tracker] Đăng ký thất bại. (Status: {status})")
+    return json.loads(data.decode('utf-8')).get('lease') if status == 200 else None
+
+heartbeat_stop = threading.Event()
+
+def heartbeat_loop(lease):
+    """Gia hạn lease trên Tracker mỗi lease/3 giây (POST /heartbeat/)."""
+    body_bytes = json.dumps({"ip": my_real_ip, "port": MY_PORT}).encode('utf-8')
+    headers = {"Content-type": "application/json"}
+    while not heartbeat_stop.wait(max(1.0, lease / 3.0)):
+        data, status, _ = http_request("POST", TRACKER_HOST, TRACKER_PORT, "/heartbeat/", body_bytes=body_bytes,
+                                       headers=headers, cookie_str=auth_cookie, verbose=False)
+        if status == 404 and not heartbeat_stop.is_set():
+            register_with_tracker() # Lease đã hết: đăng ký lại
 
 # (trong peer_client.py)
 from collections import defaultdict # <-- Thêm import này ở đầu file
@@ -203,17 +220,17 @@ def broadcast_message(message, channel="general"):
     
     print(f"[Broadcast] Đang gửi P2P...")
     
-    # --- THAY ĐỔI: Thêm vòng lặp bên trong ---
-    total_sessions = 0
-    for username, ip_port_list in current_peers_dict.items():
-        # ip_port_list là một list, ví dụ: [('1.1.1.1', 9001), ('1.1.1.1', 9002)]
-        print(f" -> Gửi cho '{username}' (có {len(ip_port_list)} session)")
-        for (peer_ip, peer_port) in ip_port_list:
-            http_request("POST", peer_ip, peer_port, "/send-peer", body_bytes=body_bytes, headers=headers)
-            total_sessions += 1
-    # --- HẾT THAY ĐỔI ---
+    # Gửi song song tới mọi session, in kết quả theo thứ tự hoàn thành
+    sessions = sessions_of(current_peers_dict)
+    delivered = 0
+    for result in dispatcher.fan_out(sessions, "/send-peer", body_bytes, headers):
+        if result.ok:
+            delivered += 1
+            print(f" -> '{result.username}' ({result.address}): OK")
+        else:
+            print(f" -> '{result.username}' ({result.address}): lỗi {result.status or result.error}")
 
-    print(f"[Broadcast] Đã gửi P2P tới {len(current_peers_dict)} user / {total_sessions} session.")
+    print(f"[Broadcast] Đã gửi P2P tới {len(current_peers_dict)} user / {delivered}/{len(sessions)} session.")
     
     # 2. Gửi cho Server để LƯU LỊCH SỬ (Giữ nguyên)
     log_payload = {"channel_name": channel, "content": message}
@@ -313,8 +330,10 @@ if __name__ == "__main__":
     
     time.sleep(0.5) # Chờ server P2P khởi động
     
-    # 2. Đăng ký với Tracker
-    register_with_tracker()
+    # 2. Đăng ký với Tracker (và giữ lease bằng heartbeat)
+    lease = register_with_tracker()
+    if lease:
+        threading.Thread(target=heartbeat_loop, args=(lease,), daemon=True).start()
     
     # 3. Lấy danh sách peer lần đầu
     update_peer_list()
@@ -29,6 +29,8 @@ import socket
 import threading
 import json
 import time
+import queue
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 try:
     from urllib.parse import urlencode
@@ -37,7 +39,8 @@ except ImportError:
 
 from daemon.weaprous import WeApRous
 from daemon.response import Response
-from collections import defaultdict
+from daemon.fanout import PeerDispatcher, sessions_of
+from collections import defaultdict, deque
 import hashlib
 
 # Desktop notification support
@@ -56,6 +59,33 @@ TRACKER_HOST = '127.0.0.1'
 TRACKER_PORT = 8000
 MY_HOST = '0.0.0.0'
 AUTO_REFRESH_INTERVAL = 3000
+HISTORY_PAGE_SIZE = 100
+# Gửi tin qua /relay-message/ của tracker (fan-out phía server) nếu có
+USE_TRACKER_RELAY = True
+# Giây chờ response của /relay-message/; tracker trả lời trong khoảng 8 giây
+# (chờ commit BATCH_ACK_TIMEOUT + BATCH_COMMIT_GRACE, rồi fan-out)
+RELAY_REQUEST_TIMEOUT = 10
+# Long-poll /presence/: tracker giữ request tối đa PRESENCE_WAIT giây
+PRESENCE_WAIT = 5
+PRESENCE_RETRY = 3
+# Typing indicator: báo lại "đang gõ" tối đa mỗi TYPING_REFRESH giây, báo
+# "ngừng gõ" sau TYPING_IDLE giây không gõ; bên nhận tự xoá sau TYPING_TTL
+TYPING_REFRESH = 3
+TYPING_IDLE = 4
+TYPING_TTL = 6
+# Các lời gọi mạng của GUI chạy trên UI_WORKERS thread; kết quả được đưa về
+# Tk thread mỗi UI_DRAIN_INTERVAL ms
+UI_WORKERS = 4
+UI_DRAIN_INTERVAL = 30
+# Các thay đổi unread trong cùng một frame (ms) được vẽ lại một lần
+SIDEBAR_FRAME = 50
+# Khung tin nhắn: giữ tối đa SCROLLBACK_SIZE tin trong bộ nhớ, chỉ vẽ
+# RENDER_WINDOW tin quanh vùng đang xem, dịch RENDER_STEP tin mỗi lần cuộn
+SCROLLBACK_SIZE = 1000
+RENDER_WINDOW = 150
+RENDER_STEP = 50
+# Cuộn tới trong SCROLL_EDGE (tỉ lệ) của mép trên/dưới thì dịch cửa sổ
+SCROLL_EDGE = 0.05
 
 # Set theme
 ctk.set_appearance_mode("dark")
@@ -164,7 +194,8 @@ class P2PServer:
                 broadcast = data.get('broadcast', False)
                 
                 if typing:
-                    callback(channel, sender, '', 'typing')
+                    callback(channel, sender, '', 'typing', dm=msg_type == 'dm',
+                             expires_in=data.get('expires_in', TYPING_TTL))
                 elif reaction:
                     callback(channel, sender, reaction, 'reaction', msg_id=msg_id)
                 elif broadcast:
@@ -235,9 +266,19 @@ class P2PServer:
 
 class HTTPClient:
     @staticmethod
-    def request(method, host, port, path, body_bytes=None, headers=None, cookie_str=None):
+    def request(method, host, port, path, body_bytes=None, headers=None, cookie_str=None,
+                response_headers=None, timeout=10, failure=None):
+        """
+        response_headers: dict nhận các header của response (nếu truyền vào)
+        failure: dict nhận thông tin lỗi (nếu truyền vào): "connected" là
+        False khi không kết nối được, True khi lỗi xảy ra sau đó (vd. hết
+        thời gian chờ response: server có thể đã xử lý request)
+        """
+        connected = False
         try:
-            conn = httplib.HTTPConnection(host, port, timeout=10)
+            conn = httplib.HTTPConnection(host, port, timeout=timeout)
+            conn.connect()
+            connected = True
             if headers is None:
                 headers = {}
             if cookie_str:
@@ -250,14 +291,116 @@ class HTTPClient:
             data = response.read()
             set_cookie = response.getheader('Set-Cookie')
             status = response.status
+            if response_headers is not None:
+                response_headers.update((k.lower(), v) for k, v in response.getheaders())
             conn.close()
             
             return data, status, set_cookie
         except Exception as e:
             print("[HTTP] Error: {}".format(e))
+            if failure is not None:
+                failure.update(connected=connected, error=e)
             return None, 500, None
 
 
+class TypingNotifier:
+    """
+    Coalesces key presses into typing edges, sent from a background thread.
+
+    For each conversation (``("channel", name)`` or ``("dm", username)``) at
+    most one "started typing" edge goes out per ``TYPING_REFRESH`` seconds
+    while the user keeps typing, and one "stopped" edge once they sent the
+    message or paused for ``TYPING_IDLE`` seconds. ``keystroke`` and
+    ``stop`` only update state under a lock, so the Tk thread never waits
+    on the network.
+    """
+    
+    def __init__(self, send):
+        # send(conversation, expires_in): gửi một edge, chạy trên thread này
+        self.send = send
+        self.cond = threading.Condition()
+        # conversation -> {"last_key", "sent_at" (None: chưa báo), "stop"}
+        self.states = {}
+        self.stopped = False
+        self.thread = None
+    
+    def keystroke(self, conversation):
+        """Ghi nhận một lần gõ phím trong conversation"""
+        with self.cond:
+            state = self.states.setdefault(
+                conversation, {"sent_at": None, "last_key": 0, "stop": False})
+            # Thread chỉ cần thức dậy ở phím đầu tiên sau mỗi edge
+            wake = state["sent_at"] is None or state["last_key"] <= state["sent_at"]
+            state["last_key"] = time.monotonic()
+            state["stop"] = False
+            if wake:
+                self.cond.notify()
+            self.ensure_thread()
+    
+    def stop(self, conversation=None):
+        """Ngừng gõ ngay (đã gửi tin, xoá ô nhập, đổi conversation)"""
+        with self.cond:
+            for key, state in self.states.items():
+                if conversation is None or key == conversation:
+                    state["stop"] = True
+            self.cond.notify()
+    
+    def close(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+    
+    def ensure_thread(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+    
+    def due_edges(self, now):
+        """
+        Các edge cần gửi lúc now và thời điểm cần xét lại.
+        Gọi khi đang giữ self.cond.
+        """
+        edges = []
+        wake = None
+        for key, state in list(self.states.items()):
+            if state["stop"] or now - state["last_key"] >= TYPING_IDLE:
+                if state["sent_at"] is not None:
+                    edges.append((key, 0))
+                del self.states[key]
+                continue
+            # Chỉ báo lại khi có phím gõ sau edge trước
+            if state["sent_at"] is None or (state["last_key"] > state["sent_at"]
+                                            and now - state["sent_at"] >= TYPING_REFRESH):
+                edges.append((key, TYPING_TTL))
+                state["sent_at"] = now
+            deadline = state["last_key"] + TYPING_IDLE
+            if state["last_key"] > state["sent_at"]:
+                deadline = min(deadline, state["sent_at"] + TYPING_REFRESH)
+            wake = deadline if wake is None else min(wake, deadline)
+        return edges, wake
+    
+    def run(self):
+        while True:
+            with self.cond:
+                while True:
+                    if self.stopped:
+                        return
+                    now = time.monotonic()
+                    edges, wake = self.due_edges(now)
+                    if edges:
+                        break
+                    self.cond.wait(None if wake is None else max(0, wake - now))
+            for conversation, expires_in in edges:
+                try:
+                    self.send(conversation, expires_in)
+                except Exception as e:
+                    print("[Client] Typing indicator error: {}".format(e))
+
+
+class PresenceUnsupported(Exception):
+    """The tracker has no /presence/ route; fall back to polling /get-list/."""
+
+
 class ChatClient:
     def __init__(self, my_port, on_message_received):
         self.my_port = my_port
@@ -272,11 +415,47 @@ class ChatClient:
         self.on_message_received = on_message_received
         self.p2p_server = None
         self.user_status = "online"
-        self.typing_users = set()
+        # username -> (conversation, monotonic deadline) của người đang gõ
+        self.typing_users = {}
+        self.typing = TypingNotifier(self.send_typing_indicator)
         self.message_cache = {}
         self.unread_messages = defaultdict(int)
         self.unread_messages_channel = defaultdict(int)
         self.channel_permissions = {}
+        # Bản /list-channels/ cuối cùng và ETag của nó (revalidate bằng 304)
+        self.channel_list = []
+        self.channel_list_etag = None
+        # X-ACL-Version mới nhất tracker gửi, và version của channel_permissions
+        self.acl_version = None
+        self.channel_permissions_version = None
+        self.use_relay = USE_TRACKER_RELAY
+        # Gửi P2P song song, giữ kết nối keep-alive tới từng peer
+        self.dispatcher = PeerDispatcher()
+        # Presence: version đã áp dụng, thread long-poll
+        self.presence_version = None
+        self.presence_stop = threading.Event()
+        # Lease của session trên tracker, gia hạn bằng /heartbeat/
+        self.heartbeat_thread = None
+        self.heartbeat_stop = threading.Event()
+    
+    def tracker_request(self, method, path, response_headers=None, **kwargs):
+        """
+        HTTPClient.request tới tracker, kèm cookie đăng nhập. Ghi nhận
+        X-ACL-Version của mọi response để biết khi nào quyền channel đổi.
+        """
+        if response_headers is None:
+            response_headers = {}
+        result = HTTPClient.request(
+            method, TRACKER_HOST, TRACKER_PORT, path,
+            cookie_str=self.auth_cookie, response_headers=response_headers, **kwargs
+        )
+        version = response_headers.get('x-acl-version')
+        if version is not None:
+            try:
+                self.acl_version = int(version)
+            except ValueError:
+                pass
+        return result
     
     def start_p2p_server(self):
         if self.p2p_server is None:
@@ -303,7 +482,10 @@ class ChatClient:
         broadcast = kwargs.get('broadcast', False)
         
         if msg_type == 'typing':
-            self.on_message_received('typing', sender, '', 'typing')
+            conversation = ('dm', sender) if kwargs.get('dm') else ('channel', channel)
+            self.on_message_received('typing', sender, '', 'typing',
+                                     conversation=conversation,
+                                     expires_in=kwargs.get('expires_in', TYPING_TTL))
         elif msg_type == 'reaction':
             msg_id = kwargs.get('msg_id', '')
             self.on_message_received('reaction', sender, message, 'reaction', msg_id=msg_id)
@@ -353,102 +535,265 @@ class ChatClient:
         body = json.dumps(payload).encode('utf-8')
         headers = {"Content-type": "application/json"}
         
-        data, status, _ = HTTPClient.request(
-            "POST", TRACKER_HOST, TRACKER_PORT, "/submit-info/",
-            body_bytes=body, headers=headers, cookie_str=self.auth_cookie
+        data, status, _ = self.tracker_request(
+            "POST", "/submit-info/",
+            body_bytes=body, headers=headers
         )
-        return status == 200
+        if status != 200:
+            return False
+        try:
+            lease = json.loads(data.decode('utf-8')).get('lease')
+        except (ValueError, AttributeError):
+            lease = None
+        if lease and not self.heartbeat_thread:
+            self.heartbeat_thread = threading.Thread(
+                target=self.heartbeat_loop, args=(lease,), name="heartbeat", daemon=True)
+            self.heartbeat_thread.start()
+        return True
+    
+    def heartbeat_loop(self, lease):
+        """Gia hạn lease mỗi lease/3 giây; đăng ký lại nếu tracker đã xóa session"""
+        body = json.dumps({"ip": self.my_ip, "port": self.my_port}).encode('utf-8')
+        headers = {"Content-type": "application/json"}
+        while not self.heartbeat_stop.wait(max(1.0, lease / 3.0)):
+            data, status, _ = self.tracker_request(
+                "POST", "/heartbeat/",
+                body_bytes=body, headers=headers
+            )
+            if status == 404:
+                if not data or not data.startswith(b'{'):
+                    return  # tracker không có /heartbeat/
+                if self.heartbeat_stop.is_set():
+                    return
+                print("[Client] Lease expired, registering again")
+                self.register_peer()
     
     def update_peer_list(self):
-        data, status, _ = HTTPClient.request(
-            "GET", TRACKER_HOST, TRACKER_PORT, "/get-list/",
-            cookie_str=self.auth_cookie
+        """
+        Cập nhật peer_list từ /get-list/. Khi đã biết version, chỉ lấy phần
+        thay đổi (since_version) thay vì cả danh sách. Trả về (joined, left).
+        """
+        path = "/get-list/"
+        if self.presence_version is not None:
+            path += "?since_version={}".format(self.presence_version)
+        response_headers = {}
+        data, status, _ = self.tracker_request(
+            "GET", path,
+            response_headers=response_headers
         )
 
         if status == 200:
             try:
-                peers = json.loads(data.decode('utf-8'))
-                with self.lock:
-                    old_users = set(self.peer_list.keys())
-                    self.peer_list = defaultdict(list)
-                    for peer in peers:
-                        if peer['username'] != self.username:
-                            self.peer_list[peer['username']].append(
-                                (peer['ip'], peer['port'])
-                            )
-                    new_users = set(self.peer_list.keys())
-                joined = new_users - old_users
-                left = old_users - new_users
-                return joined, left
+                result = json.loads(data.decode('utf-8'))
+                if isinstance(result, list):
+                    # Danh sách đầy đủ (lần đầu, hoặc tracker cũ)
+                    update = {"resync": True, "peers": result}
+                    version = response_headers.get('x-presence-version')
+                    update['version'] = int(version) if version is not None else None
+                elif result.get('resync'):
+                    update = result
+                else:
+                    changes = [dict(peer, op='join') for peer in result.get('added', [])]
+                    changes += [dict(peer, op='leave') for peer in result.get('removed', [])]
+                    update = {"version": result.get('version'), "changes": changes}
+                return self.apply_presence(update)
             except:
+                self.presence_version = None
                 return set(), set()
         return set(), set()
     
+    def apply_presence(self, update):
+        """
+        Áp dụng một phản hồi /presence/: resync toàn bộ hoặc các delta
+        join/leave (idempotent). Trả về (joined, left) theo username.
+        """
+        with self.lock:
+            old_users = set(self.peer_list.keys())
+            if update.get('resync'):
+                self.peer_list = defaultdict(list)
+                for peer in update.get('peers', []):
+                    if peer['username'] != self.username:
+                        self.peer_list[peer['username']].append((peer['ip'], peer['port']))
+            else:
+                for change in update.get('changes', []):
+                    user = change['username']
+                    if user == self.username:
+                        continue
+                    session = (change['ip'], change['port'])
+                    sessions = self.peer_list.get(user, [])
+                    if change['op'] == 'join':
+                        if session not in sessions:
+                            self.peer_list[user] = sessions + [session]
+                    elif session in sessions:
+                        sessions = [s for s in sessions if s != session]
+                        if sessions:
+                            self.peer_list[user] = sessions
+                        else:
+                            del self.peer_list[user]
+            self.presence_version = update.get('version')
+            new_users = set(self.peer_list.keys())
+        return new_users - old_users, old_users - new_users
+    
+    def poll_presence(self, wait=PRESENCE_WAIT):
+        """
+        Một lần long-poll. Trả về (joined, left, changed, retry_after) -
+        changed cả khi chỉ số session thay đổi, retry_after là số giây phải
+        chờ trước lần poll sau (tracker đang đủ long-poll) hoặc 0 -, hoặc
+        None khi lỗi mạng; raise PresenceUnsupported nếu tracker không có
+        /presence/.
+        """
+        path = "/presence/"
+        if self.presence_version is not None:
+            path += "?version={}&wait={}".format(self.presence_version, wait)
+        data, status, _ = self.tracker_request(
+            "GET", path,
+            timeout=wait + 10
+        )
+        if status == 404:
+            raise PresenceUnsupported(path)
+        if status != 200:
+            return None
+        try:
+            update = json.loads(data.decode('utf-8'))
+            joined, left = self.apply_presence(update)
+            changed = bool(update.get('resync') or update.get('changes'))
+            return joined, left, changed, float(update.get('retry_after', 0))
+        except (ValueError, KeyError, AttributeError, TypeError):
+            self.presence_version = None
+            return None
+    
+    def watch_presence(self, on_change):
+        """
+        Thread nền: long-poll liên tục, gọi on_change(joined, left) khi có
+        thay đổi (kể cả lần poll đầu tiên). Trả về False nếu tracker không
+        hỗ trợ (dùng polling cũ).
+        """
+        try:
+            result = self.poll_presence()
+        except PresenceUnsupported:
+            return False
+        self.presence_stop.clear()
+        
+        def run(result):
+            while not self.presence_stop.is_set():
+                if result is None:
+                    self.presence_stop.wait(PRESENCE_RETRY)
+                else:
+                    joined, left, changed, retry_after = result
+                    if changed and not self.presence_stop.is_set():
+                        on_change(joined, left)
+                    if retry_after:
+                        self.presence_stop.wait(retry_after)
+                if self.presence_stop.is_set():
+                    return
+                try:
+                    result = self.poll_presence()
+                except PresenceUnsupported:
+                    return
+        
+        threading.Thread(target=run, args=(result,), name="presence", daemon=True).start()
+        return True
+    
     def send_broadcast(self, message, channel=None):
         if channel is None:
             channel = self.current_channel
         
-        has_access, error_msg = self.check_channel_access(channel, force_refresh=True)
+        has_access, error_msg = self.check_channel_access(channel)
         if not has_access:
             return 0, 0, [], None
         
-        with self.lock:
-            peers = dict(self.peer_list)
-        
-        sent_count = 0
-        failed_users = []
-        
         msg_id = hashlib.md5("{}{}{}".format(
             self.username, message, time.time()
         ).encode()).hexdigest()[:8]
         
-        for target_username, sessions in peers.items():
-            payload = {
-                "sender_username": self.username,
-                "channel": channel,
-                "message": message,
-                "type": "channel",
-                "msg_id": msg_id,
-                "broadcast": True
-            }
-            body = json.dumps(payload).encode('utf-8')
-            headers = {"Content-type": "application/json"}
-            
-            user_sent = False
-            for ip, port in sessions:
-                try:
-                    data, status, _ = HTTPClient.request(
-                        "POST", ip, port, "/send-peer",
-                        body_bytes=body, headers=headers
-                    )
-                    if status == 200:
-                        user_sent = True
-                        break
-                except:
-                    pass
-            
-            if user_sent:
-                sent_count += 1
-            else:
-                failed_users.append(target_username)
+        relayed = self.relay_message(channel=channel, message=message,
+                                     msg_id=msg_id, broadcast=True)
+        if relayed is not None:
+            status, report = relayed
+            if status == 403:
+                return 0, 0, [], None
+            if status == 200 and report is not None:
+                failed_users = [user for user, result in report['recipients'].items()
+                                if not result['delivered']]
+                return report['delivered'], report['total'], failed_users, msg_id
+            print("[Client] Relay failed ({})".format(status or "no response in time"))
+            return None, 0, [], msg_id
+        
+        with self.lock:
+            peers = dict(self.peer_list)
+        
+        payload = {
+            "sender_username": self.username,
+            "channel": channel,
+            "message": message,
+            "type": "channel",
+            "msg_id": msg_id,
+            "broadcast": True
+        }
+        body = json.dumps(payload).encode('utf-8')
+        headers = {"Content-type": "application/json"}
+        
+        # Gửi song song tới mọi session; user nhận được nếu một session OK
+        delivered = set()
+        for result in self.dispatcher.fan_out(sessions_of(peers), "/send-peer", body):
+            if result.ok:
+                delivered.add(result.username)
+        sent_count = len(delivered)
+        failed_users = [user for user in peers if user not in delivered]
         
         try:
             log_payload = {"channel_name": channel, "content": message}
             log_body = json.dumps(log_payload).encode('utf-8')
-            HTTPClient.request(
-                "POST", TRACKER_HOST, TRACKER_PORT, "/log-message/",
-                body_bytes=log_body, headers=headers, cookie_str=self.auth_cookie
+            self.tracker_request(
+                "POST", "/log-message/",
+                body_bytes=log_body, headers=headers
             )
         except:
             pass
         
         return sent_count, len(peers), failed_users, msg_id
     
+    def relay_message(self, **fields):
+        """
+        Gửi một tin qua /relay-message/: tracker fan-out song song tới các
+        session online và trả về báo cáo từng người nhận.
+        Trả về (status, report), hoặc None nếu tracker không có endpoint này
+        hoặc không kết nối được (khi đó caller tự gửi P2P tới từng peer).
+        Với mọi lỗi khác, kể cả hết thời gian chờ response (status None),
+        tracker có thể đã lưu và gửi tin, nên caller không được gửi lại.
+        """
+        if not self.use_relay:
+            return None
+        body = json.dumps(fields).encode('utf-8')
+        headers = {"Content-type": "application/json"}
+        failure = {}
+        data, status, _ = self.tracker_request(
+            "POST", "/relay-message/",
+            body_bytes=body, headers=headers, failure=failure,
+            timeout=RELAY_REQUEST_TIMEOUT
+        )
+        if failure:
+            if not failure["connected"]:
+                return None
+            return None, None
+        try:
+            report = json.loads(data.decode('utf-8'))
+        except (AttributeError, ValueError):
+            if status == 404:
+                print("[Client] Tracker has no /relay-message/, sending P2P")
+                self.use_relay = False
+                return None
+            report = None
+        if status == 403:
+            # Cache cho phép nhưng tracker từ chối: quyền đã đổi
+            self.channel_permissions_version = None
+        return status, report
+    
     def send_message(self, message, channel=None):
         if channel is None:
             channel = self.current_channel
         
-        has_access, error_msg = self.check_channel_access(channel, force_refresh=True)
+        has_access, error_msg = self.check_channel_access(channel)
         if not has_access:
             return -1, None
         
@@ -456,6 +801,17 @@ class ChatClient:
             self.username, message, time.time()
         ).encode()).hexdigest()[:8]
         
+        relayed = self.relay_message(channel=channel, message=message, msg_id=msg_id)
+        if relayed is not None:
+            status, report = relayed
+            if status == 403:
+                return -1, None
+            if status == 200 and report is not None:
+                return report['delivered'], msg_id
+            # Tracker có thể đã lưu tin: gửi P2P + /log-message/ sẽ bị trùng
+            print("[Client] Relay failed ({})".format(status or "no response in time"))
+            return None, msg_id
+        
         payload = {
             "sender_username": self.username,
             "channel": channel,
@@ -469,64 +825,51 @@ class ChatClient:
         with self.lock:
             peers = dict(self.peer_list)
         
-        sent_count = 0
-        for username, sessions in peers.items():
-            for ip, port in sessions:
-                try:
-                    data, status, _ = HTTPClient.request(
-                        "POST", ip, port, "/send-peer",
-                        body_bytes=body, headers=headers
-                    )
-                    if status == 200:
-                        sent_count += 1
-                except:
-                    pass
+        sent_count = sum(1 for result in self.dispatcher.fan_out(
+            sessions_of(peers), "/send-peer", body) if result.ok)
         
         try:
             log_payload = {"channel_name": channel, "content": message}
             log_body = json.dumps(log_payload).encode('utf-8')
-            HTTPClient.request(
-                "POST", TRACKER_HOST, TRACKER_PORT, "/log-message/",
-                body_bytes=log_body, headers=headers, cookie_str=self.auth_cookie
+            self.tracker_request(
+                "POST", "/log-message/",
+                body_bytes=log_body, headers=headers
             )
         except:
             pass
         
         return sent_count, msg_id
     
-    def send_typing_indicator(self, target_user=None):
+    def send_typing_indicator(self, conversation, expires_in=TYPING_TTL):
+        """
+        Gửi một edge typing cho conversation ("channel", name) hoặc
+        ("dm", username). expires_in là số giây bên nhận hiển thị
+        "đang gõ"; 0 nghĩa là đã ngừng gõ. Chạy trên thread của
+        TypingNotifier, không chờ từng peer trả lời.
+        """
+        kind, name = conversation
+        if kind == "dm":
+            relayed = self.relay_message(target=name, typing=True, expires_in=expires_in)
+        else:
+            relayed = self.relay_message(channel=name, typing=True, expires_in=expires_in)
+        if relayed is not None and relayed[0] in (200, 403):
+            return
+        
         payload = {
             "sender_username": self.username,
-            "channel": self.current_channel if not target_user else target_user,
-            "type": "channel" if not target_user else "dm",
-            "typing": True
+            "channel": name,
+            "type": kind,
+            "typing": True,
+            "expires_in": expires_in
         }
         body = json.dumps(payload).encode('utf-8')
-        headers = {"Content-type": "application/json"}
         
         with self.lock:
             peers = dict(self.peer_list)
         
-        if target_user:
-            if target_user in peers:
-                for ip, port in peers[target_user]:
-                    try:
-                        HTTPClient.request(
-                            "POST", ip, port, "/send-peer",
-                            body_bytes=body, headers=headers
-                        )
-                    except:
-                        pass
-        else:
-            for username, sessions in peers.items():
-                for ip, port in sessions:
-                    try:
-                        HTTPClient.request(
-                            "POST", ip, port, "/send-peer",
-                            body_bytes=body, headers=headers
-                        )
-                    except:
-                        pass
+        if kind == "dm":
+            peers = {name: peers.get(name, [])}
+        self.dispatcher.submit(sessions_of(peers), "/send-peer", body)
     
     # khoong dungf
     def send_reaction(self, msg_id, emoji, channel=None):
@@ -577,19 +920,9 @@ class ChatClient:
         body = json.dumps(payload).encode('utf-8')
         headers = {"Content-type": "application/json"}
         
-        sent_count = 0
-        sessions = peers[target_username]
-        
-        for ip, port in sessions:
-            try:
-                data, status, _ = HTTPClient.request(
-                    "POST", ip, port, "/send-peer",
-                    body_bytes=body, headers=headers
-                )
-                if status == 200:
-                    sent_count += 1
-            except:
-                pass
+        sent_count = sum(1 for result in self.dispatcher.fan_out(
+            sessions_of({target_username: peers[target_username]}), "/send-peer", body)
+            if result.ok)
         
         try:
             log_payload = {
@@ -597,9 +930,9 @@ class ChatClient:
                 "content": message
             }
             log_body = json.dumps(log_payload).encode('utf-8')
-            HTTPClient.request(
-                "POST", TRACKER_HOST, TRACKER_PORT, "/log-dm/",
-                body_bytes=log_body, headers=headers, cookie_str=self.auth_cookie
+            self.tracker_request(
+                "POST", "/log-dm/",
+                body_bytes=log_body, headers=headers
             )
         except Exception as e:
             print("[Client] Failed to log DM: {}".format(e))
@@ -611,9 +944,9 @@ class ChatClient:
         body = json.dumps(payload).encode('utf-8')
         headers = {"Content-type": "application/json"}
         
-        data, status, _ = HTTPClient.request(
-            "POST", TRACKER_HOST, TRACKER_PORT, "/get-dm-history/",
-            body_bytes=body, headers=headers, cookie_str=self.auth_cookie
+        data, status, _ = self.tracker_request(
+            "POST", "/get-dm-history/",
+            body_bytes=body, headers=headers
         )
         
         if status == 200:
@@ -624,14 +957,26 @@ class ChatClient:
         return []
     
     def get_channel_list(self):
-        data, status, _ = HTTPClient.request(
-            "GET", TRACKER_HOST, TRACKER_PORT, "/list-channels/",
-            cookie_str=self.auth_cookie
+        headers = {}
+        if self.channel_list_etag:
+            headers['If-None-Match'] = self.channel_list_etag
+        response_headers = {}
+        data, status, _ = self.tracker_request(
+            "GET", "/list-channels/",
+            headers=headers,
+            response_headers=response_headers
         )
         
+        if status == 304:
+            self.channel_permissions_version = self.acl_version
+            return self.channel_list
+        
         if status == 200:
             try:
                 channels = json.loads(data.decode('utf-8'))
+                self.channel_list = channels
+                self.channel_list_etag = response_headers.get('etag')
+                self.channel_permissions_version = self.acl_version
                 for ch in channels:
                     self.channel_permissions[ch['name']] = {
                         'owner': ch.get('owner'),
@@ -653,15 +998,24 @@ class ChatClient:
         body = json.dumps(payload).encode('utf-8')
         headers = {"Content-type": "application/json"}
         
-        data, status, _ = HTTPClient.request(
-            "POST", TRACKER_HOST, TRACKER_PORT, "/create-channel/",
-            body_bytes=body, headers=headers, cookie_str=self.auth_cookie
+        data, status, _ = self.tracker_request(
+            "POST", "/create-channel/",
+            body_bytes=body, headers=headers
         )
         
         return status == 200
     
+    def permissions_stale(self):
+        """Cache quyền channel cũ hơn X-ACL-Version tracker vừa báo"""
+        return (self.channel_permissions_version is None
+                or self.acl_version != self.channel_permissions_version)
+    
     def check_channel_access(self, channel_name, force_refresh=False):
-        if force_refresh or channel_name not in self.channel_permissions:
+        """
+        Kiểm tra quyền từ cache channel_permissions; chỉ tải lại
+        /list-channels/ khi tracker báo ACL đã đổi (hoặc force_refresh).
+        """
+        if force_refresh or channel_name not in self.channel_permissions or self.permissions_stale():
             self.get_channel_list()
         
         perms = self.channel_permissions.get(channel_name, {})
@@ -678,18 +1032,25 @@ class ChatClient:
         
         return False, "Access denied: You are not a member of this private channel"
     
-    def get_channel_history(self, channel):
-        has_access, error_msg = self.check_channel_access(channel, force_refresh=True)
+    def get_channel_history(self, channel, after_id=None, before_id=None, limit=None):
+        """after_id: chỉ lấy tin mới hơn; before_id: trang cũ hơn (keyset)"""
+        has_access, error_msg = self.check_channel_access(channel)
         if not has_access:
             return []
         
         payload = {"channel_name": channel}
+        if after_id is not None:
+            payload["after_id"] = after_id
+        if before_id is not None:
+            payload["before_id"] = before_id
+        if limit is not None:
+            payload["limit"] = limit
         body = json.dumps(payload).encode('utf-8')
         headers = {"Content-type": "application/json"}
         
-        data, status, _ = HTTPClient.request(
-            "POST", TRACKER_HOST, TRACKER_PORT, "/get-history/",
-            body_bytes=body, headers=headers, cookie_str=self.auth_cookie
+        data, status, _ = self.tracker_request(
+            "POST", "/get-history/",
+            body_bytes=body, headers=headers
         )
         
         if status == 200:
@@ -704,9 +1065,9 @@ class ChatClient:
         body = json.dumps(payload).encode('utf-8')
         headers = {"Content-type": "application/json"}
         
-        data, status, _ = HTTPClient.request(
-            "POST", TRACKER_HOST, TRACKER_PORT, "/add-channel-member/",
-            body_bytes=body, headers=headers, cookie_str=self.auth_cookie
+        data, status, _ = self.tracker_request(
+            "POST", "/add-channel-member/",
+            body_bytes=body, headers=headers
         )
         
         if status == 200:
@@ -723,9 +1084,9 @@ class ChatClient:
         body = json.dumps(payload).encode('utf-8')
         headers = {"Content-type": "application/json"}
         
-        data, status, _ = HTTPClient.request(
-            "POST", TRACKER_HOST, TRACKER_PORT, "/remove-channel-member/",
-            body_bytes=body, headers=headers, cookie_str=self.auth_cookie
+        data, status, _ = self.tracker_request(
+            "POST", "/remove-channel-member/",
+            body_bytes=body, headers=headers
         )
         
         if status == 200:
@@ -742,9 +1103,9 @@ class ChatClient:
         body = json.dumps(payload).encode('utf-8')
         headers = {"Content-type": "application/json"}
         
-        data, status, _ = HTTPClient.request(
-            "POST", TRACKER_HOST, TRACKER_PORT, "/get-channel-members/",
-            body_bytes=body, headers=headers, cookie_str=self.auth_cookie
+        data, status, _ = self.tracker_request(
+            "POST", "/get-channel-members/",
+            body_bytes=body, headers=headers
         )
         
         if status == 200:
@@ -756,21 +1117,447 @@ class ChatClient:
     
     def logout(self):
         print("[Client] Logging out...")
+        self.heartbeat_stop.set()
         
         payload = {"ip": self.my_ip, "port": self.my_port}
         body = json.dumps(payload).encode('utf-8')
         headers = {"Content-type": "application/json"}
         
         try:
-            HTTPClient.request(
-                "POST", TRACKER_HOST, TRACKER_PORT, "/logout/",
-                body_bytes=body, headers=headers, cookie_str=self.auth_cookie
+            self.tracker_request(
+                "POST", "/logout/",
+                body_bytes=body, headers=headers
             )
         except:
             pass
         
         if self.p2p_server:
             self.p2p_server.stop()
+        self.presence_stop.set()
+        self.typing.close()
+        self.dispatcher.close()
+
+
+class TaskRunner:
+    """
+    Runs blocking client calls on worker threads and hands the results back
+    to the Tk thread.
+
+    Workers never touch widgets: every finished task, and every callback
+    posted from another thread, goes into one queue that the Tk thread
+    drains every ``UI_DRAIN_INTERVAL`` ms through ``root.after``. A task
+    submitted under a key (e.g. ``"view"``) supersedes the previous task of
+    that key: it is cancelled if it has not started, and its result is
+    dropped otherwise.
+    """
+    
+    def __init__(self, root, workers=UI_WORKERS, interval=UI_DRAIN_INTERVAL):
+        self.root = root
+        self.interval = interval
+        self.executor = ThreadPoolExecutor(max_workers=workers,
+                                           thread_name_prefix="gui-task")
+        # Một thread cho các task phải chạy đúng thứ tự (gửi tin)
+        self.ordered = ThreadPoolExecutor(max_workers=1,
+                                          thread_name_prefix="gui-send")
+        self.queue = queue.SimpleQueue()
+        # key -> Future mới nhất của key đó (chỉ dùng trên Tk thread)
+        self.current = {}
+        self.drain_job = None
+    
+    def submit(self, fn, *args, on_done=None, on_error=None, key=None, ordered=False,
+               **kwargs):
+        """
+        Chạy fn(*args, **kwargs) trên worker; on_done(result) hoặc
+        on_error(exception) được gọi trên Tk thread. Task ordered chạy
+        lần lượt theo thứ tự submit.
+        """
+        if key is not None:
+            self.cancel(key)
+        executor = self.ordered if ordered else self.executor
+        future = executor.submit(fn, *args, **kwargs)
+        if key is not None:
+            self.current[key] = future
+        future.add_done_callback(
+            lambda f: self.queue.put((self.deliver, (f, key, on_done, on_error), {})))
+        return future
+    
+    def post(self, callback, *args, **kwargs):
+        """Gọi callback trên Tk thread; an toàn khi gọi từ bất kỳ thread nào"""
+        self.queue.put((callback, args, kwargs))
+    
+    def cancel(self, key):
+        future = self.current.pop(key, None)
+        if future is not None:
+            future.cancel()
+    
+    def cancel_all(self):
+        for key in list(self.current):
+            self.cancel(key)
+    
+    def deliver(self, future, key, on_done, on_error):
+        if future.cancelled():
+            return
+        if key is not None:
+            if self.current.get(key) is not future:
+                return
+            del self.current[key]
+        error = future.exception()
+        if error is not None:
+            if on_error:
+                on_error(error)
+            else:
+                print("[GUI] Task error: {}".format(error))
+        elif on_done:
+            on_done(future.result())
+    
+    def start(self):
+        if self.drain_job is None:
+            self.drain_job = self.root.after(self.interval, self.drain)
+    
+    def drain(self):
+        # Chỉ xử lý những gì đã có lúc bắt đầu, để không giữ Tk thread mãi
+        self.drain_job = None
+        for _ in range(self.queue.qsize()):
+            callback, args, kwargs = self.queue.get_nowait()
+            try:
+                callback(*args, **kwargs)
+            except Exception as e:
+                print("[GUI] Callback error: {}".format(e))
+        self.start()
+    
+    def stop(self):
+        if self.drain_job is not None:
+            self.root.after_cancel(self.drain_job)
+            self.drain_job = None
+        self.cancel_all()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.ordered.shutdown(wait=False)
+
+
+class SidebarList:
+    """
+    Keyed rows of a sidebar list (channels or users).
+
+    ``update`` takes the full list of rows in display order and only touches
+    what changed: new keys get a row, vanished keys lose theirs, and rows
+    whose icon or text changed are relabelled in place. Rows keep their
+    widgets (and selection) across refreshes.
+    """
+    
+    def __init__(self, gui, container, item_type, on_click):
+        self.gui = gui
+        self.container = container
+        self.item_type = item_type
+        self.on_click = on_click
+        # key -> button của row (button._frame là frame chứa nó)
+        self.rows = {}
+        self.order = []
+    
+    def get(self, key):
+        return self.rows.get(key)
+    
+    def update(self, rows):
+        """
+        rows: list các (key, icon, text) theo thứ tự hiển thị.
+        Trả về số row đã tạo, xoá hoặc đổi nhãn.
+        """
+        keys = [key for key, _, _ in rows]
+        wanted = set(keys)
+        changes = 0
+        
+        for key in [key for key in self.order if key not in wanted]:
+            self.rows.pop(key)._frame.destroy()
+            changes += 1
+        kept = [key for key in self.order if key in wanted]
+        # Thứ tự của các row cũ đổi (hiếm): pack lại toàn bộ
+        repack = kept != [key for key in keys if key in self.rows]
+        
+        following = None
+        for key, icon, text in reversed(rows):
+            btn = self.rows.get(key)
+            if btn is None:
+                btn = self.gui.create_list_item(
+                    self.container, text, icon,
+                    lambda key=key: self.on_click(key),
+                    self.item_type,
+                    before=None if repack or following is None else following._frame
+                )
+                btn._key = key
+                self.rows[key] = btn
+                changes += 1
+            elif (btn._item_icon, btn._item_text) != (icon, text):
+                btn.configure(text="{} {}".format(icon, text))
+                btn._item_icon = icon
+                btn._item_text = text
+                changes += 1
+            following = btn
+        
+        if repack:
+            for key in keys:
+                frame = self.rows[key]._frame
+                frame.pack_forget()
+                frame.pack(fill="x", pady=2)
+        self.order = keys
+        return changes
+
+
+class MessagePane:
+    """
+    Message area backed by a bounded ring buffer of message records.
+
+    At most ``SCROLLBACK_SIZE`` records are kept and only a window of
+    ``RENDER_WINDOW`` of them is in the textbox. Scrolling near the top or
+    bottom edge moves the window by ``RENDER_STEP`` records; at the top of
+    the buffer, ``load_older`` (if set) fetches the previous page from the
+    tracker. Loading older pages into a full buffer drops the newest
+    records; scrolling back to the bottom then calls ``on_detached`` to
+    reload the latest ones.
+
+    A record is a dict with ``sender``, ``content``, ``type``, ``time_str``,
+    and optionally ``msg_id``, ``id`` (tracker message id) and ``search``.
+    """
+    
+    def __init__(self, display, reactions, size=SCROLLBACK_SIZE,
+                 window=RENDER_WINDOW, step=RENDER_STEP):
+        self.display = display
+        self.text = display._textbox
+        self.reactions = reactions
+        self.window = window
+        self.step = step
+        self.records = deque(maxlen=size)
+        # seq của tin đầu/cuối trong buffer liên tục nên vị trí = seq - seq đầu
+        self.next_seq = 0
+        self.first = self.last = None
+        self.generation = 0
+        self.load_older = None
+        self.on_detached = None
+        self.loading = False
+        self.exhausted = False
+        self.detached = False
+        self.shift_job = None
+        
+        # Nhận mọi thay đổi vùng nhìn (cuộn, chèn, resize) rồi chuyển tiếp
+        # cho scrollbar như cũ
+        self.scroll_set = str(self.text.cget("yscrollcommand"))
+        self.text.configure(yscrollcommand=self.on_yscroll)
+    
+    # ---- buffer ----
+    
+    def seq_range(self):
+        if not self.records:
+            return None, None
+        return self.records[0]['seq'], self.records[-1]['seq']
+    
+    def record(self, seq):
+        low, high = self.seq_range()
+        if low is None or not low <= seq <= high:
+            return None
+        return self.records[seq - low]
+    
+    def visible_records(self):
+        if self.first is None:
+            return []
+        low, high = self.seq_range()
+        if low is None:
+            return []
+        start, end = max(self.first, low), min(self.last, high)
+        return [self.records[seq - low] for seq in range(start, end + 1)]
+    
+    def reset(self, records=(), load_older=None, on_detached=None):
+        """Bỏ hết tin cũ (đổi view), nạp records và vẽ phần cuối"""
+        self.generation += 1
+        self.records.clear()
+        self.load_older = load_older
+        self.on_detached = on_detached
+        self.loading = False
+        self.exhausted = load_older is None
+        self.detached = False
+        for record in records:
+            record['seq'] = self.next_seq
+            self.next_seq += 1
+            self.records.append(record)
+        self.render_tail()
+    
+    def append(self, record):
+        """
+        Tin mới: thêm vào buffer và vẽ nếu cửa sổ đang ở cuối. Cửa sổ luôn
+        được cắt về tối đa window tin và không chứa tin đã bị đẩy khỏi
+        buffer; nếu người dùng đang cuộn lên thì giữ nguyên vị trí đang xem.
+        """
+        if self.detached:
+            # Đang xem trang cũ, phần mới nhất sẽ được tải lại khi cuộn xuống
+            return
+        _, high = self.seq_range()
+        covers_tail = self.first is None or self.last == high
+        at_bottom = self.text.yview()[1] >= 0.999
+        
+        record['seq'] = self.next_seq
+        self.next_seq += 1
+        self.records.append(record)
+        low, _ = self.seq_range()
+        if self.first is not None and self.last < low:
+            # Cả cửa sổ đã bị đẩy khỏi buffer
+            self.render_tail()
+            return
+        if not covers_tail and self.first >= low:
+            return
+        
+        text = self.text
+        self.display.configure(state="normal")
+        if not at_bottom:
+            text.mark_set("view_anchor", "@0,0")
+            text.mark_gravity("view_anchor", "left")
+        if covers_tail:
+            self.insert(record)
+            self.last = record['seq']
+            if self.first is None:
+                self.first = record['seq']
+        while self.first < low or self.last - self.first + 1 > self.window:
+            self.drop_first()
+        self.display.configure(state="disabled")
+        if at_bottom:
+            text.see("end")
+        else:
+            text.yview("view_anchor")
+            text.mark_unset("view_anchor")
+    
+    def prepend(self, records):
+        """Trang cũ hơn (tăng dần theo thời gian) từ tracker"""
+        low, _ = self.seq_range()
+        seq = low if low is not None else self.next_seq
+        for record in reversed(records):
+            if len(self.records) == self.records.maxlen:
+                self.records.pop()
+                self.detached = True
+            seq -= 1
+            record['seq'] = seq
+            self.records.appendleft(record)
+        if self.last is not None and self.records and self.last > self.records[-1]['seq']:
+            self.last = self.records[-1]['seq']
+    
+    def oldest_id(self):
+        for record in self.records:
+            if record.get('id') is not None:
+                return record['id']
+        return None
+    
+    # ---- rendering ----
+    
+    def mark(self, seq):
+        return "rec{}".format(seq)
+    
+    def insert(self, record):
+        text = self.text
+        mark = self.mark(record['seq'])
+        text.mark_set(mark, "end-1c")
+        text.mark_gravity(mark, "left")
+        
+        if record['type'] == "system":
+            text.insert("end", "ℹ️ [System] {}\n".format(record['content']), "system")
+            return
+        
+        text.insert("end", "[", "timestamp")
+        text.insert("end", record['time_str'], "timestamp")
+        text.insert("end", "] ", "timestamp")
+        
+        msg_type = record['type']
+        if msg_type in ["dm_sent", "dm_recv"]:
+            text.insert("end", "{}: ".format(record['sender']), msg_type)
+        elif msg_type == "broadcast":
+            text.insert("end", "{}: ".format(record['sender']), "broadcast")
+        else:
+            text.insert("end", "{}: ".format(record['sender']), "sender")
+        
+        text.insert("end", "{}\n".format(record['content']))
+        
+        msg_id = record.get('msg_id')
+        if msg_id and msg_id in self.reactions:
+            reactions = self.reactions[msg_id]
+            if reactions:
+                reaction_text = "   "
+                for emoji, users in reactions.items():
+                    reaction_text += "{} {} ".format(emoji, len(users))
+                text.insert("end", reaction_text + "\n", "reaction")
+    
+    def drop_first(self):
+        nxt = self.mark(self.first + 1)
+        self.text.delete("1.0", nxt)
+        self.text.mark_unset(self.mark(self.first))
+        self.first += 1
+    
+    def render(self, first, last, anchor=None, top=True):
+        """Vẽ lại các tin first..last, giữ tin anchor ở mép trên (hoặc dưới)"""
+        text = self.text
+        if self.first is not None:
+            text.mark_unset(*[self.mark(seq) for seq in range(self.first, self.last + 1)])
+        self.display.configure(state="normal")
+        text.delete("1.0", "end")
+        low, _ = self.seq_range()
+        self.first, self.last = (first, last) if low is not None else (None, None)
+        if low is not None:
+            for seq in range(first, last + 1):
+                self.insert(self.records[seq - low])
+        self.display.configure(state="disabled")
+        if anchor is None:
+            text.see("end")
+        elif top:
+            text.yview(self.mark(anchor))
+        else:
+            text.see(self.mark(anchor))
+    
+    def render_tail(self):
+        low, high = self.seq_range()
+        if low is None:
+            self.render(None, None)
+            return
+        self.render(max(low, high - self.window + 1), high)
+    
+    # ---- scrolling ----
+    
+    def on_yscroll(self, first, last):
+        if self.scroll_set:
+            self.text.tk.eval("{} {} {}".format(self.scroll_set, first, last))
+        if self.shift_job is None and self.first is not None:
+            if float(first) <= SCROLL_EDGE and float(last) < 1.0:
+                self.shift_job = self.text.after_idle(self.shift_older)
+            elif float(last) >= 1.0 - SCROLL_EDGE and float(first) > 0.0:
+                self.shift_job = self.text.after_idle(self.shift_newer)
+    
+    def shift_older(self):
+        self.shift_job = None
+        low, _ = self.seq_range()
+        if low is None or self.first is None or self.text.yview()[0] > SCROLL_EDGE:
+            return
+        if self.first > low:
+            first = max(low, self.first - self.step)
+            self.render(first, min(self.last, first + self.window - 1), anchor=self.first)
+        elif not self.exhausted and not self.loading and self.oldest_id() is not None:
+            self.loading = True
+            generation = self.generation
+            self.load_older(self.oldest_id(),
+                            lambda records: self.older_loaded(generation, records))
+    
+    def older_loaded(self, generation, records):
+        if generation != self.generation:
+            return
+        self.loading = False
+        if not records:
+            self.exhausted = True
+            return
+        self.prepend(records)
+        self.shift_older()
+    
+    def shift_newer(self):
+        self.shift_job = None
+        low, high = self.seq_range()
+        if high is None or self.last is None or self.text.yview()[1] < 1.0 - SCROLL_EDGE:
+            return
+        if self.last < high:
+            last = min(high, self.last + self.step)
+            self.render(max(low, self.first, last - self.window + 1), last,
+                        anchor=self.last, top=False)
+        elif self.detached and self.on_detached:
+            self.on_detached()
 
 
 class ChatGUI:
@@ -786,16 +1573,22 @@ class ChatGUI:
         self.dm_conversations = {}
         
         self.auto_refresh_job = None
+        self.sidebar_job = None
         self.typing_job = None
         self.typing_users_display = {}
         
         self.message_reactions = defaultdict(lambda: defaultdict(list))
-        self.all_messages = []
+        # channel -> history đã tải (có 'id'), để vào lại chỉ lấy phần delta
+        self.channel_history = {}
         
         # Selection tracking
         self.selected_channel_btn = None
         self.selected_user_btn = None
         
+        # Lời gọi mạng chạy trên worker, kết quả về lại Tk thread
+        self.tasks = TaskRunner(root)
+        self.tasks.start()
+        
         self.show_login_screen()
     
     def find_available_port(self, start_port=9002, max_attempts=100):
@@ -1003,71 +1796,61 @@ class ChatGUI:
             text_color=THEME.TEXT_SECONDARY
         ).pack(side="left", padx=5)
         
-        try:
+        status_indicator = ctk.CTkLabel(
+            status_frame,
+            text="●",
+            font=ctk.CTkFont(size=16),
+            text_color=THEME.TEXT_SECONDARY
+        )
+        status_indicator.pack(side="left")
+        
+        status_text = ctk.CTkLabel(
+            status_frame,
+            text="Checking...",
+            font=ctk.CTkFont(size=11, weight="bold"),
+            text_color=THEME.TEXT_SECONDARY
+        )
+        status_text.pack(side="left", padx=5)
+        
+        def fetch_health():
             data, status, _ = HTTPClient.request(
                 "GET", TRACKER_HOST, TRACKER_PORT, "/health"
             )
-            
-            if status == 200:
-                status_indicator = ctk.CTkLabel(
-                    status_frame,
-                    text="●",
-                    font=ctk.CTkFont(size=16),
-                    text_color=THEME.SUCCESS
-                )
-                status_indicator.pack(side="left")
-                
-                ctk.CTkLabel(
-                    status_frame,
-                    text="Online",
-                    font=ctk.CTkFont(size=11, weight="bold"),
-                    text_color=THEME.SUCCESS
-                ).pack(side="left", padx=5)
-                
-                try:
-                    health = json.loads(data.decode('utf-8'))
-                    info_text = "({} users, {} peers)".format(
-                        health.get('total_users', 0),
-                        health.get('peers_online', 0)
-                    )
-                    ctk.CTkLabel(
-                        status_frame,
-                        text=info_text,
-                        font=ctk.CTkFont(size=10),
-                        text_color=THEME.TEXT_SECONDARY
-                    ).pack(side="left")
-                except:
-                    pass
-            else:
-                status_indicator = ctk.CTkLabel(
-                    status_frame,
-                    text="●",
-                    font=ctk.CTkFont(size=16),
-                    text_color=THEME.ERROR
+            return data, status
+        
+        def show_status(result):
+            # Màn hình login có thể đã bị đóng trong lúc chờ
+            if not status_frame.winfo_exists():
+                return
+            data, status = result
+            if status != 200:
+                show_offline(None)
+                return
+            status_indicator.configure(text_color=THEME.SUCCESS)
+            status_text.configure(text="Online", text_color=THEME.SUCCESS)
+            try:
+                health = json.loads(data.decode('utf-8'))
+                info_text = "({} users, {} peers)".format(
+                    health.get('total_users', 0),
+                    health.get('peers_online', 0)
                 )
-                status_indicator.pack(side="left")
-                
                 ctk.CTkLabel(
                     status_frame,
-                    text="Offline",
-                    font=ctk.CTkFont(size=11, weight="bold"),
-                    text_color=THEME.ERROR
-                ).pack(side="left", padx=5)
-        except:
-            status_indicator = ctk.CTkLabel(
-                status_frame,
-                text="●",
-                font=ctk.CTkFont(size=16),
-                text_color=THEME.ERROR
-            )
-            status_indicator.pack(side="left")
-            
-            ctk.CTkLabel(
-                status_frame,
-                text="Offline",
-                font=ctk.CTkFont(size=11, weight="bold"),
-                text_color=THEME.ERROR
-            ).pack(side="left", padx=5)
+                    text=info_text,
+                    font=ctk.CTkFont(size=10),
+                    text_color=THEME.TEXT_SECONDARY
+                ).pack(side="left")
+            except:
+                pass
+        
+        def show_offline(error):
+            if not status_frame.winfo_exists():
+                return
+            status_indicator.configure(text_color=THEME.ERROR)
+            status_text.configure(text="Offline", text_color=THEME.ERROR)
+        
+        self.tasks.submit(fetch_health, on_done=show_status, on_error=show_offline,
+                          key="tracker-status")
     
     def auto_find_port(self):
         port = self.find_available_port()
@@ -1099,54 +1882,54 @@ class ChatGUI:
             )
             return
         
-        self.client = ChatClient(port, self.on_message_received)
+        self.client = client = ChatClient(port, self.on_message_received)
         
         self.status_label.configure(
             text="🔄 Starting P2P server...",
             text_color=THEME.PRIMARY
         )
-        self.root.update()
-        
-        self.status_label.configure(
-            text="🔄 Logging in...",
-            text_color=THEME.PRIMARY
+        self.tasks.submit(
+            self.connect_client, client, username, password,
+            on_done=lambda error: self.on_client_connected(client, error)
         )
-        self.root.update()
+    
+    def connect_client(self, client, username, password):
+        """
+        Đăng nhập, mở P2P server và đăng ký peer (chạy trên worker).
+        Trả về None nếu thành công, ngược lại là thông báo lỗi.
+        """
+        def progress(text):
+            self.tasks.post(self.status_label.configure, text=text, text_color=THEME.PRIMARY)
         
-        success, msg = self.client.login(username, password)
+        progress("🔄 Logging in...")
+        success, msg = client.login(username, password)
+        if not success:
+            return msg
         
-        if success:
-            if not self.client.start_p2p_server():
-                self.status_label.configure(
-                    text="✗ Port {} in use! Try another".format(port),
-                    text_color=THEME.ERROR
-                )
-                self.client = None
-                return
-            
-            self.status_label.configure(
-                text="🔄 Registering peer...",
-                text_color=THEME.PRIMARY
-            )
-            self.root.update()
-            
-            if not self.client.register_peer():
-                self.status_label.configure(
-                    text="✗ Failed to register",
-                    text_color=THEME.ERROR
-                )
-                if self.client.p2p_server:
-                    self.client.p2p_server.stop()
-                self.client = None
-                return
-            
-            self.client.update_peer_list()
+        if not client.start_p2p_server():
+            return "Port {} in use! Try another".format(client.my_port)
+        
+        progress("🔄 Registering peer...")
+        if not client.register_peer():
+            return "Failed to register"
+        
+        client.update_peer_list()
+        return None
+    
+    def on_client_connected(self, client, error):
+        if client is not self.client:
+            # Đã bấm login lại trong lúc chờ: bỏ client cũ bằng logout đầy
+            # đủ (dừng heartbeat và P2P server, xóa session trên tracker)
+            self.tasks.submit(client.logout)
+            return
+        if error is None:
             self.show_chat_screen()
-        else:
-            self.status_label.configure(text="✗ " + msg, text_color=THEME.ERROR)
-            if self.client and self.client.p2p_server:
-                self.client.p2p_server.stop()
-            self.client = None
+            return
+        self.status_label.configure(text="✗ " + error, text_color=THEME.ERROR)
+        client.heartbeat_stop.set()
+        if client.p2p_server:
+            client.p2p_server.stop()
+        self.client = None
     
     def do_register(self):
         username = self.username_entry.get().strip()
@@ -1163,17 +1946,19 @@ class ChatGUI:
             text="🔄 Registering...",
             text_color=THEME.PRIMARY
         )
-        self.root.update()
         
         payload = {'username': username, 'password': password}
         body = json.dumps(payload).encode('utf-8')
         headers = {"Content-type": "application/json"}
         
-        data, status, _ = HTTPClient.request(
-            "POST", TRACKER_HOST, TRACKER_PORT, "/register",
-            body_bytes=body, headers=headers
+        self.tasks.submit(
+            HTTPClient.request, "POST", TRACKER_HOST, TRACKER_PORT, "/register",
+            body_bytes=body, headers=headers,
+            on_done=self.on_registered
         )
-        
+    
+    def on_registered(self, result):
+        data, status, _ = result
         if status == 200:
             self.status_label.configure(
                 text="✓ Registration successful! Please login.",
@@ -1296,7 +2081,7 @@ class ChatGUI:
         )
         channels_scroll.grid(row=3, column=0, sticky="nsew", padx=15, pady=(0, 10))
         self.channels_container = channels_scroll
-        self.channel_buttons = []
+        self.channel_rows = SidebarList(self, channels_scroll, "channel", self.on_channel_click)
         
         # Add channel button
         add_channel_btn = ctk.CTkButton(
@@ -1338,7 +2123,7 @@ class ChatGUI:
         )
         users_scroll.grid(row=6, column=0, sticky="nsew", padx=15, pady=(0, 10))
         self.users_container = users_scroll
-        self.user_buttons = []
+        self.user_rows = SidebarList(self, users_scroll, "user", self.on_user_click)
         
         # Bottom action buttons
         btn_container = ctk.CTkFrame(sidebar, fg_color="transparent")
@@ -1511,6 +2296,8 @@ class ChatGUI:
             background="#FFD700",
             foreground="#000000"
         )
+        # Buffer vòng + cửa sổ vẽ của khung tin nhắn
+        self.messages = MessagePane(self.message_display, self.message_reactions)
         
         # Emoji bar with hover effects
         emoji_frame = ctk.CTkFrame(
@@ -1579,11 +2366,14 @@ class ChatGUI:
         self.join_channel("general")
         self.start_auto_refresh()
     
-    def create_list_item(self, parent, text, icon, on_click, item_type="channel"):
+    def create_list_item(self, parent, text, icon, on_click, item_type="channel", before=None):
         """Create a beautiful list item with indicator and hover effects"""
         # Container frame
         item_frame = ctk.CTkFrame(parent, fg_color="transparent", height=42)
-        item_frame.pack(fill="x", pady=2)
+        if before is not None:
+            item_frame.pack(fill="x", pady=2, before=before)
+        else:
+            item_frame.pack(fill="x", pady=2)
         item_frame.pack_propagate(False)
         
         # Left indicator bar (hidden by default)
@@ -1612,8 +2402,10 @@ class ChatGUI:
         
         # Store references
         btn._indicator = indicator
+        btn._frame = item_frame
         btn._item_type = item_type
         btn._item_text = text
+        btn._item_icon = icon
         
         return btn
     
@@ -1656,15 +2448,15 @@ class ChatGUI:
     
     def refresh_channels(self):
         """Refresh channel list with beautiful styling"""
-        for widget in self.channels_container.winfo_children():
-            widget.destroy()
-        self.channel_buttons = []
-        
-        channels = self.client.get_channel_list()
-        
-        # Track current channel to restore selection
-        current_ch = self.current_channel if self.current_view == "channel" else None
+        # Chỉ giữ lần tải mới nhất; vẽ lại khi có kết quả
+        self.tasks.submit(self.client.get_channel_list,
+                          on_done=self.render_channels, key="channels")
+    
+    def render_channels(self, channels):
+        if not self.client:
+            return
         
+        rows = []
         for ch in channels:
             is_private = ch.get('is_private', False)
             unread = self.client.unread_messages_channel.get(ch['name'], 0)
@@ -1681,41 +2473,34 @@ class ChatGUI:
             else:
                 icon = "#"
             
-            # Create button with click handler
-            btn = self.create_list_item(
-                self.channels_container,
-                ch['name'] if icon != "💬" else ch['name'] + " [{}]".format(unread),
+            rows.append((
+                ch['name'],
                 icon,
-                lambda name=ch['name']: self.on_channel_click(name),
-                "channel"
-            )
-            btn._channel_name = ch['name']
-            self.channel_buttons.append(btn)
-            
-            # Restore selection if this was the current channel
-            if current_ch and ch['name'] == current_ch:
+                ch['name'] if icon != "💬" else ch['name'] + " [{}]".format(unread)
+            ))
+        
+        rows_before = set(self.channel_rows.rows)
+        self.channel_rows.update(rows)
+        for name in set(self.channel_rows.rows) - rows_before:
+            # Menu chuột phải; chỉ owner mới thấy mục quản lý
+            self.channel_rows.get(name).bind(
+                "<Button-3>", lambda e, name=name: self.show_channel_context_menu(e, name))
+        
+        # Restore selection if this is the current channel
+        if self.current_view == "channel":
+            btn = self.channel_rows.get(self.current_channel)
+            if btn is not None and btn is not self.selected_channel_btn:
                 self.select_list_item(btn, "channel")
-            
-            # Add right-click menu for private channels
-            if is_private and (is_owner or is_member):
-                btn.bind("<Button-3>", lambda e, name=ch['name']: self.show_channel_context_menu(e, name))
     
     def refresh_users(self):
         """Refresh user list with beautiful styling"""
-        for widget in self.users_container.winfo_children():
-            widget.destroy()
-        self.user_buttons = []
-        
-        self.client.update_peer_list()
-        
         with self.client.lock:
-            users = sorted(self.client.peer_list.keys())
-        
-        # Track current DM user to restore selection
-        current_dm = self.client.current_dm_user if self.current_view == "dm" else None
+            peers = {user: list(sessions) for user, sessions in self.client.peer_list.items()}
+        users = sorted(peers.keys())
         
+        rows = []
         for user in users:
-            session_count = len(self.client.peer_list[user])
+            session_count = len(peers[user])
             unread = self.client.unread_messages.get(user, 0)
             
             # Build display text
@@ -1731,24 +2516,18 @@ class ChatGUI:
                 else:
                     display_text = user
                 icon = "👤"
-            
-            # Create button
-            btn = self.create_list_item(
-                self.users_container,
-                display_text,
-                icon,
-                lambda u=user: self.on_user_click(u),
-                "user"
-            )
-            btn._username = user
-            self.user_buttons.append(btn)
-            
-            # Restore selection if this was the current DM user
-            if current_dm and user == current_dm:
+            rows.append((user, icon, display_text))
+        
+        self.user_rows.update(rows)
+        
+        # Restore selection if this is the current DM user
+        if self.current_view == "dm":
+            btn = self.user_rows.get(self.client.current_dm_user)
+            if btn is not None and btn is not self.selected_user_btn:
                 self.select_list_item(btn, "user")
         
         # Update counts
-        total_sessions = sum(len(sessions) for sessions in self.client.peer_list.values())
+        total_sessions = sum(len(sessions) for sessions in peers.values())
         
         if len(users) > 0:
             self.peer_count_label.configure(
@@ -1759,32 +2538,45 @@ class ChatGUI:
             self.peer_count_label.configure(text="No users online")
             self.online_count_label.configure(text="(0)")
     
+    def schedule_sidebar_update(self):
+        """Gom các thay đổi unread trong một frame thành một lần vẽ lại"""
+        if self.sidebar_job is None:
+            self.sidebar_job = self.root.after(SIDEBAR_FRAME, self.flush_sidebars)
+    
+    def flush_sidebars(self):
+        # Vẽ lại từ dữ liệu đã có, không gọi tracker
+        self.sidebar_job = None
+        if not self.client:
+            return
+        self.render_channels(self.client.channel_list)
+        self.refresh_users()
+    
     def on_channel_click(self, channel_name):
         """Handle channel selection"""
-        # Find and select button
-        for btn in self.channel_buttons:
-            if hasattr(btn, '_channel_name') and btn._channel_name == channel_name:
-                self.select_list_item(btn, "channel")
-                break
+        btn = self.channel_rows.get(channel_name)
+        if btn is not None:
+            self.select_list_item(btn, "channel")
         
         # Join channel
         self.join_channel(channel_name)
     
     def on_user_click(self, username):
         """Handle user selection"""
-        # Find and select button
-        for btn in self.user_buttons:
-            if hasattr(btn, '_username') and btn._username == username:
-                self.select_list_item(btn, "user")
-                break
+        btn = self.user_rows.get(username)
+        if btn is not None:
+            self.select_list_item(btn, "user")
         
         # Open DM
         self.open_dm(username)
     
     def refresh_all(self):
         self.refresh_channels()
-        self.refresh_users()
-        self.display_message("System", "✓ Lists refreshed", "system")
+        
+        def refreshed(_):
+            self.refresh_users()
+            self.display_message("System", "✓ Lists refreshed", "system")
+        
+        self.tasks.submit(self.client.update_peer_list, on_done=refreshed, key="peers")
     
     def show_channel_context_menu(self, event, channel_name):
         perms = self.client.channel_permissions.get(channel_name, {})
@@ -1802,9 +2594,29 @@ class ChatGUI:
                 menu.grab_release()
     
     def join_channel(self, channel):
-        has_access, error_msg = self.client.check_channel_access(channel, force_refresh=True)
+        # Kiểm tra quyền và tải lịch sử trên worker; đổi view lần nữa trước
+        # khi xong thì kết quả này bị bỏ
+        self.tasks.submit(
+            self.fetch_channel, self.client, channel, self.channel_history.get(channel),
+            on_done=lambda result: self.show_channel(channel, *result),
+            key="view"
+        )
+    
+    def fetch_channel(self, client, channel, cached):
+        """Chạy trên worker: trả về (has_access, error_msg, history)"""
+        has_access, error_msg = client.check_channel_access(channel)
+        if not has_access:
+            return has_access, error_msg, []
+        
+        history = self.fetch_channel_history(client, channel, cached)
         
+        if not history and client.channel_permissions.get(channel, {}).get('is_private'):
+            has_access, error_msg = client.check_channel_access(channel)
+        return has_access, error_msg, history
+    
+    def show_channel(self, channel, has_access, error_msg, history):
         if not has_access:
+            self.channel_history.pop(channel, None)
             messagebox.showerror("Access Denied", "🔒 " + error_msg)
             if channel == self.current_channel:
                 self.display_message("System", 
@@ -1818,8 +2630,11 @@ class ChatGUI:
         self.client.current_channel = channel
         self.client.unread_messages_channel[channel] = 0
         self.client.current_dm_user = None
+        self.client.typing.stop()
+        self.update_typing_display()
+        self.channel_history[channel] = history
         
-        self.root.after(0, self.refresh_channels)
+        self.refresh_channels()
         
         perms = self.client.channel_permissions.get(channel, {})
         is_private = perms.get('is_private', False)
@@ -1837,32 +2652,13 @@ class ChatGUI:
         else:
             self.channel_lock_icon.configure(text="")
         
-        self.message_display.configure(state="normal")
-        self.message_display.delete("1.0", "end")
-        self.message_display.configure(state="disabled")
-        
-        self.all_messages = []
-        
-        history = self.client.get_channel_history(channel)
-        
-        if not history and is_private:
-            has_access, error_msg = self.client.check_channel_access(channel, force_refresh=True)
-            if not has_access:
-                messagebox.showerror("Access Denied", "🔒 " + error_msg)
-                self.join_channel("general")
-                return
-        
-        for msg in history:
-            sender = msg['username']
-            if sender == self.client.username:
-                sender = "You"
-            
-            self.display_message(
-                sender,
-                msg['content'],
-                "channel",
-                timestamp=msg.get('timestamp', '')
-            )
+        # Cuộn lên đầu thì tải trang cũ hơn (before_id); đã bỏ bớt tin mới
+        # để chứa trang cũ thì cuộn xuống cuối sẽ vào lại channel
+        self.messages.reset(
+            [self.history_record(msg) for msg in history],
+            load_older=self.older_history_loader(channel),
+            on_detached=lambda: self.join_channel(channel)
+        )
         
         if is_private:
             if perms.get('owner') == self.client.username:
@@ -1870,6 +2666,20 @@ class ChatGUI:
             else:
                 self.display_message("System", "🔓 Private channel (Member access)", "system")
     
+    def fetch_channel_history(self, client, channel, cached):
+        """
+        Lịch sử của channel: lần đầu tải trang mới nhất, các lần sau chỉ tải
+        các tin có id lớn hơn tin cuối đã thấy (cached) và nối vào.
+        """
+        if not cached or 'id' not in cached[-1]:
+            return client.get_channel_history(channel)
+        delta = client.get_channel_history(
+            channel, after_id=cached[-1]['id'], limit=HISTORY_PAGE_SIZE)
+        if len(delta) >= HISTORY_PAGE_SIZE:
+            # Vắng mặt quá lâu: bỏ cache, tải lại trang mới nhất
+            return client.get_channel_history(channel)
+        return (cached + delta)[-HISTORY_PAGE_SIZE:]
+
     def open_dm(self, username):
         self.current_view = "dm"
         self.client.current_dm_user = username
@@ -1878,31 +2688,55 @@ class ChatGUI:
         self.client.current_channel = None
         
         self.client.unread_messages[username] = 0
+        self.client.typing.stop()
+        self.update_typing_display()
         self.refresh_users()
         
         self.channel_label.configure(text="@ " + username)
         self.channel_lock_icon.configure(text="")
         
-        self.message_display.configure(state="normal")
-        self.message_display.delete("1.0", "end")
-        self.message_display.configure(state="disabled")
-        
-        self.all_messages = []
+        self.messages.reset()
         
-        history = self.client.get_dm_history(username)
+        if username not in self.dm_conversations:
+            self.dm_conversations[username] = []
         
+        self.tasks.submit(self.client.get_dm_history, username,
+                          on_done=self.show_dm_history, key="view")
+    
+    def show_dm_history(self, history):
+        records = []
         for msg in history:
             sender = msg.get('sender', '')
             content = msg.get('content', '')
             timestamp = msg.get('timestamp', '')
             
             if sender == self.client.username:
-                self.display_message("You", content, "dm_sent", timestamp=timestamp)
+                records.append(self.make_record("You", content, "dm_sent", timestamp=timestamp))
             else:
-                self.display_message(sender, content, "dm_recv", timestamp=timestamp)
-        
-        if username not in self.dm_conversations:
-            self.dm_conversations[username] = []
+                records.append(self.make_record(sender, content, "dm_recv", timestamp=timestamp))
+        # Giữ các tin đã đến trong lúc chờ tải lịch sử
+        self.messages.reset(records + list(self.messages.records))
+    
+    def history_record(self, msg):
+        """Record của MessagePane từ một tin của /get-history/"""
+        sender = msg['username']
+        if sender == self.client.username:
+            sender = "You"
+        record = self.make_record(sender, msg['content'], "channel",
+                                  timestamp=msg.get('timestamp', ''))
+        record['id'] = msg.get('id')
+        return record
+    
+    def older_history_loader(self, channel):
+        client = self.client
+        
+        def load(before_id, done):
+            self.tasks.submit(
+                client.get_channel_history, channel,
+                before_id=before_id, limit=HISTORY_PAGE_SIZE,
+                on_done=lambda page: done([self.history_record(msg) for msg in page])
+            )
+        return load
     
     def create_channel_dialog(self):
         dialog = ctk.CTkToplevel(self.root)
@@ -2058,14 +2892,20 @@ class ChatGUI:
             is_private = is_private_var.get()
             
             if name:
-                if self.client.create_channel(name, topic, is_private, selected_members):
-                    self.refresh_channels()
-                    dialog.destroy()
-                    icon = "🔒" if is_private else "✅"
-                    member_info = " with {} members".format(len(selected_members)) if len(selected_members) > 1 else ""
-                    messagebox.showinfo("Success", "{} Channel '{}' created!{}".format(icon, name, member_info))
-                else:
-                    messagebox.showerror("Error", "✗ Failed to create channel")
+                members = list(selected_members)
+                
+                def created(success):
+                    if success:
+                        self.refresh_channels()
+                        dialog.destroy()
+                        icon = "🔒" if is_private else "✅"
+                        member_info = " with {} members".format(len(members)) if len(members) > 1 else ""
+                        messagebox.showinfo("Success", "{} Channel '{}' created!{}".format(icon, name, member_info))
+                    else:
+                        messagebox.showerror("Error", "✗ Failed to create channel")
+                
+                self.tasks.submit(self.client.create_channel, name, topic, is_private,
+                                  members, on_done=created)
         
         create_btn = ctk.CTkButton(
             btn_container,
@@ -2094,11 +2934,10 @@ class ChatGUI:
         cancel_btn.pack(side="left", padx=5)
     
     def show_broadcast_dialog(self):
-        has_access, error_msg = self.client.check_channel_access(
-            self.current_channel,
-            force_refresh=True
-        )
-        
+        self.tasks.submit(self.client.check_channel_access, self.current_channel,
+                          on_done=lambda result: self.open_broadcast_dialog(*result))
+    
+    def open_broadcast_dialog(self, has_access, error_msg):
         if not has_access:
             messagebox.showerror("Access Denied", 
                 "🔒 Cannot broadcast to #{}: {}".format(self.current_channel, error_msg))
@@ -2190,25 +3029,36 @@ class ChatGUI:
                 )
                 return
             
-            has_access, error_msg = self.client.check_channel_access(
-                self.current_channel,
-                force_refresh=True
+            status_label.configure(
+                text="📤 Broadcasting to channel...",
+                text_color=THEME.PRIMARY
             )
             
-            if not has_access:
+            channel = self.current_channel
+            client = self.client
+            
+            def broadcast():
+                has_access, error_msg = client.check_channel_access(channel)
+                if not has_access:
+                    return error_msg, None
+                return None, client.send_broadcast(message, channel)
+            
+            self.tasks.submit(broadcast, on_done=lambda result: broadcast_done(channel, message, *result))
+        
+        def broadcast_done(channel, message, error_msg, result):
+            if error_msg is not None:
                 messagebox.showerror("Access Denied", "🔒 " + error_msg)
                 dialog.destroy()
                 return
             
-            status_label.configure(
-                text="📤 Broadcasting to channel...",
-                text_color=THEME.PRIMARY
-            )
-            dialog.update()
+            sent_count, total_peers, failed_users, msg_id = result
             
-            sent_count, total_peers, failed_users, msg_id = self.client.send_broadcast(
-                message, self.current_channel
-            )
+            if sent_count is None:
+                status_label.configure(
+                    text="⚠️ Broadcast may not have been delivered (tracker error)",
+                    text_color=THEME.WARNING
+                )
+                return
             
             if sent_count == 0 and total_peers == 0:
                 status_label.configure(
@@ -2216,12 +3066,13 @@ class ChatGUI:
                     text_color=THEME.SUCCESS
                 )
             
-            self.display_message(
-                "You (BROADCAST)", 
-                message, 
-                "broadcast", 
-                msg_id=msg_id
-            )
+            if self.current_view == "channel" and self.current_channel == channel:
+                self.display_message(
+                    "You (BROADCAST)", 
+                    message, 
+                    "broadcast", 
+                    msg_id=msg_id
+                )
             
             if sent_count == total_peers:
                 status_label.configure(
@@ -2236,7 +3087,7 @@ class ChatGUI:
             
             show_desktop_notification(
                 "📢 Broadcast Sent",
-                "Message sent to {} peers in #{}".format(sent_count, self.current_channel)
+                "Message sent to {} peers in #{}".format(sent_count, channel)
             )
             
             dialog.after(1500, dialog.destroy)
@@ -2342,12 +3193,16 @@ class ChatGUI:
             update_member_selection()
         
         def refresh_members():
+            self.tasks.submit(self.client.get_channel_members, channel_name,
+                              on_done=render_members, key="members")
+        
+        def render_members(members_data):
+            if not dialog.winfo_exists():
+                return
             for widget in members_scroll.winfo_children():
                 widget.destroy()
             member_buttons.clear()
             
-            members_data = self.client.get_channel_members(channel_name)
-            
             owner = members_data.get('owner')
             if owner:
                 owner_btn = ctk.CTkButton(
@@ -2413,15 +3268,19 @@ class ChatGUI:
                 messagebox.showwarning("Warning", "⚠️ Please enter a username")
                 return
             
-            success, msg = self.client.add_channel_member(channel_name, username)
-            if success:
-                messagebox.showinfo("Success", "✅ " + msg)
-                username_entry.delete(0, "end")
-                selected_member.set("")
-                refresh_members()
-                self.refresh_channels()
-            else:
-                messagebox.showerror("Error", "✗ " + msg)
+            def added(result):
+                success, msg = result
+                if success:
+                    messagebox.showinfo("Success", "✅ " + msg)
+                    username_entry.delete(0, "end")
+                    selected_member.set("")
+                    refresh_members()
+                    self.refresh_channels()
+                else:
+                    messagebox.showerror("Error", "✗ " + msg)
+            
+            self.tasks.submit(self.client.add_channel_member, channel_name, username,
+                              on_done=added)
         
         username_entry.bind('<Return>', lambda e: add_member())
         
@@ -2446,14 +3305,18 @@ class ChatGUI:
                 return
             
             if messagebox.askyesno("Confirm", "Remove {} from channel?".format(member_to_remove)):
-                success, msg = self.client.remove_channel_member(channel_name, member_to_remove)
-                if success:
-                    messagebox.showinfo("Success", "✅ " + msg)
-                    selected_member.set("")
-                    refresh_members()
-                    self.refresh_channels()
-                else:
-                    messagebox.showerror("Error", "✗ " + msg)
+                def removed(result):
+                    success, msg = result
+                    if success:
+                        messagebox.showinfo("Success", "✅ " + msg)
+                        selected_member.set("")
+                        refresh_members()
+                        self.refresh_channels()
+                    else:
+                        messagebox.showerror("Error", "✗ " + msg)
+                
+                self.tasks.submit(self.client.remove_channel_member, channel_name,
+                                  member_to_remove, on_done=removed)
         
         # Buttons
         btn_frame = ctk.CTkFrame(content, fg_color="transparent")
@@ -2499,7 +3362,10 @@ class ChatGUI:
             return
         
         found_count = 0
-        for msg_data in self.all_messages:
+        # Chỉ các tin đang được vẽ trong khung
+        for msg_data in self.messages.visible_records():
+            if not msg_data.get('search'):
+                continue
             content = msg_data.get('content', '').lower()
             if query.lower() in content:
                 start_pos = "1.0"
@@ -2528,19 +3394,22 @@ class ChatGUI:
         if found_count > 0:
             self.show_notification("🔍 Found {} matches".format(found_count))
     
-    def _on_typing(self, event):
-        if self.typing_job:
-            self.root.after_cancel(self.typing_job)
-        
-        if self.current_view == "channel":
-            self.client.send_typing_indicator()
-        elif self.current_view == "dm":
-            self.client.send_typing_indicator(self.client.current_dm_user)
-        
-        self.typing_job = self.root.after(2000, self.clear_typing_indicator)
+    def current_conversation(self):
+        if self.current_view == "dm" and self.client.current_dm_user:
+            return ("dm", self.client.current_dm_user)
+        if self.current_view == "channel" and self.current_channel:
+            return ("channel", self.current_channel)
+        return None
     
-    def clear_typing_indicator(self):
-        pass
+    def _on_typing(self, event):
+        # Chỉ ghi nhận vào TypingNotifier; việc gửi do thread riêng đảm nhận
+        conversation = self.current_conversation()
+        if conversation is None:
+            return
+        if self.message_entry.get().strip():
+            self.client.typing.keystroke(conversation)
+        else:
+            self.client.typing.stop(conversation)
     
     def insert_emoji(self, emoji):
         current_text = self.message_entry.get()
@@ -2553,66 +3422,94 @@ class ChatGUI:
         if not message:
             return
         
+        client = self.client
+        # ordered: các tin gửi lần lượt, đúng thứ tự người dùng nhập
         if self.current_view == "channel":
-            has_access, error_msg = self.client.check_channel_access(
-                self.current_channel, 
-                force_refresh=True
-            )
-            
-            if not has_access:
-                messagebox.showerror("Access Denied", "🔒 " + error_msg)
-                self.display_message("System", 
-                    "⚠️ Cannot send: {}".format(error_msg), 
-                    "system")
-                self.join_channel("general")
-                return
+            channel = self.current_channel
             
-            sent_count, msg_id = self.client.send_message(message, self.current_channel)
+            def send():
+                has_access, error_msg = client.check_channel_access(channel)
+                if not has_access:
+                    return error_msg, None
+                return None, client.send_message(message, channel)
             
-            if sent_count == -1:
-                messagebox.showerror("Access Denied", 
-                    "🔒 You no longer have access to this channel")
-                self.display_message("System", 
-                    "⚠️ Message not sent: Access denied", 
-                    "system")
-                self.join_channel("general")
-                return
-            
-            self.display_message("You", message, "channel", msg_id=msg_id)
+            self.tasks.submit(
+                send, ordered=True,
+                on_done=lambda result: self.on_channel_message_sent(channel, message, *result)
+            )
         else:
-            target = self.client.current_dm_user
-            success, msg, msg_id = self.client.send_dm(target, message)
-            
-            if success:
-                if target not in self.dm_conversations:
-                    self.dm_conversations[target] = []
-                self.dm_conversations[target].append(
-                    (self.client.username, message)
-                )
-                self.display_message("You", message, "dm_sent", msg_id=msg_id)
-            else:
-                self.display_message("System", "✗ Failed: " + msg, "system")
+            target = client.current_dm_user
+            self.tasks.submit(
+                client.send_dm, target, message, ordered=True,
+                on_done=lambda result: self.on_dm_sent(target, message, *result)
+            )
         
         self.message_entry.delete(0, "end")
+        self.client.typing.stop()
+    
+    def on_channel_message_sent(self, channel, message, error_msg, result):
+        if error_msg is not None:
+            messagebox.showerror("Access Denied", "🔒 " + error_msg)
+            self.display_message("System", 
+                "⚠️ Cannot send: {}".format(error_msg), 
+                "system")
+            self.join_channel("general")
+            return
+        
+        sent_count, msg_id = result
+        
+        if sent_count is None:
+            self.display_message("System", 
+                "⚠️ Message may not have been delivered (tracker error)", 
+                "system")
+            return
+        
+        if sent_count == -1:
+            messagebox.showerror("Access Denied", 
+                "🔒 You no longer have access to this channel")
+            self.display_message("System", 
+                "⚠️ Message not sent: Access denied", 
+                "system")
+            self.join_channel("general")
+            return
+        
+        if self.current_view == "channel" and self.current_channel == channel:
+            self.display_message("You", message, "channel", msg_id=msg_id)
+    
+    def on_dm_sent(self, target, message, success, msg, msg_id):
+        if success:
+            if target not in self.dm_conversations:
+                self.dm_conversations[target] = []
+            self.dm_conversations[target].append(
+                (self.client.username, message)
+            )
+            if self.current_view == "dm" and self.client.current_dm_user == target:
+                self.display_message("You", message, "dm_sent", msg_id=msg_id)
+        else:
+            self.display_message("System", "✗ Failed: " + msg, "system")
     
     def on_message_received(self, channel, sender, message, msg_type='channel', **kwargs):
+        # Gọi từ thread của P2P server: xử lý trên Tk thread
+        self.tasks.post(self.handle_message, channel, sender, message, msg_type, **kwargs)
+    
+    def handle_message(self, channel, sender, message, msg_type='channel', **kwargs):
         print("Message received: [{}] {}: {}, {}".format(channel, sender, message, msg_type))
+        if not self.client:
+            return
         if msg_type == 'typing':
-            self.show_typing_indicator(sender)
+            self.show_typing_indicator(sender, kwargs.get('conversation'),
+                                       kwargs.get('expires_in', TYPING_TTL))
         elif msg_type == 'reaction':
             msg_id = kwargs.get('msg_id', '')
             self.show_reaction(msg_id, sender, message)
         elif msg_type == 'broadcast':
             msg_id = kwargs.get('msg_id', '')
-            self.root.after(
-                0,
-                lambda: self.display_message(
-                    sender + " (BROADCAST from #{})".format(channel), 
-                    message, 
-                    "broadcast", 
-                    msg_id=msg_id,
-                    save_to_history=False  # Không lưu vào lịch sử
-                )
+            self.display_message(
+                sender + " (BROADCAST from #{})".format(channel), 
+                message, 
+                "broadcast", 
+                msg_id=msg_id,
+                save_to_history=False  # Không lưu vào lịch sử
             )
             show_desktop_notification("📢 Broadcast from #{}".format(channel), "{}: {}".format(sender, message[:50]))
         elif msg_type == 'dm':
@@ -2622,48 +3519,64 @@ class ChatGUI:
             
             if self.current_view == 'dm' and self.client.current_dm_user == sender:
                 msg_id = kwargs.get('msg_id', '')
-                self.root.after(
-                    0,
-                    lambda: self.display_message(sender, message, "dm_recv", msg_id=msg_id)
-                )
+                self.display_message(sender, message, "dm_recv", msg_id=msg_id)
                 self.client.unread_messages[sender] = 0
             else:
-                self.root.after(
-                    0,
-                    lambda: show_desktop_notification("💬 New DM", "{}: {}".format(sender, message[:50]))
-                )
-                self.root.after(0, self.refresh_users)
+                show_desktop_notification("💬 New DM", "{}: {}".format(sender, message[:50]))
+                self.schedule_sidebar_update()
         else:
             if channel == self.current_channel and self.current_view == 'channel':
                 msg_id = kwargs.get('msg_id', '')
-                self.root.after(
-                    0,
-                    lambda: self.display_message(sender, message, "channel", msg_id=msg_id)
-                )
+                self.display_message(sender, message, "channel", msg_id=msg_id)
             elif (self.current_view == 'channel' and  channel != self.current_channel) or self.current_view != 'channel':
-                self.root.after(
-                    0,
-                    lambda: show_desktop_notification("📨 New Message in #{}".format(channel), "{}: {}".format(sender, message[:50]))
-                )
-                self.root.after(0, self.refresh_channels)
+                show_desktop_notification("📨 New Message in #{}".format(channel), "{}: {}".format(sender, message[:50]))
+                if self.channel_rows.get(channel) is None:
+                    # Channel chưa có trong sidebar: tải lại danh sách
+                    self.refresh_channels()
+                else:
+                    self.schedule_sidebar_update()
     
-    def show_typing_indicator(self, username):
-        self.client.typing_users.add(username)
+    def show_typing_indicator(self, username, conversation=None, expires_in=TYPING_TTL):
+        """
+        Áp dụng một edge typing: username đang gõ trong conversation tới khi
+        hết expires_in giây (0 = đã ngừng gõ).
+        """
+        try:
+            expires_in = min(float(expires_in), TYPING_TTL * 2)
+        except (TypeError, ValueError):
+            expires_in = TYPING_TTL
+        if expires_in > 0:
+            self.client.typing_users[username] = (conversation, time.monotonic() + expires_in)
+        else:
+            self.client.typing_users.pop(username, None)
+        self.update_typing_display()
+    
+    def expire_typing_users(self):
+        self.typing_job = None
         self.update_typing_display()
-        
-        def clear_typing():
-            if username in self.client.typing_users:
-                self.client.typing_users.discard(username)
-                self.update_typing_display()
-        
-        self.root.after(3000, clear_typing)
     
     def update_typing_display(self):
-        if not self.client.typing_users:
+        # Bỏ các entry đã hết hạn, hẹn MỘT timer tới hạn gần nhất
+        now = time.monotonic()
+        typing_users = self.client.typing_users
+        for username, (_, deadline) in list(typing_users.items()):
+            if deadline <= now:
+                del typing_users[username]
+        if self.typing_job:
+            self.root.after_cancel(self.typing_job)
+            self.typing_job = None
+        if typing_users:
+            next_deadline = min(deadline for _, deadline in typing_users.values())
+            self.typing_job = self.root.after(
+                max(1, int((next_deadline - now) * 1000)), self.expire_typing_users)
+        
+        current = self.current_conversation()
+        users = [username for username, (conversation, _) in typing_users.items()
+                 if conversation is None or conversation == current]
+        if not users:
             self.typing_label.configure(text="")
             return
         
-        users = list(self.client.typing_users)
         if len(users) == 1:
             text = "   {} is typing...".format(users[0])
         elif len(users) == 2:
@@ -2693,77 +3606,78 @@ class ChatGUI:
         except:
             pass
     
-    def display_message(self, sender, message, msg_type="channel", timestamp="", msg_id=None, save_to_history=True):
-        self.message_display.configure(state="normal")
-        
+    def make_record(self, sender, message, msg_type="channel", timestamp="", msg_id=None, save_to_history=True):
         if msg_type == "system":
-            self.message_display._textbox.insert(
-                "end",
-                "ℹ️ [System] {}\n".format(message),
-                "system"
-            )
+            time_str = ""
+        elif timestamp:
+            time_str = parse_timestamp(timestamp)
         else:
-            if timestamp:
-                time_str = parse_timestamp(timestamp)
-            else:
-                time_str = get_current_time()
-            
-            self.message_display._textbox.insert("end", "[", "timestamp")
-            self.message_display._textbox.insert("end", time_str, "timestamp")
-            self.message_display._textbox.insert("end", "] ", "timestamp")
-            
-            if msg_type in ["dm_sent", "dm_recv"]:
-                self.message_display._textbox.insert("end", "{}: ".format(sender), msg_type)
-            elif msg_type == "broadcast":
-                self.message_display._textbox.insert("end", "{}: ".format(sender), "broadcast")
-            else:
-                self.message_display._textbox.insert("end", "{}: ".format(sender), "sender")
-            
-            self.message_display._textbox.insert("end", "{}\n".format(message))
-            
-            # CHỈ lưu vào all_messages nếu save_to_history = True
-            if save_to_history:
-                self.all_messages.append({
-                    'sender': sender,
-                    'content': message,
-                    'type': msg_type,
-                    'timestamp': time_str
-                })
-            
-            if msg_id and msg_id in self.message_reactions:
-                reactions = self.message_reactions[msg_id]
-                if reactions:
-                    reaction_text = "   "
-                    for emoji, users in reactions.items():
-                        reaction_text += "{} {} ".format(emoji, len(users))
-                    self.message_display._textbox.insert("end", reaction_text + "\n", "reaction")
-        
-        self.message_display.configure(state="disabled")
-        self.message_display._textbox.see("end")
+            time_str = get_current_time()
+        return {
+            'sender': sender,
+            'content': message,
+            'type': msg_type,
+            'time_str': time_str,
+            'msg_id': msg_id,
+            # CHỈ tìm kiếm trong các tin save_to_history = True
+            'search': save_to_history and msg_type != "system"
+        }
     
-    def start_auto_refresh(self):
-        def auto_refresh():
-            if self.client:
-                joined, left = self.client.update_peer_list()
-
-                if joined or left:
-                    self.refresh_users()
+    def display_message(self, sender, message, msg_type="channel", timestamp="", msg_id=None, save_to_history=True):
+        self.messages.append(self.make_record(
+            sender, message, msg_type, timestamp, msg_id, save_to_history))
+    
+    def on_presence_change(self, joined, left):
+        if not self.client:
+            return
+        self.refresh_users()
 
-                    for user in joined:
-                        self.display_message("System", "✅ {} joined".format(user), "system")
-                        show_desktop_notification("👋 User Joined", "{} is now online".format(user))
+        for user in joined:
+            self.display_message("System", "✅ {} joined".format(user), "system")
+            show_desktop_notification("👋 User Joined", "{} is now online".format(user))
 
-                    for user in left:
-                        self.display_message("System", "✗ {} left".format(user), "system")
+        for user in left:
+            self.display_message("System", "✗ {} left".format(user), "system")
 
-                self.auto_refresh_job = self.root.after(
-                    AUTO_REFRESH_INTERVAL,
-                    auto_refresh
-                )
+    def start_auto_refresh(self):
+        # Tracker đẩy thay đổi qua long-poll /presence/; callback chạy trên
+        # thread presence nên chuyển về UI thread bằng self.tasks.post
+        client = self.client
+        if not client:
+            return
+        self.tasks.submit(
+            client.watch_presence,
+            lambda joined, left: self.tasks.post(self.on_presence_change, joined, left),
+            on_done=lambda watching: self.on_presence_started(client, watching)
+        )
+    
+    def on_presence_started(self, client, watching):
+        if client is not self.client:
+            return
+        if watching:
+            self.refresh_users()
+            return
+        
+        # Tracker cũ: poll /get-list/ mỗi AUTO_REFRESH_INTERVAL
+        def refreshed(result):
+            joined, left = result
+            if joined or left:
+                self.on_presence_change(joined, left)
+            self.auto_refresh_job = self.root.after(AUTO_REFRESH_INTERVAL, auto_refresh)
+        
+        def auto_refresh():
+            self.auto_refresh_job = None
+            if self.client is client:
+                self.tasks.submit(client.update_peer_list, on_done=refreshed, key="peers")
         
         auto_refresh()
     
     def stop_auto_refresh(self):
+        if self.client:
+            self.client.presence_stop.set()
+        if self.sidebar_job:
+            self.root.after_cancel(self.sidebar_job)
+            self.sidebar_job = None
         if self.auto_refresh_job:
             self.root.after_cancel(self.auto_refresh_job)
             self.auto_refresh_job = None
@@ -2771,10 +3685,13 @@ class ChatGUI:
     def do_logout(self):
         if messagebox.askyesno("Logout", "Are you sure you want to logout?"):
             self.stop_auto_refresh()
-            if self.client:
-                if self.client.p2p_server:
-                    self.client.p2p_server.stop()
-                self.client.logout()
+            self.tasks.cancel_all()
+            client, self.client = self.client, None
+            if client:
+                if client.p2p_server:
+                    client.p2p_server.stop()
+                # Báo tracker trên worker, không giữ cửa sổ
+                self.tasks.submit(client.logout)
             self.show_login_screen()
     
     def clear_window(self):
@@ -2803,9 +3720,12 @@ def main():
         if app.client:
             if messagebox.askyesno("Exit", "Are you sure you want to exit?"):
                 app.stop_auto_refresh()
+                app.tasks.stop()
+                # Thoát: logout đồng bộ để tracker kịp nhận trước khi tắt
                 app.client.logout()
                 root.destroy()
         else:
+            app.tasks.stop()
             root.destroy()
     
     root.protocol("WM_DELETE_WINDOW", on_closing)
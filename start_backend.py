@@ -135,6 +135,36 @@ if __name__ == "__main__":
         default=PORT,
         help='Port number to bind the server. Default is {}.'.format(PORT)
     )
+    parser.add_argument(
+        '--mode',
+        choices=['thread', 'eventloop'],
+        default='thread',
+        help='Serving mode: one thread per connection or a selectors event loop.'
+    )
+    parser.add_argument(
+        '--backlog',
+        type=int,
+        default=50,
+        help='Length of the listen queue. Default is 50.'
+    )
+    parser.add_argument(
+        '--workers',
+        type=int,
+        default=1,
+        help='Serving processes sharing the port. Default is 1.'
+    )
+    parser.add_argument(
+        '--pool-size',
+        type=int,
+        default=0,
+        help='Connection worker threads in thread mode. Default 0 spawns one thread per connection.'
+    )
+    parser.add_argument(
+        '--queue-size',
+        type=int,
+        default=128,
+        help='Connections waiting for a worker before 503 is returned. Default is 128.'
+    )
  
     args = parser.parse_args()
     ip = args.server_ip
@@ -147,4 +177,5 @@ if __name__ == "__main__":
     # Thêm 3 dòng này (giống hệt start_tracker.py):
     print(f"[Backend] Khởi động Backend Server (Login/Static) tại {ip}:{port}")
     app.prepare_address(ip, port)
-    app.run()
\ No newline at end of file
+    app.run(mode=args.mode, backlog=args.backlog, workers=args.workers,
+            pool_size=args.pool_size or None, queue_size=args.queue_size)
\ No newline at end of file
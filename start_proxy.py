@@ -67,14 +67,18 @@ def parse_virtual_hosts(config_file):
     for host, block in host_blocks:
         proxy_map = {}
 
-        # Find all proxy_pass entries
-        proxy_passes = re.findall(r'proxy_pass\s+http://([^\s;]+);', block)
+        # Find all proxy_pass entries, keeping options such as weight=3
+        proxy_passes = [
+            " ".join([address] + options.split())
+            for address, options in re.findall(
+                r'proxy_pass\s+http://([^\s;]+)((?:\s+\w+=\w+)*)\s*;', block)
+        ]
         map = proxy_map.get(host,[])
         map = map + proxy_passes
         proxy_map[host] = map
 
         # Find dist_policy if present
-        policy_match = re.search(r'dist_policy\s+(\w+)', block)
+        policy_match = re.search(r'dist_policy\s+([\w-]+)', block)
         if policy_match:
             dist_policy_map = policy_match.group(1)
         else: #default policy is round_robin
@@ -116,6 +120,14 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(prog='Proxy', description='', epilog='Proxy daemon')
     parser.add_argument('--server-ip', default='0.0.0.0')
     parser.add_argument('--server-port', type=int, default=PROXY_PORT)
+    parser.add_argument('--pool-size', type=int, default=64,
+                        help='Worker threads; 0 spawns one thread per connection')
+    parser.add_argument('--queue-size', type=int, default=256,
+                        help='Connections waiting for a worker before 503 is returned')
+    parser.add_argument('--health-path', default='/health',
+                        help='Path probed on each backend of a multi-backend host')
+    parser.add_argument('--health-interval', type=float, default=5,
+                        help='Seconds between health probes; 0 disables them')
  
     args = parser.parse_args()
     ip = args.server_ip
@@ -123,4 +135,6 @@ if __name__ == "__main__":
 
     routes = parse_virtual_hosts("config/proxy.conf")
 
-    create_proxy(ip, port, routes)
+    create_proxy(ip, port, routes, pool_size=args.pool_size or None,
+                 queue_size=args.queue_size, health_path=args.health_path,
+                 health_interval=args.health_interval)
@@ -1,36 +1,671 @@
 # start_tracker.py - ENHANCED VERSION WITH ACCESS CONTROL
 import json
+import hashlib
 import argparse
 import sqlite3
+import threading
+import time
+import queue
+import http.client
+from collections import OrderedDict
 from datetime import datetime, timezone
 from daemon.weaprous import WeApRous
 from daemon.response import Response
+from daemon.workerpool import WorkerPool, pool_stats
 
 PORT = 8000 
 DB_PATH = 'db/app.db'
 app = WeApRous()
 
-def get_db_conn():
-    """Hàm tiện ích kết nối DB"""
-    conn = sqlite3.connect(DB_PATH)
+
+# ============ DATABASE CONNECTIONS ============
+
+#: Seconds a connection waits for a lock held by another writer.
+DB_BUSY_TIMEOUT = 5.0
+#: Page cache per connection, in KiB (negative cache_size).
+DB_CACHE_KIB = 16 * 1024
+#: Bytes of the database file read through mmap.
+DB_MMAP_SIZE = 256 * 1024 * 1024
+#: Compiled statements kept per connection.
+DB_STATEMENT_CACHE = 256
+#: Connections shared by all request threads of one process.
+DB_POOL_SIZE = 8
+#: Seconds a request waits for a free connection before failing.
+DB_POOL_TIMEOUT = 5.0
+
+
+def open_db_conn():
+    """Mở một connection đã tinh chỉnh (dùng chung được giữa các thread)"""
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT,
+                           cached_statements=DB_STATEMENT_CACHE,
+                           check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_KIB}")
+    conn.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    conn.execute("PRAGMA temp_store=MEMORY")
     return conn
 
+
+class ConnectionPool:
+    """
+    A bounded pool of SQLite connections shared by the request threads of
+    one process. Connections are opened lazily up to size; when all of
+    them are checked out, checkout() waits up to timeout seconds for one to
+    be returned and then raises sqlite3.OperationalError.
+    """
+
+    def __init__(self, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, connect=open_db_conn):
+        self.size = size
+        self.timeout = timeout
+        self._connect = connect
+        self._idle = queue.Queue()
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+        self.in_use = 0
+        self.waits = 0
+
+    def checkout(self):
+        """
+        Lấy một connection rảnh, mở mới nếu chưa đủ size, nếu không thì chờ.
+
+        :rtype sqlite3.Connection:
+        """
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = None
+            with self._lock:
+                grow = self.opened < self.size
+                if grow:
+                    self.opened += 1
+                else:
+                    self.waits += 1
+            if grow:
+                try:
+                    conn = self._connect()
+                except sqlite3.Error:
+                    with self._lock:
+                        self.opened -= 1
+                    raise
+                with self._lock:
+                    self.in_use += 1
+                return conn
+            try:
+                conn = self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise sqlite3.OperationalError("database connection pool exhausted")
+        with self._lock:
+            self.reused += 1
+            self.in_use += 1
+        return conn
+
+    def checkin(self, conn):
+        """Trả connection về pool (rollback transaction còn dở trước)"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Connection hỏng: bỏ đi, lần checkout sau sẽ mở cái mới
+            with self._lock:
+                self.in_use -= 1
+                self.opened -= 1
+            conn.close()
+            return
+        with self._lock:
+            self.in_use -= 1
+        self._idle.put(conn)
+
+    def stats(self):
+        with self._lock:
+            return {"size": self.size, "opened": self.opened, "reused": self.reused,
+                    "in_use": self.in_use, "idle": self._idle.qsize(), "waits": self.waits}
+
+
+class _Lease:
+    """Connection mà request hiện tại đang mượn, và số handle còn mở"""
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.handles = 0
+
+
+class PooledConnection:
+    """
+    A handle on the connection checked out by the current request. It
+    behaves like a sqlite3.Connection. Nested get_db_conn() calls in the
+    same request share the connection; close() on the last open handle
+    returns it to the pool, so a handler that closes before waiting (e.g.
+    the /presence/ long-poll) does not hold a connection while it waits.
+    """
+
+    def __init__(self, lease):
+        self._lease = lease
+        lease.handles += 1
+
+    def __getattr__(self, name):
+        if self._lease is None or self._lease.conn is None:
+            raise sqlite3.ProgrammingError("Cannot operate on a closed database.")
+        return getattr(self._lease.conn, name)
+
+    def close(self):
+        lease, self._lease = self._lease, None
+        if lease is None:
+            return
+        lease.handles -= 1
+        if lease.handles == 0 and getattr(_db_local, 'lease', None) is lease:
+            release_db_conn()
+
+
+_db_pool = ConnectionPool()
+_db_local = threading.local()
+
+
+#: Change log of the peers table, read by /presence/ (see PRESENCE FEED).
+PRESENCE_LOG_SCHEMA = '''
+    CREATE TABLE IF NOT EXISTS presence_log (
+        version INTEGER PRIMARY KEY AUTOINCREMENT,
+        op TEXT NOT NULL,
+        username TEXT NOT NULL,
+        ip TEXT NOT NULL,
+        port INTEGER NOT NULL,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+'''
+
+
+#: Counter bumped by every channel ACL change (see CHANNEL ACL CACHE).
+ACL_VERSION_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS acl_version (id INTEGER PRIMARY KEY CHECK (id = 1), version INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO acl_version (id, version) VALUES (1, 0)",
+)
+
+
+def init_db():
+    """Chuyển DB sang WAL một lần khi khởi động (persistent in the file)"""
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT)
+    mode = conn.execute("PRAGMA journal_mode=WAL").fetchone()[0]
+    # Database tạo bởi db_init.py cũ chưa có index cho phân trang history
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_messages_channel ON messages(channel_id, id)")
+    conn.execute(PRESENCE_LOG_SCHEMA)
+    # Database cũ: thêm cột lease cho bảng peers
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(peers)")]
+    if 'lease_expires' not in columns:
+        conn.execute("ALTER TABLE peers ADD COLUMN lease_expires REAL")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_peers_lease ON peers(lease_expires)")
+    for statement in ACL_VERSION_SCHEMA:
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
+    print(f"[Tracker] SQLite journal_mode={mode}")
+
+
+def get_db_conn():
+    """
+    Hàm tiện ích kết nối DB: mượn một connection từ pool cho request hiện
+    tại (các lần gọi lồng nhau trong cùng request dùng chung connection đó).
+    """
+    lease = getattr(_db_local, 'lease', None)
+    if lease is None:
+        lease = _db_local.lease = _Lease(_db_pool.checkout())
+    return PooledConnection(lease)
+
+
+@app.teardown_request
+def release_db_conn():
+    """Trả connection về pool khi request kết thúc, kể cả khi handler lỗi"""
+    lease = getattr(_db_local, 'lease', None)
+    if lease is not None:
+        _db_local.lease = None
+        conn, lease.conn = lease.conn, None
+        _db_pool.checkin(conn)
+
+
+def db_stats():
+    """Trạng thái pool connection, cho /health"""
+    return _db_pool.stats()
+
+
+# ============ SESSION CACHE ============
+
+#: Seconds a resolved session stays cached.
+SESSION_TTL = 60.0
+#: Sessions kept before the least recently used one is evicted.
+SESSION_CACHE_SIZE = 4096
+
+
+class SessionCache:
+    """
+    TTL + LRU cache: session cookie -> (user_id, username). Unknown cookies
+    are cached as (None, None) too, so a bad cookie does not hit SQLite on
+    every poll. Each tracker process has its own cache; the TTL bounds how
+    long another process may serve a stale entry.
+    """
+
+    def __init__(self, ttl=SESSION_TTL, max_size=SESSION_CACHE_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, session):
+        """Trả về (user_id, username) hoặc None nếu chưa cache / đã hết hạn"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(session)
+            if entry is None or entry[0] < now:
+                if entry is not None:
+                    del self._entries[session]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(session)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, session, user):
+        with self._lock:
+            self._entries[session] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(session)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, session):
+        with self._lock:
+            self._entries.pop(session, None)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions}
+
+
+session_cache = SessionCache()
+
+
 def get_user_from_req(req):
     """Lấy thông tin user (id, username) từ cookie trong request"""
     username = req.cookies.get('session')
     if not username:
         return None, None
+
+    cached = session_cache.get(username)
+    if cached is not None:
+        return cached
     
     conn = get_db_conn()
     user = conn.execute("SELECT id, username FROM users WHERE username = ?", (username,)).fetchone()
     conn.close()
-    if user:
-        return user['id'], user['username']
-    return None, None
+    result = (user['id'], user['username']) if user else (None, None)
+    session_cache.put(username, result)
+    return result
+
+# ============ CHANNEL ACL CACHE ============
+
+#: Seconds a channel's ACL stays cached before it is reloaded.
+CHANNEL_ACL_TTL = 30.0
+#: Seconds the ACL version read from SQLite is trusted before re-reading.
+ACL_VERSION_CHECK = 1.0
+
+
+class ChannelACL:
+    """
+    Access rules of one channel. ``members`` (user_id -> username) is
+    replaced by a new dict on every change (copy-on-write), so readers
+    never need the cache lock.
+    """
+
+    def __init__(self, channel_id, owner_id, owner, is_private, members):
+        self.id = channel_id
+        self.owner_id = owner_id
+        self.owner = owner
+        self.is_private = bool(is_private)
+        self.members = members
+
+    def allows(self, user_id):
+        """Public channel, owner hoặc member thì được truy cập"""
+        return (not self.is_private or user_id == self.owner_id
+                or user_id in self.members)
+
+
+class ChannelACLCache:
+    """
+    TTL cache: channel name -> :class:`ChannelACL`, loaded from SQLite on a
+    miss and kept up to date by create/add/remove (write-through), so an
+    access check costs no query. Each tracker process has its own cache;
+    every ACL change bumps the acl_version row, and a cache that sees the
+    version move without having made the change itself is cleared, so
+    another process serves a stale ACL for at most ACL_VERSION_CHECK.
+    The same version is sent to clients as X-ACL-Version.
+    """
+
+    def __init__(self, ttl=CHANNEL_ACL_TTL, version_check=ACL_VERSION_CHECK):
+        self.ttl = ttl
+        self.version_check = version_check
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._version = None
+        self._checked_at = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    def version(self):
+        """
+        Version ACL hiện tại (đọc lại từ SQLite tối đa mỗi version_check
+        giây); xóa cache nếu process khác đã thay đổi ACL.
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self._version is not None and now - self._checked_at < self.version_check:
+                return self._version
+        conn = get_db_conn()
+        row = conn.execute("SELECT version FROM acl_version WHERE id = 1").fetchone()
+        conn.close()
+        version = row['version'] if row else 0
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            self._checked_at = now
+            return version
+
+    def bumped(self, version):
+        """
+        Process này vừa đổi ACL và nâng version lên version. Nếu giữa chừng
+        có thay đổi khác (version nhảy hơn 1) thì xóa cache.
+        """
+        with self._lock:
+            if self._version != version - 1:
+                self._entries.clear()
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def get(self, name):
+        """Trả về ChannelACL hoặc None nếu channel không tồn tại"""
+        self.version()
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None and entry[0] >= now:
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        acl = self._load(name)
+        if acl is not None:
+            self.put(name, acl)
+        return acl
+
+    def _load(self, name):
+        conn = get_db_conn()
+        try:
+            channel = conn.execute('''
+                SELECT c.id, c.owner_id, c.is_private, u.username as owner
+                FROM channels c LEFT JOIN users u ON c.owner_id = u.id
+                WHERE c.name = ?
+            ''', (name,)).fetchone()
+            if not channel:
+                return None
+            members = conn.execute('''
+                SELECT cm.user_id, u.username
+                FROM channel_members cm JOIN users u ON cm.user_id = u.id
+                WHERE cm.channel_id = ?
+                ORDER BY cm.id
+            ''', (channel['id'],)).fetchall()
+        finally:
+            conn.close()
+        return ChannelACL(channel['id'], channel['owner_id'], channel['owner'],
+                          channel['is_private'],
+                          {m['user_id']: m['username'] for m in members})
 
-def build_json_response(req, data_dict, status_code=200, set_cookie=None):
-    """Tự động build một response với body là JSON"""
+    def put(self, name, acl):
+        with self._lock:
+            self._entries[name] = (time.monotonic() + self.ttl, acl)
+
+    def add_member(self, name, user_id, username):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                acl = entry[1]
+                acl.members = {**acl.members, user_id: username}
+
+    def remove_member(self, name, user_id):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is not None:
+                acl = entry[1]
+                acl.members = {uid: uname for uid, uname in acl.members.items()
+                               if uid != user_id}
+
+    def invalidate(self, name):
+        with self._lock:
+            self._entries.pop(name, None)
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits,
+                    "misses": self.misses, "version": self._version}
+
+
+channel_acl = ChannelACLCache()
+
+
+def bump_acl_version(conn):
+    """Nâng acl_version trong transaction của caller, trả về version mới"""
+    return conn.execute(
+        "UPDATE acl_version SET version = version + 1 WHERE id = 1 RETURNING version"
+    ).fetchone()['version']
+
+# ============ WRITE-BEHIND MESSAGE LOG ============
+
+#: Longest time a queued message waits for its batch to be committed.
+BATCH_INTERVAL = 0.005
+#: Rows committed in one transaction at most.
+BATCH_MAX_ROWS = 256
+#: Seconds a request waits for the commit of its message (ack-after-commit).
+#: Kept short enough that /relay-message/ (this wait plus the fan-out)
+#: answers within the client's 10 s request timeout.
+BATCH_ACK_TIMEOUT = 4.0
+#: Extra seconds a request waits once its batch is being committed; the
+#: per-row retry after a failed batch can take much longer than that.
+BATCH_COMMIT_GRACE = 1.0
+
+#: Acknowledge a message once its batch is committed (durable).
+ACK_COMMIT = 'commit'
+#: Acknowledge a message as soon as it is queued (faster, lost on a crash).
+ACK_ENQUEUE = 'enqueue'
+
+
+class _PendingWrite:
+    __slots__ = ('sql', 'params', 'done', 'ok', 'claimed', 'cancelled')
+
+    def __init__(self, sql, params, wait):
+        self.sql = sql
+        self.params = params
+        self.done = threading.Event() if wait else None
+        self.ok = False
+        # Cả hai được đổi dưới MessageWriter._lock
+        self.claimed = False
+        self.cancelled = False
+
+
+class MessageWriter:
+    """
+    Write-behind queue cho /log-message/ và /log-dm/: các INSERT từ nhiều
+    request được gom lại và commit trong một transaction mỗi BATCH_INTERVAL
+    giây hoặc BATCH_MAX_ROWS dòng, thay vì một commit cho mỗi tin nhắn.
+
+    The thread is started on first use, so that each pre-forked worker runs
+    its own. close() commits everything still queued.
+    """
+
+    def __init__(self, ack_mode=ACK_COMMIT, interval=BATCH_INTERVAL, max_rows=BATCH_MAX_ROWS):
+        self.ack_mode = ack_mode
+        self.interval = interval
+        self.max_rows = max_rows
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        self._conn = None
+        self.batches = 0
+        self.rows = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.unknown = 0
+
+    def submit(self, sql, params):
+        """
+        Queue one INSERT.
+
+        If the row is still queued after BATCH_ACK_TIMEOUT it is withdrawn
+        and False is returned, so a retry cannot store it twice. If its batch
+        is already being committed, submit() waits BATCH_COMMIT_GRACE more
+        seconds and then returns None: the row may still be committed.
+
+        :rtype bool: True once the row is committed (ack-after-commit) or
+                     queued (ack-on-enqueue); False if it was not stored;
+                     None if the outcome is unknown (do not retry).
+        """
+        wait = self.ack_mode == ACK_COMMIT
+        item = _PendingWrite(sql, params, wait)
+        with self._lock:
+            if self._closed:
+                return False
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='message-writer')
+                self._thread.daemon = True
+                self._thread.start()
+            self._queue.put(item)
+        if not wait:
+            return True
+        if not item.done.wait(BATCH_ACK_TIMEOUT):
+            with self._lock:
+                if not item.claimed:
+                    item.cancelled = True
+                    self.cancelled += 1
+                    return False
+            if not item.done.wait(BATCH_COMMIT_GRACE):
+                with self._lock:
+                    self.unknown += 1
+                return None
+        return item.ok
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.interval
+            stop = False
+            while len(batch) < self.max_rows:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._commit(batch)
+            except Exception as e:
+                # Lỗi bất ngờ (không phải sqlite3.Error): các dòng chưa commit
+                # của batch báo thất bại, bỏ connection đi và giữ thread chạy
+                print(f"[Tracker] ❌ Message writer error on a batch of {len(batch)} rows: {e!r}")
+                self._discard_conn()
+                with self._lock:
+                    self.failed += sum(1 for item in batch if not item.ok and not item.cancelled)
+                for item in batch:
+                    if item.done is not None:
+                        item.done.set()
+            if stop:
+                return
+
+    def _discard_conn(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _commit(self, batch):
+        with self._lock:
+            batch = [item for item in batch if not item.cancelled]
+            for item in batch:
+                item.claimed = True
+        if not batch:
+            return
+        # Connection riêng của thread này, không lấy từ pool: request đang
+        # chờ ack có thể giữ hết connection của pool
+        if self._conn is None:
+            self._conn = open_db_conn()
+        conn = self._conn
+        try:
+            for item in batch:
+                conn.execute(item.sql, item.params)
+            conn.commit()
+            for item in batch:
+                item.ok = True
+        except sqlite3.Error as e:
+            conn.rollback()
+            print(f"[Tracker] ❌ Batch of {len(batch)} rows failed ({e}), retrying one by one")
+            for item in batch:
+                try:
+                    conn.execute(item.sql, item.params)
+                    conn.commit()
+                    item.ok = True
+                except sqlite3.Error as e:
+                    conn.rollback()
+                    print(f"[Tracker] ❌ Dropped message write: {e}")
+        with self._lock:
+            self.batches += 1
+            self.rows += sum(1 for item in batch if item.ok)
+            self.failed += sum(1 for item in batch if not item.ok)
+        for item in batch:
+            if item.done is not None:
+                item.done.set()
+
+    def close(self):
+        """Commit mọi thứ còn trong hàng đợi rồi dừng thread"""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None and thread.is_alive():
+            self._queue.put(None)
+            thread.join()
+            self._discard_conn()
+            print(f"[Tracker] Message writer flushed ({self.rows} rows in {self.batches} batches)")
+
+    def stats(self):
+        with self._lock:
+            return {"ack_mode": self.ack_mode, "queued": self._queue.qsize(),
+                    "batches": self.batches, "rows": self.rows, "failed": self.failed,
+                    "cancelled": self.cancelled, "unknown": self.unknown}
+
+
+message_writer = MessageWriter()
+
+#: Body of the 202 answer when the commit of a message is still running.
+COMMIT_PENDING = {"status": "pending",
+                  "message": "Message accepted, commit still in progress (do not resend)"}
+
+
+@app.on_shutdown
+def flush_message_writer():
+    message_writer.close()
+
+
+def build_json_response(req, data_dict, status_code=200, set_cookie=None, etag=None, headers=None):
+    """Tự động build một response với body là JSON (headers: header bổ sung)"""
     resp = Response(req)
     resp.status_code = status_code
     resp._content = json.dumps(data_dict).encode('utf-8')
@@ -40,6 +675,12 @@ def build_json_response(req, data_dict, status_code=200, set_cookie=None):
     
     if set_cookie:
         resp.headers['Set-Cookie'] = set_cookie
+    if etag:
+        resp.headers['ETag'] = etag
+    # Client làm mới cache quyền channel khi version này đổi
+    resp.headers['X-ACL-Version'] = str(channel_acl.version())
+    for name, value in (headers or {}).items():
+        resp.headers[name] = str(value)
     
     return resp.build_response_header(req) + resp._content
 
@@ -94,6 +735,8 @@ def register_user(req):
         try:
             conn.execute("INSERT INTO users (username, password) VALUES (?,?)", (username, password))
             conn.commit()
+            # Cookie này có thể đã được cache là "không tồn tại"
+            session_cache.invalidate(username)
             print(f"[Tracker] ✅ User '{username}' registered successfully")
             conn.close()
             return build_json_response(req, {"status": "success", "message": "Registration successful"}, 200)
@@ -150,6 +793,219 @@ def login(req):
         return build_json_response(req, {"status": "error", "message": f"Server error: {str(e)}"}, 500)
 
 
+# ============ PRESENCE FEED ============
+
+#: Presence changes kept in presence_log; older clients resync in full.
+PRESENCE_LOG_SIZE = 1024
+#: Longest a /presence/ long-poll waits for a change, in seconds. Each
+#: waiter holds a hook worker, and the wait must stay well below the
+#: prefork GRACE_PERIOD (10 s) so that a draining worker is not killed
+#: before its shutdown functions have flushed the message log.
+PRESENCE_WAIT = 5.0
+#: While waiting, the log is re-read this often to see changes made by
+#: other tracker processes (changes of this process wake waiters at once).
+PRESENCE_RECHECK = 1.0
+
+#: Long-polls allowed to wait at once; the rest are answered immediately
+#: with ``retry_after`` so that idle clients cannot occupy every hook
+#: worker. main() derives it from the worker count (see presence_slots()).
+PRESENCE_MAX_WAITERS = 4
+#: Limit used with thread-per-connection serving, where a waiter only costs
+#: its own connection thread.
+PRESENCE_THREAD_WAITERS = 64
+
+_presence_cond = threading.Condition()
+#: Set once this process is asked to stop; waiting long-polls return.
+_presence_stopping = threading.Event()
+_presence_slots = threading.BoundedSemaphore(PRESENCE_MAX_WAITERS)
+
+
+def presence_slots(limit):
+    """Đặt số long-poll /presence/ được chờ đồng thời (tối thiểu 1)"""
+    global PRESENCE_MAX_WAITERS, _presence_slots
+    PRESENCE_MAX_WAITERS = max(1, limit)
+    _presence_slots = threading.BoundedSemaphore(PRESENCE_MAX_WAITERS)
+
+
+def record_presence(conn, op, username, ip, port):
+    """
+    Ghi một thay đổi presence ('join' / 'leave') vào presence_log, trong
+    transaction của caller. Gọi notify_presence() sau khi commit.
+    """
+    cur = conn.execute(
+        "INSERT INTO presence_log (op, username, ip, port) VALUES (?, ?, ?, ?)",
+        (op, username, ip, int(port))
+    )
+    conn.execute("DELETE FROM presence_log WHERE version <= ?",
+                 (cur.lastrowid - PRESENCE_LOG_SIZE,))
+
+
+def notify_presence():
+    """Đánh thức các long-poll /presence/ đang chờ trong process này"""
+    with _presence_cond:
+        _presence_cond.notify_all()
+
+
+@app.on_stop
+def release_presence_waiters():
+    """Worker đang dừng: trả lời ngay mọi long-poll để drain xong sớm"""
+    _presence_stopping.set()
+    notify_presence()
+
+
+def presence_version(conn):
+    """Version hiện tại = version lớn nhất từng cấp (AUTOINCREMENT, không tái dùng)"""
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'presence_log'").fetchone()
+    return row['seq'] if row else 0
+
+
+def presence_changes(conn, since):
+    """
+    Các thay đổi sau version since.
+    Trả về (version hiện tại, list thay đổi), list là None nếu since quá cũ
+    (đã bị xóa khỏi log) hoặc không hợp lệ -> client phải resync toàn bộ.
+    """
+    current = presence_version(conn)
+    if since == current:
+        return current, []
+    oldest = conn.execute("SELECT MIN(version) AS v FROM presence_log").fetchone()['v']
+    if since > current or oldest is None or since < oldest - 1:
+        return current, None
+    rows = conn.execute(
+        "SELECT version, op, username, ip, port FROM presence_log WHERE version > ? ORDER BY version",
+        (since,)
+    ).fetchall()
+    return current, [dict(row) for row in rows]
+
+
+# ============ PEER LEASES ============
+
+#: Seconds a registration stays valid without a heartbeat.
+PEER_LEASE_TTL = 30.0
+#: Seconds between two passes of the lease reaper.
+REAPER_INTERVAL = 5.0
+#: Expired sessions removed per reaper transaction.
+REAPER_BATCH = 256
+
+
+class PeerIndex:
+    """
+    In-memory copy of the peers table, (ip, port) -> username, that
+    /get-list/ and /presence/ serve from. It is kept in sync by replaying
+    presence_log from its own version, so changes made by any tracker
+    process (register, logout, lease expiry) show up after one cheap
+    version query.
+    """
+
+    def __init__(self):
+        self.version = None
+        self._peers = {}
+        self._lock = threading.Lock()
+
+    def sync(self, conn):
+        """Áp dụng các thay đổi mới trong presence_log (tải lại nếu bị hụt)"""
+        with self._lock:
+            changes = None
+            if self.version is not None:
+                current, changes = presence_changes(conn, self.version)
+                if changes == []:
+                    return
+            if changes is None:
+                # Version đọc TRƯỚC danh sách: thay đổi xen giữa sẽ được
+                # áp dụng lại ở lần sync sau (join/leave là idempotent)
+                current = presence_version(conn)
+                rows = conn.execute("SELECT ip, port, username FROM peers").fetchall()
+                self._peers = {(row['ip'], row['port']): row['username'] for row in rows}
+            else:
+                for change in changes:
+                    key = (change['ip'], change['port'])
+                    if change['op'] == 'join':
+                        self._peers[key] = change['username']
+                    elif self._peers.get(key) == change['username']:
+                        del self._peers[key]
+            self.version = current
+
+    def snapshot(self, conn):
+        """(version, list peer) sau khi đồng bộ"""
+        self.sync(conn)
+        with self._lock:
+            return self.version, [{"ip": ip, "port": port, "username": username}
+                                  for (ip, port), username in self._peers.items()]
+
+    def sessions(self, conn):
+        """Danh sách (username, ip, port) các session online, sau khi đồng bộ"""
+        self.sync(conn)
+        with self._lock:
+            return [(username, ip, port) for (ip, port), username in self._peers.items()]
+
+    def stats(self):
+        with self._lock:
+            return {"sessions": len(self._peers), "version": self.version}
+
+
+peer_index = PeerIndex()
+
+
+def reap_expired_peers():
+    """
+    Xóa các session hết lease theo từng batch, mỗi session xóa được ghi
+    một 'leave' vào presence_log. An toàn khi nhiều process cùng chạy:
+    chỉ session thực sự bị xóa (rowcount) mới được ghi.
+    """
+    conn = get_db_conn()
+    reaped = 0
+    try:
+        while True:
+            now = time.time()
+            expired = conn.execute(
+                "SELECT ip, port, username FROM peers "
+                "WHERE lease_expires IS NULL OR lease_expires < ? LIMIT ?",
+                (now, REAPER_BATCH)
+            ).fetchall()
+            if not expired:
+                break
+            for peer in expired:
+                cur = conn.execute(
+                    "DELETE FROM peers WHERE ip = ? AND port = ? AND username = ? "
+                    "AND (lease_expires IS NULL OR lease_expires < ?)",
+                    (peer['ip'], peer['port'], peer['username'], now)
+                )
+                if cur.rowcount:
+                    record_presence(conn, 'leave', peer['username'], peer['ip'], peer['port'])
+                    reaped += 1
+            conn.commit()
+            if len(expired) < REAPER_BATCH:
+                break
+    finally:
+        conn.close()
+    if reaped:
+        print(f"[Tracker] Lease expired for {reaped} peer session(s)")
+        notify_presence()
+    return reaped
+
+
+_reaper_started = False
+_reaper_lock = threading.Lock()
+
+
+def ensure_reaper():
+    """Khởi động thread reaper của process này (lần đầu được gọi, sau fork)"""
+    global _reaper_started
+    with _reaper_lock:
+        if _reaper_started:
+            return
+        _reaper_started = True
+
+    def run():
+        while True:
+            time.sleep(REAPER_INTERVAL)
+            try:
+                reap_expired_peers()
+            except sqlite3.Error as e:
+                print(f"[Tracker] Reaper error: {e}")
+
+    threading.Thread(target=run, name="lease-reaper", daemon=True).start()
+
 # ============ PEER MANAGEMENT APIs ============
 
 @app.route('/submit-info/', methods=['POST'])
@@ -169,35 +1025,161 @@ def submit_info(req):
         if not ip or not port:
             return build_json_response(req, {"status": "error", "message": "Invalid peer info"}, 400)
 
+        ensure_reaper()
         conn = get_db_conn()
         conn.execute("DELETE FROM peers WHERE username = ? AND ip = ? AND port = ?", 
                      (username, ip, port))
-        conn.execute("INSERT INTO peers (ip, port, username) VALUES (?, ?, ?)", 
-                     (ip, port, username))
+        conn.execute("INSERT INTO peers (ip, port, username, lease_expires) VALUES (?, ?, ?, ?)", 
+                     (ip, port, username, time.time() + PEER_LEASE_TTL))
+        record_presence(conn, 'join', username, ip, port)
         conn.commit()
         conn.close()
+        notify_presence()
         
         print(f"[Tracker] ✅ '{username}' registered at {ip}:{port}")
-        return build_json_response(req, {"status": "success", "message": "Peer registered"})
+        return build_json_response(req, {"status": "success", "message": "Peer registered",
+                                         "lease": PEER_LEASE_TTL})
     except Exception as e:
         print(f"[Tracker] ❌ Error in submit_info: {e}")
         return resp.build_server_error()
 
+@app.route('/heartbeat/', methods=['POST'])
+def heartbeat(req):
+    """
+    Gia hạn lease của một session: {"ip", "port"}. 404 nếu session không
+    còn (đã hết lease bị reaper xóa) -> client phải gọi lại /submit-info/.
+    """
+    resp = Response(req)
+    user_id, username = get_user_from_req(req)
+    if not user_id:
+        return resp.build_unauthorized()
+
+    data, error = parse_json_body(req)
+    if error:
+        return build_json_response(req, {"status": "error", "message": error}, 400)
+
+    ensure_reaper()
+    conn = get_db_conn()
+    cur = conn.execute(
+        "UPDATE peers SET lease_expires = ? WHERE ip = ? AND port = ? AND username = ?",
+        (time.time() + PEER_LEASE_TTL, data.get('ip'), data.get('port'), username)
+    )
+    conn.commit()
+    conn.close()
+    if not cur.rowcount:
+        return build_json_response(req, {"status": "error", "message": "Not registered"}, 404)
+    return build_json_response(req, {"status": "success", "lease": PEER_LEASE_TTL})
+
 @app.route('/get-list/', methods=['GET'])
 def get_list(req):
+    """
+    Danh sách peer. Header X-Presence-Version cho biết version của danh sách.
+
+    GET /get-list/?since_version=N chỉ trả về phần thay đổi từ version N:
+    {"version", "added": [...], "removed": [...]} (gộp theo từng session),
+    hoặc {"version", "resync": true, "peers": [...]} nếu N đã ra khỏi log.
+    """
     resp = Response(req)
     user_id, username = get_user_from_req(req)
     if not user_id: 
         print("[Tracker] Unauthorized get-list request")
         return resp.build_unauthorized()
     
+    since = req.query.get('since_version')
+    if since is not None:
+        try:
+            since = int(since)
+        except ValueError:
+            return build_json_response(req, {"status": "error", "message": "Invalid version"}, 400)
+    
+    ensure_reaper()
     conn = get_db_conn()
-    peers = conn.execute("SELECT ip, port, username FROM peers").fetchall()
+    changes = None
+    if since is not None:
+        version, changes = presence_changes(conn, since)
+    if changes is None:
+        version, peer_list = peer_index.snapshot(conn)
     conn.close()
     
-    peer_list = [dict(peer) for peer in peers] 
-    print(f"[Tracker] Returned {len(peer_list)} peers to '{username}'")
-    return build_json_response(req, peer_list)
+    headers = {"X-Presence-Version": version}
+    if since is None:
+        print(f"[Tracker] Returned {len(peer_list)} peers to '{username}'")
+        return build_json_response(req, peer_list, headers=headers)
+    if changes is None:
+        return build_json_response(req, {"version": version, "resync": True, "peers": peer_list},
+                                   headers=headers)
+    
+    # Gộp các thay đổi: trạng thái cuối của mỗi session
+    last_op = {}
+    for change in changes:
+        last_op[(change['username'], change['ip'], change['port'])] = change['op']
+    added, removed = [], []
+    for (peer_name, ip, port), op in last_op.items():
+        (added if op == 'join' else removed).append({"ip": ip, "port": port, "username": peer_name})
+    return build_json_response(req, {"version": version, "added": added, "removed": removed},
+                               headers=headers)
+
+@app.route('/presence/', methods=['GET'])
+def presence(req):
+    """
+    Long-poll presence thay cho việc poll /get-list/ mỗi 3 giây.
+
+    GET /presence/                 -> {"version", "resync": true, "peers": [...]}
+    GET /presence/?version=N&wait=S
+        -> {"version", "changes": [{"version", "op", "username", "ip", "port"}]}
+           ngay khi có thay đổi sau N, hoặc changes rỗng sau S giây
+           (tối đa PRESENCE_WAIT). Nếu N quá cũ: trả về như resync.
+           Khi đã đủ PRESENCE_MAX_WAITERS request đang chờ: trả lời ngay,
+           kèm "retry_after" (giây) nếu changes rỗng.
+    """
+    resp = Response(req)
+    user_id, username = get_user_from_req(req)
+    if not user_id:
+        return resp.build_unauthorized()
+
+    try:
+        since = req.query.get('version')
+        since = int(since) if since is not None else None
+        wait = min(max(float(req.query.get('wait', PRESENCE_WAIT)), 0.0), PRESENCE_WAIT)
+    except ValueError:
+        return build_json_response(req, {"status": "error", "message": "Invalid version"}, 400)
+
+    ensure_reaper()
+    # Hết slot: trả lời ngay (như wait=0) và báo client chờ retry_after giây
+    # trước lần poll sau, thay vì giữ thêm một hook worker
+    slots = _presence_slots
+    waiting = wait > 0 and slots.acquire(blocking=False)
+    capped = wait > 0 and not waiting
+    try:
+        body = _wait_presence(since, wait if waiting else 0.0)
+    finally:
+        if waiting:
+            slots.release()
+    if capped and body.get('changes') == []:
+        body['retry_after'] = PRESENCE_WAIT
+    return build_json_response(req, body)
+
+
+def _wait_presence(since, wait):
+    """Chờ tối đa wait giây thay đổi sau since; trả về body của /presence/"""
+    deadline = time.monotonic() + wait
+    while True:
+        # close() trả connection về pool trong lúc chờ: mượn lại mỗi vòng
+        conn = get_db_conn()
+        if since is None:
+            version, changes = presence_version(conn), None
+        else:
+            version, changes = presence_changes(conn, since)
+        if changes is None:
+            version, peers = peer_index.snapshot(conn)
+            conn.close()
+            return {"version": version, "resync": True, "peers": peers}
+        remaining = deadline - time.monotonic()
+        conn.close()
+        if changes or remaining <= 0 or _presence_stopping.is_set():
+            return {"version": version, "changes": changes}
+        with _presence_cond:
+            _presence_cond.wait(min(remaining, PRESENCE_RECHECK))
 
 @app.route('/logout/', methods=['POST'])
 def logout(req):
@@ -214,15 +1196,24 @@ def logout(req):
         conn = get_db_conn()
         
         if ip and port:
+            sessions = conn.execute("SELECT ip, port FROM peers WHERE username = ? AND ip = ? AND port = ?",
+                                    (username, ip, port)).fetchall()
             conn.execute("DELETE FROM peers WHERE username = ? AND ip = ? AND port = ?", 
                         (username, ip, port))
             print(f"[Tracker] '{username}' unregistered from {ip}:{port}")
         else:
+            sessions = conn.execute("SELECT ip, port FROM peers WHERE username = ?",
+                                    (username,)).fetchall()
             conn.execute("DELETE FROM peers WHERE username = ?", (username,))
             print(f"[Tracker] All sessions for '{username}' unregistered")
         
+        for session in sessions:
+            record_presence(conn, 'leave', username, session['ip'], session['port'])
         conn.commit()
         conn.close()
+        if sessions:
+            notify_presence()
+        session_cache.invalidate(username)
         return build_json_response(req, {"status": "success", "message": "Logged out"})
     except Exception as e:
         print(f"[Tracker] Logout error: {e}")
@@ -256,19 +1247,25 @@ def create_channel(req):
             (name, topic, user_id, 1 if is_private else 0)
         )
         
+        channel_id = conn.execute("SELECT id FROM channels WHERE name = ?", (name,)).fetchone()['id']
+        members = {}
+        
         # Add allowed users if private
         if is_private and allowed_users:
-            channel_id = conn.execute("SELECT id FROM channels WHERE name = ?", (name,)).fetchone()['id']
             for allowed_user in allowed_users:
                 user_row = conn.execute("SELECT id FROM users WHERE username = ?", (allowed_user,)).fetchone()
-                if user_row:
+                if user_row and user_row['id'] not in members:
                     conn.execute(
                         "INSERT INTO channel_members (channel_id, user_id) VALUES (?, ?)",
                         (channel_id, user_row['id'])
                     )
+                    members[user_row['id']] = allowed_user
         
+        version = bump_acl_version(conn)
         conn.commit()
         conn.close()
+        channel_acl.bumped(version)
+        channel_acl.put(name, ChannelACL(channel_id, user_id, username, is_private, members))
         print(f"[Tracker] '{username}' created channel '{name}' (private: {is_private})")
         return build_json_response(req, {"status": "success", "message": f"Channel '{name}' created"})
     except sqlite3.IntegrityError:
@@ -279,8 +1276,30 @@ def create_channel(req):
         traceback.print_exc()
         return resp.build_server_error()
 
+def make_etag(body):
+    """ETag mạnh của một body JSON: 16 ký tự hex đầu của sha1"""
+    return '"{}"'.format(hashlib.sha1(body).hexdigest()[:16])
+
+def etag_matches(req, etag):
+    """Kiểm tra header If-None-Match (danh sách ETag, W/ hoặc *)"""
+    header = req.headers.get('if-none-match', '') if req.headers else ''
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+    candidates = [tag.strip() for tag in header.split(',')]
+    return etag in candidates or 'W/' + etag in candidates
+
 @app.route('/list-channels/', methods=['GET'])
 def list_channels(req):
+    """
+    Danh sách channel kèm allowed_users, lấy bằng MỘT truy vấn gộp
+    (LEFT JOIN channel_members + json_group_array) thay vì một truy vấn
+    members cho mỗi private channel.
+
+    Trả về ETag; client gửi lại qua If-None-Match và nhận 304 không có body
+    nếu danh sách không đổi.
+    """
     resp = Response(req)
     user_id, username = get_user_from_req(req)
     if not user_id:
@@ -288,33 +1307,32 @@ def list_channels(req):
     
     conn = get_db_conn()
     channels = conn.execute('''
-        SELECT c.id, c.name, c.topic, u.username as owner, c.is_private
-        FROM channels c JOIN users u ON c.owner_id = u.id
-        ORDER BY c.created_at DESC
+        SELECT c.id, c.name, c.topic, u.username as owner, c.is_private,
+               json_group_array(mu.username)
+                   FILTER (WHERE mu.username IS NOT NULL) as allowed_users
+        FROM channels c
+        JOIN users u ON c.owner_id = u.id
+        LEFT JOIN channel_members cm ON c.is_private = 1 AND cm.channel_id = c.id
+        LEFT JOIN users mu ON cm.user_id = mu.id
+        GROUP BY c.id
+        ORDER BY c.created_at DESC, c.id DESC
     ''').fetchall()
+    conn.close()
     
     result = []
     for ch in channels:
         channel_dict = dict(ch)
-        
-        # Get allowed users for private channels
-        if ch['is_private']:
-            members = conn.execute('''
-                SELECT u.username 
-                FROM channel_members cm 
-                JOIN users u ON cm.user_id = u.id
-                WHERE cm.channel_id = ?
-            ''', (ch['id'],)).fetchall()
-            channel_dict['allowed_users'] = [m['username'] for m in members]
-        else:
-            channel_dict['allowed_users'] = []
-        
+        channel_dict['allowed_users'] = json.loads(ch['allowed_users'])
         result.append(channel_dict)
     
-    conn.close()
+    body = json.dumps(result).encode('utf-8')
+    etag = make_etag(body)
+    if etag_matches(req, etag):
+        # Cùng header như build_json_response: client revalidate vẫn biết quyền đổi
+        return resp.build_not_modified(etag, {'X-ACL-Version': channel_acl.version()})
     
     print(f"[Tracker] Returned {len(result)} channels to '{username}'")
-    return build_json_response(req, result)
+    return build_json_response(req, result, etag=etag)
 
 
 @app.route('/add-channel-member/', methods=['POST'])
@@ -333,27 +1351,21 @@ def add_channel_member(req):
         if not channel_name or not new_member_username:
             return build_json_response(req, {"status": "error", "message": "Missing fields"}, 400)
         
-        conn = get_db_conn()
-        
         # Kiểm tra channel có tồn tại và có phải private không
-        channel = conn.execute(
-            "SELECT id, owner_id, is_private FROM channels WHERE name = ?", 
-            (channel_name,)
-        ).fetchone()
+        channel = channel_acl.get(channel_name)
         
         if not channel:
-            conn.close()
             return build_json_response(req, {"status": "error", "message": "Channel not found"}, 404)
         
         # Chỉ owner mới có thể thêm thành viên
-        if channel['owner_id'] != user_id:
-            conn.close()
+        if channel.owner_id != user_id:
             return build_json_response(req, {"status": "error", "message": "Only owner can add members"}, 403)
         
-        if not channel['is_private']:
-            conn.close()
+        if not channel.is_private:
             return build_json_response(req, {"status": "error", "message": "Cannot add members to public channel"}, 400)
         
+        conn = get_db_conn()
+        
         # Lấy user_id của member mới
         new_user = conn.execute(
             "SELECT id FROM users WHERE username = ?", 
@@ -365,22 +1377,26 @@ def add_channel_member(req):
             return build_json_response(req, {"status": "error", "message": "User not found"}, 404)
         
         # Kiểm tra xem user đã là member chưa
-        existing = conn.execute(
-            "SELECT 1 FROM channel_members WHERE channel_id = ? AND user_id = ?",
-            (channel['id'], new_user['id'])
-        ).fetchone()
-        
-        if existing:
+        if new_user['id'] in channel.members:
             conn.close()
             return build_json_response(req, {"status": "error", "message": "User already a member"}, 400)
         
         # Thêm member
-        conn.execute(
-            "INSERT INTO channel_members (channel_id, user_id) VALUES (?, ?)",
-            (channel['id'], new_user['id'])
-        )
-        conn.commit()
+        try:
+            conn.execute(
+                "INSERT INTO channel_members (channel_id, user_id) VALUES (?, ?)",
+                (channel.id, new_user['id'])
+            )
+            version = bump_acl_version(conn)
+            conn.commit()
+        except sqlite3.IntegrityError:
+            # Process khác đã thêm trước: cache của process này đã cũ
+            conn.close()
+            channel_acl.invalidate(channel_name)
+            return build_json_response(req, {"status": "error", "message": "User already a member"}, 400)
         conn.close()
+        channel_acl.bumped(version)
+        channel_acl.add_member(channel_name, new_user['id'], new_member_username)
         
         print(f"[Tracker] '{username}' added '{new_member_username}' to #{channel_name}")
         return build_json_response(req, {"status": "success", "message": f"Added {new_member_username} to channel"})
@@ -408,21 +1424,16 @@ def remove_channel_member(req):
         if not channel_name or not remove_username:
             return build_json_response(req, {"status": "error", "message": "Missing fields"}, 400)
         
-        conn = get_db_conn()
-        
-        channel = conn.execute(
-            "SELECT id, owner_id, is_private FROM channels WHERE name = ?", 
-            (channel_name,)
-        ).fetchone()
+        channel = channel_acl.get(channel_name)
         
         if not channel:
-            conn.close()
             return build_json_response(req, {"status": "error", "message": "Channel not found"}, 404)
         
-        if channel['owner_id'] != user_id:
-            conn.close()
+        if channel.owner_id != user_id:
             return build_json_response(req, {"status": "error", "message": "Only owner can remove members"}, 403)
         
+        conn = get_db_conn()
+        
         remove_user = conn.execute(
             "SELECT id FROM users WHERE username = ?", 
             (remove_username,)
@@ -434,10 +1445,13 @@ def remove_channel_member(req):
         
         conn.execute(
             "DELETE FROM channel_members WHERE channel_id = ? AND user_id = ?",
-            (channel['id'], remove_user['id'])
+            (channel.id, remove_user['id'])
         )
+        version = bump_acl_version(conn)
         conn.commit()
         conn.close()
+        channel_acl.bumped(version)
+        channel_acl.remove_member(channel_name, remove_user['id'])
         
         print(f"[Tracker] '{username}' removed '{remove_username}' from #{channel_name}")
         return build_json_response(req, {"status": "success", "message": f"Removed {remove_username} from channel"})
@@ -464,48 +1478,18 @@ def get_channel_members(req):
         if not channel_name:
             return build_json_response(req, {"status": "error", "message": "Channel name required"}, 400)
         
-        conn = get_db_conn()
-        
-        channel = conn.execute(
-            "SELECT id, owner_id, is_private FROM channels WHERE name = ?", 
-            (channel_name,)
-        ).fetchone()
+        channel = channel_acl.get(channel_name)
         
         if not channel:
-            conn.close()
             return build_json_response(req, {"status": "error", "message": "Channel not found"}, 404)
         
         # Kiểm tra quyền truy cập
-        if channel['is_private']:
-            if channel['owner_id'] != user_id:
-                is_member = conn.execute(
-                    "SELECT 1 FROM channel_members WHERE channel_id = ? AND user_id = ?",
-                    (channel['id'], user_id)
-                ).fetchone()
-                
-                if not is_member:
-                    conn.close()
-                    return build_json_response(req, {"status": "error", "message": "Access denied"}, 403)
-        
-        # Lấy danh sách members
-        members = conn.execute('''
-            SELECT u.username 
-            FROM channel_members cm 
-            JOIN users u ON cm.user_id = u.id
-            WHERE cm.channel_id = ?
-        ''', (channel['id'],)).fetchall()
-        
-        # Lấy owner
-        owner = conn.execute(
-            "SELECT username FROM users WHERE id = ?", 
-            (channel['owner_id'],)
-        ).fetchone()
-        
-        conn.close()
+        if not channel.allows(user_id):
+            return build_json_response(req, {"status": "error", "message": "Access denied"}, 403)
         
         result = {
-            "owner": owner['username'] if owner else None,
-            "members": [m['username'] for m in members]
+            "owner": channel.owner,
+            "members": list(channel.members.values())
         }
         
         return build_json_response(req, result)
@@ -538,48 +1522,30 @@ def log_message(req):
             print(f"[Tracker] ❌ Missing fields")
             return build_json_response(req, {"status": "error", "message": "Missing fields"}, 400)
 
-        conn = get_db_conn()
-        channel = conn.execute("SELECT id, owner_id, is_private FROM channels WHERE name = ?", (channel_name,)).fetchone()
+        channel = channel_acl.get(channel_name)
         
         if not channel:
             print(f"[Tracker] ❌ Channel '{channel_name}' not found")
-            conn.close()
             return build_json_response(req, {"status": "error", "message": "Channel not found"}, 404)
         
-        print(f"[Tracker] 📋 Channel info: id={channel['id']}, owner_id={channel['owner_id']}, is_private={channel['is_private']}, current_user_id={user_id}")
+        print(f"[Tracker] 📋 Channel info: id={channel.id}, owner_id={channel.owner_id}, is_private={channel.is_private}, current_user_id={user_id}")
         
-        # Check access control
-        if channel['is_private']:
-            print(f"[Tracker] 🔒 Private channel - checking access...")
-            
-            # Owner always has access
-            if channel['owner_id'] == user_id:
-                print(f"[Tracker] ✅ User is OWNER - access granted")
-            else:
-                print(f"[Tracker] 🔍 User is not owner, checking membership...")
-                # Check if user is in allowed list
-                member = conn.execute(
-                    "SELECT 1 FROM channel_members WHERE channel_id = ? AND user_id = ?",
-                    (channel['id'], user_id)
-                ).fetchone()
-                
-                if not member:
-                    print(f"[Tracker] ❌ ACCESS DENIED - user '{username}' (id={user_id}) not in channel_members")
-                    conn.close()
-                    return build_json_response(req, {"status": "error", "message": "Access denied"}, 403)
-                else:
-                    print(f"[Tracker] ✅ User is MEMBER - access granted")
-        else:
-            print(f"[Tracker] 🌐 Public channel - access granted")
+        # Check access control (ACL cache, không truy vấn)
+        if not channel.allows(user_id):
+            print(f"[Tracker] ❌ ACCESS DENIED - user '{username}' (id={user_id}) not in channel_members")
+            return build_json_response(req, {"status": "error", "message": "Access denied"}, 403)
         
         utc_now = datetime.now(timezone.utc).isoformat()
 
-        conn.execute(
+        saved = message_writer.submit(
             "INSERT INTO messages (content, user_id, channel_id, timestamp) VALUES (?, ?, ?, ?)",
-            (content, user_id, channel['id'], utc_now)
+            (content, user_id, channel.id, utc_now)
         )
-        conn.commit()
-        conn.close()
+        if saved is None:
+            return build_json_response(req, COMMIT_PENDING, 202)
+        if not saved:
+            print(f"[Tracker] ❌ Message from '{username}' could not be saved")
+            return resp.build_server_error()
         
         print(f"[Tracker] ✅ Message saved: '{username}' -> #{channel_name}: {content[:50]}...")
         return build_json_response(req, {"status": "success", "message": "Message sent"})
@@ -589,9 +1555,20 @@ def log_message(req):
         traceback.print_exc()
         return resp.build_server_error()
 
+#: Messages returned by /get-history/ when no limit is given.
+HISTORY_LIMIT = 100
+#: Largest page /get-history/ returns.
+HISTORY_MAX_LIMIT = 500
+
 @app.route('/get-history/', methods=['POST'])
 def get_history(req):
-    """Lấy lịch sử tin nhắn channel với access control"""
+    """
+    Lấy lịch sử tin nhắn channel với access control.
+
+    Body: channel_name, và tùy chọn limit (mặc định 100, tối đa 500) cùng
+    một cursor: before_id (trang cũ hơn) hoặc after_id (chỉ tin mới hơn id
+    đã thấy). Kết quả luôn theo thứ tự cũ -> mới, mỗi tin có 'id'.
+    """
     resp = Response(req)
     user_id, username = get_user_from_req(req)
     if not user_id:
@@ -604,37 +1581,53 @@ def get_history(req):
         if not channel_name:
             return build_json_response(req, {"status": "error", "message": "Channel name required"}, 400)
         
-        conn = get_db_conn()
-        channel = conn.execute("SELECT id, owner_id, is_private FROM channels WHERE name = ?", (channel_name,)).fetchone()
+        channel = channel_acl.get(channel_name)
         
         if not channel:
-            conn.close()
             return build_json_response(req, {"status": "error", "message": "Channel not found"}, 404)
         
         # Check access control
-        if channel['is_private']:
-            if channel['owner_id'] != user_id:
-                member = conn.execute(
-                    "SELECT 1 FROM channel_members WHERE channel_id = ? AND user_id = ?",
-                    (channel['id'], user_id)
-                ).fetchone()
-                
-                if not member:
-                    conn.close()
-                    return build_json_response(req, {"status": "error", "message": "Access denied"}, 403)
+        if not channel.allows(user_id):
+            return build_json_response(req, {"status": "error", "message": "Access denied"}, 403)
         
-        messages = conn.execute('''
-            SELECT m.content, u.username, m.timestamp
-            FROM messages m
-            JOIN users u ON m.user_id = u.id
-            WHERE m.channel_id = ?
-            ORDER BY m.timestamp DESC
-            LIMIT 100
-        ''', (channel['id'],)).fetchall()
+        try:
+            before_id = data.get('before_id')
+            after_id = data.get('after_id')
+            before_id = int(before_id) if before_id is not None else None
+            after_id = int(after_id) if after_id is not None else None
+            limit = min(max(int(data.get('limit', HISTORY_LIMIT)), 1), HISTORY_MAX_LIMIT)
+        except (TypeError, ValueError):
+            return build_json_response(req, {"status": "error", "message": "Invalid cursor"}, 400)
+
+        conn = get_db_conn()
+
+        # Keyset pagination trên index (channel_id, id): không sort cả lịch sử
+        if after_id is not None:
+            # Tin mới hơn after_id (delta khi vào lại channel), cũ nhất trước
+            messages = conn.execute('''
+                SELECT m.id, m.content, u.username, m.timestamp
+                FROM messages m
+                JOIN users u ON m.user_id = u.id
+                WHERE m.channel_id = ? AND m.id > ?
+                ORDER BY m.id ASC
+                LIMIT ?
+            ''', (channel.id, after_id, limit)).fetchall()
+        else:
+            # Trang mới nhất, hoặc trang cũ hơn before_id
+            messages = conn.execute('''
+                SELECT m.id, m.content, u.username, m.timestamp
+                FROM messages m
+                JOIN users u ON m.user_id = u.id
+                WHERE m.channel_id = ? AND m.id < ?
+                ORDER BY m.id DESC
+                LIMIT ?
+            ''', (channel.id, before_id if before_id is not None else 2 ** 63 - 1,
+                  limit)).fetchall()
+            messages = list(reversed(messages))
         conn.close()
         
         result = []
-        for m in reversed(messages):
+        for m in messages:
             msg_dict = dict(m)
             result.append(msg_dict)
         
@@ -647,6 +1640,178 @@ def get_history(req):
         return resp.build_server_error()
 
 
+# ============ MESSAGE RELAY (SERVER-SIDE FAN-OUT) ============
+
+#: Seconds allowed to deliver to one peer session. With the commit wait
+#: (BATCH_ACK_TIMEOUT + BATCH_COMMIT_GRACE) a relay answers within about
+#: 8 s, below the GUI's 10 s RELAY_REQUEST_TIMEOUT: a client timing out
+#: cannot tell whether the message went out, so it must not happen.
+RELAY_TIMEOUT = 2.0
+#: Threads delivering relayed messages in parallel.
+RELAY_WORKERS = 32
+#: Deliveries waiting for a relay thread before new ones are refused.
+RELAY_QUEUE_SIZE = 512
+
+_relay_pool = None
+_relay_pool_lock = threading.Lock()
+
+
+def get_relay_pool():
+    """Pool tạo lần đầu dùng (sau fork), không tạo lúc import"""
+    global _relay_pool
+    with _relay_pool_lock:
+        if _relay_pool is None:
+            _relay_pool = WorkerPool("relay", size=RELAY_WORKERS, queue_size=RELAY_QUEUE_SIZE)
+        return _relay_pool
+
+
+def deliver_to_peer(ip, port, body, timeout=RELAY_TIMEOUT):
+    """POST /send-peer tới một session; trả về (status, lỗi)"""
+    conn = http.client.HTTPConnection(ip, port, timeout=timeout)
+    try:
+        conn.request("POST", "/send-peer", body, {"Content-Type": "application/json"})
+        response = conn.getresponse()
+        response.read()
+        return response.status, None
+    except (OSError, http.client.HTTPException) as e:
+        return None, str(e) or e.__class__.__name__
+    finally:
+        conn.close()
+
+
+def fan_out(sessions, body, timeout=RELAY_TIMEOUT):
+    """
+    Gửi body tới mọi session (username, ip, port) song song trên relay pool.
+    Trả về dict username -> {"ip:port": status hoặc thông báo lỗi}.
+    """
+    results = queue.Queue()
+    report = {username: {} for username, _, _ in sessions}
+    pool = get_relay_pool()
+    pending = 0
+    for username, ip, port in sessions:
+        address = f"{ip}:{port}"
+        def job(username=username, ip=ip, port=port, address=address):
+            results.put((username, address, deliver_to_peer(ip, port, body, timeout)))
+        if pool.submit(job):
+            pending += 1
+        else:
+            report[username][address] = "relay busy"
+
+    deadline = time.monotonic() + timeout + 1.0
+    while pending:
+        try:
+            username, address, (status, error) = results.get(
+                timeout=max(0.0, deadline - time.monotonic()))
+        except queue.Empty:
+            break
+        report[username][address] = status if error is None else error
+        pending -= 1
+    for username, ip, port in sessions:
+        report[username].setdefault(f"{ip}:{port}", "timeout")
+    return report
+
+
+@app.route('/relay-message/', methods=['POST'])
+def relay_message(req):
+    """
+    Tracker nhận MỘT tin và gửi song song tới các session đang online
+    thay cho client (client không phải lặp qua từng peer).
+
+    Body: channel (hoặc target cho typing DM), message, msg_id, broadcast,
+    typing (kèm expires_in: số giây bên nhận hiển thị, 0 = ngừng gõ), log (lưu vào history như /log-message/, mặc định true với tin
+    channel). Private channel chỉ gửi tới owner và members.
+
+    Trả về báo cáo cho từng người nhận:
+    {"recipients": {user: {"delivered": bool, "sessions": {"ip:port": status}}},
+     "delivered": số người nhận được, "total": số người, "logged": bool}
+    """
+    resp = Response(req)
+    user_id, username = get_user_from_req(req)
+    if not user_id:
+        return resp.build_unauthorized()
+
+    data, error = parse_json_body(req)
+    if error:
+        return build_json_response(req, {"status": "error", "message": error}, 400)
+
+    try:
+        channel_name = (data.get('channel') or '').strip()
+        target = (data.get('target') or '').strip()
+        message = data.get('message', '')
+        typing = bool(data.get('typing', False))
+        expires_in = data.get('expires_in')
+        broadcast = bool(data.get('broadcast', False))
+        msg_id = data.get('msg_id', '')
+
+        if target:
+            # Typing indicator của DM: chỉ gửi tới target. Tin DM thật đi
+            # qua P2P + /log-dm/, không relay ở đây
+            if not typing:
+                return build_json_response(
+                    req, {"status": "error", "message": "Only typing indicators can be sent to a target"}, 400)
+            payload = {"sender_username": username, "channel": target,
+                       "type": "dm", "typing": True}
+            if isinstance(expires_in, (int, float)):
+                payload["expires_in"] = expires_in
+            allowed = {target}
+            channel = None
+        else:
+            if not channel_name or not (typing or message):
+                return build_json_response(req, {"status": "error", "message": "Missing fields"}, 400)
+            channel = channel_acl.get(channel_name)
+            if not channel:
+                return build_json_response(req, {"status": "error", "message": "Channel not found"}, 404)
+            if not channel.allows(user_id):
+                return build_json_response(req, {"status": "error", "message": "Access denied"}, 403)
+            payload = {"sender_username": username, "channel": channel_name, "type": "channel"}
+            if typing:
+                payload["typing"] = True
+                if isinstance(expires_in, (int, float)):
+                    payload["expires_in"] = expires_in
+            else:
+                payload.update({"message": message, "msg_id": msg_id})
+                if broadcast:
+                    payload["broadcast"] = True
+            allowed = None
+            if channel.is_private:
+                allowed = set(channel.members.values()) | {channel.owner}
+
+        conn = get_db_conn()
+        online = peer_index.sessions(conn)
+        conn.close()
+        sessions = [(user, ip, port) for user, ip, port in online
+                    if user != username
+                    and (allowed is None or user in allowed)]
+
+        logged = False
+        if channel is not None and not typing and data.get('log', True):
+            logged = message_writer.submit(
+                "INSERT INTO messages (content, user_id, channel_id, timestamp) VALUES (?, ?, ?, ?)",
+                (message, user_id, channel.id, datetime.now(timezone.utc).isoformat())
+            )
+
+        report = fan_out(sessions, json.dumps(payload).encode('utf-8'))
+        recipients = {
+            user: {"delivered": any(status == 200 for status in results.values()),
+                   "sessions": results}
+            for user, results in report.items()
+        }
+        delivered = sum(1 for r in recipients.values() if r["delivered"])
+        if not typing:
+            print(f"[Tracker] Relayed '{username}' -> {channel_name or target}: "
+                  f"{delivered}/{len(recipients)} users, {len(sessions)} sessions")
+        return build_json_response(req, {
+            "status": "success", "msg_id": msg_id, "logged": logged,
+            "delivered": delivered, "total": len(recipients),
+            "recipients": recipients,
+        })
+    except Exception as e:
+        print(f"[Tracker] Relay error: {e}")
+        import traceback
+        traceback.print_exc()
+        return resp.build_server_error()
+
+
 # ============ DIRECT MESSAGE APIs ============
 
 @app.route('/log-dm/', methods=['POST'])
@@ -674,12 +1839,18 @@ def log_dm(req):
         
         receiver_id = receiver['id']
         utc_now = datetime.now(timezone.utc).isoformat()
-        
-        conn.execute("INSERT INTO direct_messages (content, sender_id, receiver_id, timestamp) VALUES (?, ?, ?, ?)",
-                     (content, sender_id, receiver_id, utc_now))
-        conn.commit()
         conn.close()
         
+        saved = message_writer.submit(
+            "INSERT INTO direct_messages (content, sender_id, receiver_id, timestamp) VALUES (?, ?, ?, ?)",
+            (content, sender_id, receiver_id, utc_now)
+        )
+        if saved is None:
+            return build_json_response(req, COMMIT_PENDING, 202)
+        if not saved:
+            print(f"[Tracker] ❌ DM from '{sender_username}' could not be saved")
+            return resp.build_server_error()
+        
         print(f"[Tracker] DM: '{sender_username}' -> '{receiver_username}': {content[:50]}...")
         return build_json_response(req, {"status": "success", "message": "DM sent"})
     except Exception as e:
@@ -760,6 +1931,12 @@ def health_check(req):
         "total_users": user_count,
         "total_channels": channel_count,
         "total_dms": dm_count,
+        "worker_pools": pool_stats(),
+        "db_connections": db_stats(),
+        "session_cache": session_cache.stats(),
+        "channel_acl": channel_acl.stats(),
+        "peer_index": peer_index.stats(),
+        "message_writer": message_writer.stats(),
         "server_time": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     })
 
@@ -768,6 +1945,21 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(prog='HybridChatServer', description='Hybrid P2P Chat Server')
     parser.add_argument('--server-ip', default='0.0.0.0')
     parser.add_argument('--server-port', type=int, default=PORT)
+    parser.add_argument('--mode', choices=['thread', 'eventloop'], default='thread',
+                        help='Serving mode: thread-per-connection or selectors event loop')
+    parser.add_argument('--backlog', type=int, default=1024)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Serving processes (SIGTERM drains, SIGHUP restarts them)')
+    parser.add_argument('--threads', type=int, default=16,
+                        help='Hook worker threads in eventloop mode')
+    parser.add_argument('--pool-size', type=int, default=0,
+                        help='Connection worker threads in thread mode (0 = one thread per connection)')
+    parser.add_argument('--queue-size', type=int, default=256,
+                        help='Requests waiting for a worker before 503 is returned')
+    parser.add_argument('--presence-waiters', type=int, default=0,
+                        help='Concurrent /presence/ long-polls (0 = a quarter of the worker threads)')
+    parser.add_argument('--log-ack', choices=[ACK_COMMIT, ACK_ENQUEUE], default=ACK_COMMIT,
+                        help='Acknowledge logged messages after their batch commits, or once queued')
  
     args = parser.parse_args()
     ip = args.server_ip
@@ -787,5 +1979,15 @@ if __name__ == "__main__":
     print(f"   • Auto Local Timezone Support")
     print("=" * 70)
     
+    init_db()
+    message_writer.ack_mode = args.log_ack
+    if args.presence_waiters:
+        presence_slots(args.presence_waiters)
+    elif args.mode == 'eventloop' or args.pool_size:
+        # Long-poll giữ một worker trong suốt thời gian chờ: chừa 3/4 pool
+        presence_slots((args.threads if args.mode == 'eventloop' else args.pool_size) // 4)
+    else:
+        presence_slots(PRESENCE_THREAD_WAITERS)
     app.prepare_address(ip, port)
-    app.run()
\ No newline at end of file
+    app.run(mode=args.mode, backlog=args.backlog, workers=args.workers, threads=args.threads,
+            pool_size=args.pool_size or None, queue_size=args.queue_size)
\ No newline at end of file
@@ -0,0 +1,104 @@
+"""
+tests.test_balancer
+~~~~~~~~~~~~~~~~~~~
+
+Load-balancing policies of the proxy, and the slow start of backends
+coming back into rotation.
+"""
+
+import collections
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from daemon.balancer import Balancer  # noqa: E402
+from daemon.health import SLOW_START  # noqa: E402
+
+UPSTREAMS = ["127.0.0.1:9001 weight=3", "127.0.0.1:9002", "127.0.0.1:9003"]
+KEYS = ["user{}".format(i) for i in range(300)]
+
+
+def counts(balancer, n, key=None):
+    return collections.Counter(balancer.choose(key).port for _ in range(n))
+
+
+def warming(backend, progress):
+    """Đặt backend vào slow start, đã qua progress phần thời gian warm-up"""
+    backend.recovered_at = time.monotonic() - SLOW_START * progress
+
+
+class PolicyTest(unittest.TestCase):
+
+    def test_round_robin_takes_turns(self):
+        balancer = Balancer(UPSTREAMS, "round-robin")
+        self.assertEqual([balancer.choose().port for _ in range(6)],
+                         [9001, 9002, 9003, 9001, 9002, 9003])
+
+    def test_weighted_round_robin_follows_weights(self):
+        balancer = Balancer(UPSTREAMS, "weighted-round-robin")
+        self.assertEqual(counts(balancer, 50), {9001: 30, 9002: 10, 9003: 10})
+
+    def test_least_conn_avoids_busy_backend(self):
+        balancer = Balancer(UPSTREAMS[1:], "least-conn")
+        busy = balancer.backends[0]
+        with busy.track():
+            self.assertEqual(counts(balancer, 10), {9003: 10})
+
+    def test_unavailable_backend_is_skipped(self):
+        balancer = Balancer(UPSTREAMS, "round-robin")
+        balancer.backends[1].record_probe(False)
+        self.assertNotIn(9002, counts(balancer, 30))
+
+    def test_consistent_hash_is_sticky(self):
+        balancer = Balancer(UPSTREAMS, "consistent-hash")
+        first = {key: balancer.choose(key).port for key in KEYS}
+        self.assertEqual(set(first.values()), {9001, 9002, 9003})
+        self.assertEqual(first, {key: balancer.choose(key).port for key in KEYS})
+
+        # Bỏ một backend chỉ di chuyển các client của backend đó
+        balancer.backends[2].record_probe(False)
+        moved = {key for key in KEYS if balancer.choose(key).port != first[key]}
+        self.assertEqual(moved, {key for key in KEYS if first[key] == 9003})
+
+
+class SlowStartTest(unittest.TestCase):
+
+    def test_warming_backend_gets_a_growing_share(self):
+        balancer = Balancer(UPSTREAMS[1:], "round-robin")
+        warming(balancer.backends[0], 0.2)
+        early = counts(balancer, 2000)[9002]
+        warming(balancer.backends[0], 0.8)
+        late = counts(balancer, 2000)[9002]
+        self.assertLess(early, late)
+        self.assertLess(early, 700)
+
+    def test_consistent_hash_does_not_flap_during_warmup(self):
+        balancer = Balancer(UPSTREAMS, "consistent-hash")
+        stable = {key: balancer.choose(key).port for key in KEYS}
+        target = balancer.backends[1]
+
+        previous = None
+        for progress in (0.15, 0.45, 0.75, 1.5):
+            warming(target, progress)
+            mapping = {key: balancer.choose(key).port for key in KEYS}
+            # Cùng thời điểm: mọi request của một client tới cùng backend
+            for _ in range(3):
+                self.assertEqual(mapping, {key: balancer.choose(key).port for key in KEYS})
+            # Client của backend khác chỉ có thể chuyển sang backend đang warm-up
+            for key, port in mapping.items():
+                if stable[key] != 9002:
+                    self.assertIn(port, (stable[key], 9002))
+            if previous is not None:
+                on_target = {key for key, port in previous.items() if port == 9002}
+                self.assertTrue(all(mapping[key] == 9002 for key in on_target))
+                self.assertGreaterEqual(len({k for k, p in mapping.items() if p == 9002}),
+                                        len(on_target))
+            previous = mapping
+        self.assertEqual(previous, stable)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+"""
+tests.test_channel_acl
+~~~~~~~~~~~~~~~~~~~~~~
+
+Channel ACL changes bump the version every response carries as
+X-ACL-Version, including 304 replies to /list-channels/, and take effect
+at once despite the tracker's ACL cache.
+"""
+
+import unittest
+
+from tracker_support import TrackerTestCase
+
+
+class ChannelAclTest(TrackerTestCase):
+
+    def setUp(self):
+        self.owner = self.login("owner")
+        self.member = self.login("member")
+
+    def acl_version(self, cookie):
+        _, headers, _ = self.request("GET", "/health", cookie=cookie)
+        return int(headers["x-acl-version"])
+
+    def test_membership_change_bumps_version_and_cache(self):
+        status, _ = self.json("POST", "/create-channel/",
+                              {"name": "vault", "is_private": True}, self.owner)
+        self.assertEqual(status, 200)
+        relay = {"channel": "vault", "message": "hi", "log": False}
+        self.assertEqual(self.json("POST", "/relay-message/", relay, self.member)[0], 403)
+
+        before = self.acl_version(self.member)
+        status, _ = self.json("POST", "/add-channel-member/",
+                              {"channel_name": "vault", "username": "member"}, self.owner)
+        self.assertEqual(status, 200)
+        self.assertEqual(self.acl_version(self.member), before + 1)
+        self.assertEqual(self.json("POST", "/relay-message/", relay, self.member)[0], 200)
+
+        status, _ = self.json("POST", "/remove-channel-member/",
+                              {"channel_name": "vault", "username": "member"}, self.owner)
+        self.assertEqual(status, 200)
+        self.assertEqual(self.acl_version(self.member), before + 2)
+        self.assertEqual(self.json("POST", "/relay-message/", relay, self.member)[0], 403)
+
+    def test_not_modified_carries_acl_version(self):
+        status, headers, _ = self.request("GET", "/list-channels/", cookie=self.member)
+        self.assertEqual(status, 200)
+        etag = headers["etag"]
+
+        status, headers, body = self.request("GET", "/list-channels/", cookie=self.member,
+                                             headers={"If-None-Match": etag})
+        self.assertEqual(status, 304)
+        self.assertEqual(body, b"")
+        self.assertEqual(int(headers["x-acl-version"]), self.acl_version(self.member))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+"""
+tests.test_db_pool
+~~~~~~~~~~~~~~~~~~
+
+The tracker's SQLite connections come from one bounded pool per process
+and are reused by requests arriving on different client connections.
+"""
+
+import threading
+import unittest
+
+from tracker_support import TrackerTestCase
+
+
+class TrackerDbPoolTest(TrackerTestCase):
+
+    def db_stats(self):
+        status, health = self.json("GET", "/health")
+        self.assertEqual(status, 200)
+        return health["db_connections"]
+
+    def test_sequential_connections_reuse_one_connection(self):
+        before = self.db_stats()
+        for _ in range(10):
+            self.db_stats()
+        after = self.db_stats()
+        self.assertEqual(after["opened"], before["opened"])
+        self.assertGreaterEqual(after["reused"] - before["reused"], 11)
+        self.assertEqual(after["in_use"], 0)
+
+    def test_concurrent_connections_stay_within_pool(self):
+        errors = []
+
+        def worker():
+            for _ in range(5):
+                status, _, _ = self.request("GET", "/health")
+                if status != 200:
+                    errors.append(status)
+
+        threads = [threading.Thread(target=worker) for _ in range(20)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+        stats = self.db_stats()
+        self.assertLessEqual(stats["opened"], stats["size"])
+        self.assertEqual(stats["in_use"], 0)
+        self.assertEqual(stats["idle"], stats["opened"])
+
+
+if __name__ == "__main__":
+    unittest.main()
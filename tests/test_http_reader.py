@@ -0,0 +1,111 @@
+"""
+tests.test_http_reader
+~~~~~~~~~~~~~~~~~~~~~~
+
+Incremental message framing of daemon.reader: messages split across any
+number of reads, chunked bodies, pipelined requests and size limits.
+"""
+
+import os
+import socket
+import sys
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from daemon.reader import HttpReadError, frame_message, read_message  # noqa: E402
+
+POST = (b"POST /log-message/ HTTP/1.1\r\nHost: x\r\nContent-Length: 11\r\n\r\n"
+        b"hello world")
+CHUNKED = (b"POST /x HTTP/1.1\r\nTransfer-Encoding: chunked\r\n\r\n"
+           b"5;ext=1\r\nhello\r\n6\r\n world\r\n0\r\nX-Trailer: 1\r\n\r\n")
+
+
+class FrameMessageTest(unittest.TestCase):
+
+    def test_incomplete_until_last_byte(self):
+        for message in (POST, CHUNKED):
+            for cut in range(len(message)):
+                self.assertIsNone(frame_message(message[:cut]), cut)
+            head, body, consumed = frame_message(message)
+            self.assertEqual(body, b"hello world")
+            self.assertTrue(head.endswith(b"\r\n\r\n"))
+            self.assertEqual(consumed, len(message))
+
+    def test_pipelined_messages_are_framed_one_at_a_time(self):
+        get = b"GET /health HTTP/1.1\r\nHost: x\r\n\r\n"
+        buf = bytearray(POST + get + CHUNKED[:10])
+        _, body, consumed = frame_message(buf)
+        self.assertEqual(body, b"hello world")
+        del buf[:consumed]
+        head, body, consumed = frame_message(buf)
+        self.assertEqual((head, body), (get, b""))
+        del buf[:consumed]
+        self.assertIsNone(frame_message(buf))
+
+    def test_limits(self):
+        with self.assertRaises(HttpReadError) as ctx:
+            frame_message(b"GET / HTTP/1.1\r\nX: " + b"a" * 200, max_header_size=100)
+        self.assertEqual(ctx.exception.status, 431)
+        with self.assertRaises(HttpReadError) as ctx:
+            frame_message(POST, max_body_size=10)
+        self.assertEqual(ctx.exception.status, 413)
+        with self.assertRaises(HttpReadError) as ctx:
+            frame_message(CHUNKED, max_body_size=10)
+        self.assertEqual(ctx.exception.status, 413)
+        with self.assertRaises(HttpReadError) as ctx:
+            frame_message(b"POST / HTTP/1.1\r\nContent-Length: -1\r\n\r\n")
+        self.assertEqual(ctx.exception.status, 400)
+
+
+class ReadMessageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server, self.client = socket.socketpair()
+
+    def tearDown(self):
+        self.server.close()
+        self.client.close()
+
+    def send_slowly(self, data, step=7, delay=0.01):
+        def run():
+            for i in range(0, len(data), step):
+                self.client.sendall(data[i:i + step])
+                time.sleep(delay)
+        sender = threading.Thread(target=run)
+        sender.start()
+        return sender
+
+    def test_message_in_small_pieces(self):
+        sender = self.send_slowly(POST + CHUNKED)
+        buf = bytearray()
+        self.assertEqual(read_message(self.server, buf, timeout=5)[1], b"hello world")
+        self.assertEqual(read_message(self.server, buf, timeout=5)[1], b"hello world")
+        sender.join()
+        self.assertEqual(buf, b"")
+
+    def test_idle_connection_returns_none(self):
+        started = time.monotonic()
+        self.assertIsNone(read_message(self.server, bytearray(), idle_timeout=0.2))
+        self.assertLess(time.monotonic() - started, 2)
+        self.client.close()
+        self.assertIsNone(read_message(self.server, bytearray(), idle_timeout=0.2))
+
+    def test_stalled_message_times_out(self):
+        self.client.sendall(POST[:-3])
+        with self.assertRaises(HttpReadError) as ctx:
+            read_message(self.server, bytearray(), timeout=0.2)
+        self.assertEqual(ctx.exception.status, 408)
+
+    def test_truncated_message(self):
+        self.client.sendall(POST[:-3])
+        self.client.shutdown(socket.SHUT_WR)
+        with self.assertRaises(HttpReadError) as ctx:
+            read_message(self.server, bytearray(), timeout=2)
+        self.assertEqual(ctx.exception.status, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,114 @@
+"""
+tests.test_keepalive
+~~~~~~~~~~~~~~~~~~~~
+
+HTTP/1.1 persistent connections: pipelined requests are answered in
+order on one connection, in both serving modes, and the ``Connection``
+header of every response states the policy actually applied.
+"""
+
+import os
+import socket
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from daemon.reader import parse_head, read_message  # noqa: E402
+from daemon.response import set_connection_header  # noqa: E402
+from tracker_support import TrackerTestCase  # noqa: E402
+
+
+class SetConnectionHeaderTest(unittest.TestCase):
+
+    def headers(self, response):
+        return parse_head(response)[1]
+
+    def test_keep_alive_replaces_close(self):
+        response = (b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: close\r\n"
+                    b"Keep-Alive: timeout=1\r\n\r\nok")
+        rewritten, keep_alive = set_connection_header(response, True, timeout=5, max_requests=99)
+        self.assertTrue(keep_alive)
+        self.assertTrue(rewritten.endswith(b"\r\n\r\nok"))
+        headers = self.headers(rewritten)
+        self.assertEqual(headers["connection"], "keep-alive")
+        self.assertEqual(headers["keep-alive"], "timeout=5, max=99")
+        self.assertEqual(rewritten.lower().count(b"connection:"), 1)
+
+    def test_close_is_kept(self):
+        response = b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: keep-alive\r\n\r\nok"
+        rewritten, keep_alive = set_connection_header(response, False)
+        self.assertFalse(keep_alive)
+        self.assertEqual(self.headers(rewritten)["connection"], "close")
+        self.assertNotIn("keep-alive", self.headers(rewritten))
+
+    def test_unframed_body_closes(self):
+        response = b"HTTP/1.1 200 OK\r\nContent-Type: text/plain\r\n\r\nuntil EOF"
+        rewritten, keep_alive = set_connection_header(response, True)
+        self.assertFalse(keep_alive)
+        self.assertEqual(self.headers(rewritten)["connection"], "close")
+
+    def test_bodiless_statuses_and_chunked_stay_open(self):
+        for response in (b"HTTP/1.1 304 Not Modified\r\nETag: \"1\"\r\n\r\n",
+                         b"HTTP/1.1 204 No Content\r\n\r\n",
+                         b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n0\r\n\r\n"):
+            self.assertTrue(set_connection_header(response, True)[1], response)
+
+    def test_incomplete_head_is_left_alone(self):
+        self.assertEqual(set_connection_header(b"HTTP/1.1 200 OK\r\n", True),
+                         (b"HTTP/1.1 200 OK\r\n", False))
+
+
+class KeepAliveTest(TrackerTestCase):
+
+    tracker_options = {"keepalive_timeout": 1}
+
+    def connect(self):
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        self.addCleanup(sock.close)
+        return sock
+
+    def responses(self, sock, count):
+        """Đọc count response liên tiếp; trả về list (status, headers)"""
+        buf, result = bytearray(), []
+        for _ in range(count):
+            head, _ = read_message(sock, buf, timeout=5)
+            status = int(head.split(b" ", 2)[1])
+            result.append((status, parse_head(head)[1]))
+        return result
+
+    def test_pipelined_requests_are_answered_in_order(self):
+        sock = self.connect()
+        sock.sendall(b"GET /health HTTP/1.1\r\nHost: x\r\n\r\n"
+                     b"GET /missing HTTP/1.1\r\nHost: x\r\n\r\n"
+                     b"GET /health HTTP/1.1\r\nHost: x\r\nConnection: close\r\n\r\n")
+        responses = self.responses(sock, 3)
+        self.assertEqual([status for status, _ in responses], [200, 404, 200])
+        self.assertEqual([headers["connection"] for _, headers in responses],
+                         ["keep-alive", "keep-alive", "close"])
+        self.assertEqual(sock.recv(1), b"")
+
+    def test_http10_closes_by_default(self):
+        sock = self.connect()
+        sock.sendall(b"GET /health HTTP/1.0\r\n\r\n")
+        [(status, headers)] = self.responses(sock, 1)
+        self.assertEqual((status, headers["connection"]), (200, "close"))
+        self.assertEqual(sock.recv(1), b"")
+
+    def test_idle_connection_is_closed(self):
+        sock = self.connect()
+        sock.sendall(b"GET /health HTTP/1.1\r\nHost: x\r\n\r\n")
+        self.responses(sock, 1)
+        started = time.monotonic()
+        self.assertEqual(sock.recv(1), b"")
+        self.assertLess(time.monotonic() - started, 4)
+
+
+class EventLoopKeepAliveTest(KeepAliveTest):
+
+    tracker_options = {"mode": "eventloop", "keepalive_timeout": 1}
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+"""
+tests.test_leases
+~~~~~~~~~~~~~~~~~
+
+Registrations are leases: /heartbeat/ renews them, and the reaper drops
+sessions whose lease ran out, recording a ``leave`` in presence_log.
+"""
+
+import time
+import unittest
+
+from tracker_support import TrackerTestCase
+
+
+class LeaseTest(TrackerTestCase):
+
+    tracker_setup = "t.PEER_LEASE_TTL = 1.5; t.REAPER_INTERVAL = 0.25"
+
+    def setUp(self):
+        self.cookie = self.login("lister")
+
+    def register(self, username, port):
+        cookie = self.login(username)
+        status, body = self.json("POST", "/submit-info/", {"ip": "127.0.0.1", "port": port},
+                                 cookie=cookie)
+        self.assertEqual(status, 200)
+        self.assertEqual(body["lease"], 1.5)
+        return cookie
+
+    def heartbeat(self, cookie, port):
+        status, _ = self.json("POST", "/heartbeat/", {"ip": "127.0.0.1", "port": port},
+                              cookie=cookie)
+        return status
+
+    def online(self):
+        status, peers = self.json("GET", "/get-list/", cookie=self.cookie)
+        self.assertEqual(status, 200)
+        return {(p["username"], p["port"]) for p in peers}
+
+    def test_expired_session_is_reaped(self):
+        _, body = self.json("GET", "/presence/", cookie=self.cookie)
+        version = body["version"]
+        cookie = self.register("alice", 9301)
+        self.assertIn(("alice", 9301), self.online())
+
+        time.sleep(2.5)
+        self.assertNotIn(("alice", 9301), self.online())
+        # Heartbeat trễ: session đã mất, client phải đăng ký lại
+        self.assertEqual(self.heartbeat(cookie, 9301), 404)
+
+        _, body = self.json("GET", "/presence/?version={}&wait=0".format(version),
+                            cookie=self.cookie)
+        self.assertEqual([(c["op"], c["username"]) for c in body["changes"]],
+                         [("join", "alice"), ("leave", "alice")])
+
+    def test_heartbeat_keeps_session(self):
+        cookie = self.register("bob", 9302)
+        for _ in range(5):
+            time.sleep(0.5)
+            self.assertEqual(self.heartbeat(cookie, 9302), 200)
+        self.assertIn(("bob", 9302), self.online())
+
+    def test_heartbeat_for_unknown_session(self):
+        self.assertEqual(self.heartbeat(self.cookie, 9399), 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
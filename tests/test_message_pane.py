@@ -0,0 +1,215 @@
+"""
+tests.test_message_pane
+~~~~~~~~~~~~~~~~~~~~~~~
+
+MessagePane keeps a bounded ring of records and renders only a window of
+them; scrolling to an edge moves the window, pages in older history, and
+reattaches to the newest messages. The Tk text widget is replaced by a
+small line-based fake.
+"""
+
+import importlib.util
+import unittest
+
+HAVE_CTK = importlib.util.find_spec("customtkinter") is not None
+
+#: Lines visible in the fake text widget.
+VIEW_HEIGHT = 20
+
+
+class FakeTk:
+
+    def eval(self, command):
+        pass
+
+
+class FakeText:
+    """
+    Đủ API Text cho MessagePane: nội dung là một chuỗi, mark là offset,
+    vùng nhìn là VIEW_HEIGHT dòng bắt đầu từ dòng top.
+    """
+
+    def __init__(self):
+        self.content = ""
+        self.marks = {}
+        self.top = 0
+        self.yscrollcommand = None
+        self.idle = []
+        self.tk = FakeTk()
+
+    def cget(self, key):
+        return ""
+
+    def configure(self, **kwargs):
+        self.yscrollcommand = kwargs.get("yscrollcommand", self.yscrollcommand)
+
+    def lines(self):
+        return self.content.split("\n")[:-1] if self.content else []
+
+    def offset(self, index):
+        if index in ("end", "end-1c"):
+            return len(self.content)
+        if index == "1.0":
+            return 0
+        if index == "@0,0":
+            return sum(len(line) + 1 for line in self.lines()[:self.top])
+        return self.marks[index]
+
+    def line_of(self, offset):
+        return self.content[:offset].count("\n")
+
+    def insert(self, index, text, tag=None):
+        self.content += text
+
+    def delete(self, start, end):
+        start, end = self.offset(start), self.offset(end)
+        self.content = self.content[:start] + self.content[end:]
+        for name, offset in self.marks.items():
+            if start <= offset < end:
+                self.marks[name] = start
+            elif offset >= end:
+                self.marks[name] = offset - (end - start)
+        self.top = max(0, min(self.top, len(self.lines()) - 1))
+
+    def mark_set(self, name, index):
+        self.marks[name] = self.offset(index)
+
+    def mark_gravity(self, name, gravity):
+        pass
+
+    def mark_unset(self, *names):
+        for name in names:
+            self.marks.pop(name, None)
+
+    def yview(self, index=None):
+        count = max(1, len(self.lines()))
+        if index is None:
+            return self.top / count, min(1.0, (self.top + VIEW_HEIGHT) / count)
+        self.top = self.line_of(self.offset(index))
+        self.notify()
+
+    def see(self, index):
+        if index == "end":
+            self.top = max(0, len(self.lines()) - VIEW_HEIGHT)
+        else:
+            line = self.line_of(self.offset(index))
+            if line < self.top:
+                self.top = line
+            elif line >= self.top + VIEW_HEIGHT:
+                self.top = line - VIEW_HEIGHT + 1
+        self.notify()
+
+    def after_idle(self, callback):
+        self.idle.append(callback)
+        return len(self.idle)
+
+    def notify(self):
+        first, last = self.yview()
+        self.yscrollcommand(str(first), str(last))
+
+    # ---- điều khiển từ test ----
+
+    def scroll(self, top):
+        self.top = max(0, min(top, len(self.lines()) - VIEW_HEIGHT))
+        self.notify()
+        while self.idle:
+            self.idle.pop(0)()
+
+    def shown(self):
+        return self.lines()[self.top:self.top + VIEW_HEIGHT]
+
+
+class FakeDisplay:
+
+    def __init__(self):
+        self._textbox = FakeText()
+
+    def configure(self, **kwargs):
+        pass
+
+
+def record(i, **extra):
+    return dict({"sender": "u", "content": "m{}".format(i), "type": "channel",
+                 "time_str": "t", "id": i}, **extra)
+
+
+def line(i):
+    return "[t] u: m{}".format(i)
+
+
+@unittest.skipUnless(HAVE_CTK, "peer_gui needs customtkinter")
+class MessagePaneTest(unittest.TestCase):
+
+    def setUp(self):
+        from peer_gui import MessagePane
+        self.display = FakeDisplay()
+        self.text = self.display._textbox
+        self.pane = MessagePane(self.display, {}, size=300, window=60, step=20)
+        self.loads = []
+
+    def load_older(self, before_id, done):
+        self.loads.append(before_id)
+        done([record(i) for i in range(max(1, before_id - 100), before_id)])
+
+    def reset(self, first, last):
+        self.pane.reset([record(i) for i in range(first, last + 1)], load_older=self.load_older,
+                        on_detached=lambda: self.loads.append("reattach"))
+
+    def test_only_the_window_is_rendered(self):
+        self.reset(1, 100)
+        self.assertEqual((self.pane.first, self.pane.last), (40, 99))
+        self.assertEqual(len(self.text.lines()), 60)
+        self.assertEqual(self.text.shown()[-1], line(100))
+
+    def test_ring_and_window_stay_bounded(self):
+        self.reset(1, 100)
+        for i in range(101, 501):
+            self.pane.append(record(i))
+        self.assertEqual(len(self.pane.records), 300)
+        self.assertEqual(self.pane.records[0]["content"], "m201")
+        self.assertEqual(len(self.text.lines()), 60)
+        self.assertEqual(self.text.shown()[-1], line(500))
+
+    def test_append_keeps_position_when_scrolled_up(self):
+        self.reset(1, 100)
+        self.text.top = 10
+        shown = self.text.shown()
+        for i in range(101, 111):
+            self.pane.append(record(i))
+        self.assertEqual(self.text.shown(), shown)
+        self.assertEqual(self.pane.record(self.pane.last)["content"], "m110")
+        self.assertEqual(len(self.text.lines()), 60)
+
+    def test_scrolling_pages_older_history_then_reattaches(self):
+        self.reset(901, 1000)
+        for _ in range(100):
+            self.text.scroll(0)
+        self.assertEqual(self.loads[:3], [901, 801, 701])
+        self.assertEqual(len(self.pane.records), 300)
+        self.assertTrue(self.pane.detached)
+        self.assertEqual(self.text.shown()[0], line(1))
+        self.assertLessEqual(len(self.text.lines()), 60)
+
+        # Tin mới trong lúc xem trang cũ chờ lần tải lại
+        self.pane.append(record(1001))
+        self.assertNotIn("m1001", [r["content"] for r in self.pane.records])
+
+        for _ in range(40):
+            self.text.scroll(10 ** 6)
+        self.assertEqual(self.loads[-1], "reattach")
+        self.assertEqual(self.pane.records[-1]["content"], "m300")
+
+    def test_reset_drops_pending_older_page(self):
+        pending = []
+        self.pane.reset([record(i) for i in range(901, 1000)],
+                        load_older=lambda before_id, done: pending.append(done))
+        for _ in range(5):
+            self.text.scroll(0)
+        self.assertEqual(len(pending), 1)
+        self.pane.reset([record(1)])
+        pending[0]([record(900)])
+        self.assertEqual([r["content"] for r in self.pane.records], ["m1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+"""
+tests.test_message_writer
+~~~~~~~~~~~~~~~~~~~~~~~~~
+
+Failure paths of the tracker's write-behind message log: an ack timeout
+never leaves a row that may still be committed after the caller was told
+it failed, a slow commit is reported as unknown within a bounded time, and
+an unexpected error fails its batch without killing the writer thread.
+"""
+
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import start_tracker  # noqa: E402
+
+INSERT = "INSERT INTO messages (content) VALUES (?)"
+
+
+class BrokenConnection:
+    """Connection giả: mọi câu lệnh đều ném lỗi không phải sqlite3.Error"""
+
+    def execute(self, *args):
+        raise RuntimeError("boom")
+
+    def close(self):
+        pass
+
+
+class MessageWriterTest(unittest.TestCase):
+
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.saved = (start_tracker.DB_PATH, start_tracker.DB_BUSY_TIMEOUT,
+                      start_tracker.BATCH_ACK_TIMEOUT, start_tracker.BATCH_COMMIT_GRACE)
+        start_tracker.DB_PATH = os.path.join(self.workdir, "app.db")
+        conn = sqlite3.connect(start_tracker.DB_PATH)
+        conn.execute("CREATE TABLE messages (id INTEGER PRIMARY KEY, content TEXT)")
+        conn.commit()
+        conn.close()
+        self.writer = start_tracker.MessageWriter()
+
+    def tearDown(self):
+        self.writer.close()
+        (start_tracker.DB_PATH, start_tracker.DB_BUSY_TIMEOUT,
+         start_tracker.BATCH_ACK_TIMEOUT, start_tracker.BATCH_COMMIT_GRACE) = self.saved
+        shutil.rmtree(self.workdir, ignore_errors=True)
+
+    def stored(self):
+        conn = sqlite3.connect(start_tracker.DB_PATH)
+        try:
+            return [row[0] for row in conn.execute("SELECT content FROM messages ORDER BY id")]
+        finally:
+            conn.close()
+
+    def submit_in_thread(self, content, results):
+        def run():
+            results[content] = self.writer.submit(INSERT, (content,))
+        thread = threading.Thread(target=run)
+        thread.start()
+        return thread
+
+    def test_ack_timeout_withdraws_queued_row(self):
+        start_tracker.DB_BUSY_TIMEOUT = 5.0
+        start_tracker.BATCH_ACK_TIMEOUT = 0.3
+        # Một connection khác giữ write lock: batch đầu tiên bị kẹt khi commit
+        blocker = sqlite3.connect(start_tracker.DB_PATH)
+        blocker.execute("BEGIN EXCLUSIVE")
+        results = {}
+        first = self.submit_in_thread("claimed", results)
+        time.sleep(0.1)
+        second = self.submit_in_thread("queued", results)
+        second.join(5)
+        self.assertFalse(second.is_alive())
+        self.assertIs(results["queued"], False)
+
+        # Batch đã bắt đầu commit: submit() chờ kết quả thay vì báo lỗi
+        self.assertTrue(first.is_alive())
+        blocker.rollback()
+        blocker.close()
+        first.join(10)
+        self.assertIs(results["claimed"], True)
+
+        self.assertTrue(self.writer.submit(INSERT, ("after",)))
+        self.assertEqual(self.stored(), ["claimed", "after"])
+        self.assertEqual(self.writer.stats()["cancelled"], 1)
+
+    def test_commit_outlasting_grace_is_reported_unknown(self):
+        start_tracker.BATCH_ACK_TIMEOUT = 0.2
+        start_tracker.BATCH_COMMIT_GRACE = 0.2
+        blocker = sqlite3.connect(start_tracker.DB_PATH)
+        blocker.execute("BEGIN EXCLUSIVE")
+        started = time.monotonic()
+        self.assertIsNone(self.writer.submit(INSERT, ("slow",)))
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertEqual(self.writer.stats()["unknown"], 1)
+
+        # Commit vẫn chạy tiếp và lưu đúng một lần
+        blocker.rollback()
+        blocker.close()
+        self.assertTrue(self.writer.submit(INSERT, ("after",)))
+        self.assertEqual(self.stored(), ["slow", "after"])
+
+    def test_unexpected_error_fails_batch_and_keeps_thread(self):
+        self.writer.interval = 0.2
+        self.writer._conn = BrokenConnection()
+        results = {}
+        threads = [self.submit_in_thread(f"m{i}", results) for i in range(3)]
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(results, {"m0": False, "m1": False, "m2": False})
+        self.assertTrue(self.writer._thread.is_alive())
+        self.assertEqual(self.writer.stats()["failed"], 3)
+
+        # Connection hỏng đã bị bỏ: batch sau mở connection mới và commit được
+        self.writer.interval = start_tracker.BATCH_INTERVAL
+        self.assertTrue(self.writer.submit(INSERT, ("ok",)))
+        self.assertEqual(self.stored(), ["ok"])
+
+
+if __name__ == "__main__":
+    unittest.main()
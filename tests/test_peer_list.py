@@ -0,0 +1,68 @@
+"""
+tests.test_peer_list
+~~~~~~~~~~~~~~~~~~~~
+
+/get-list/ advertises its version in X-Presence-Version and, given
+?since_version=N, returns only the sessions added or removed since N.
+"""
+
+import unittest
+
+from tracker_support import TrackerTestCase
+
+
+class PeerListDeltaTest(TrackerTestCase):
+
+    def setUp(self):
+        self.cookie = self.login("lister")
+
+    def peer_list(self, since=None):
+        path = "/get-list/" if since is None else "/get-list/?since_version={}".format(since)
+        status, headers, data = self.request("GET", path, cookie=self.cookie)
+        self.assertEqual(status, 200)
+        return int(headers["x-presence-version"]), data
+
+    def register(self, username, port):
+        cookie = self.login(username)
+        self.request("POST", "/submit-info/", {"ip": "127.0.0.1", "port": port}, cookie=cookie)
+        return cookie
+
+    def delta(self, since):
+        status, body = self.json("GET", "/get-list/?since_version={}".format(since),
+                                 cookie=self.cookie)
+        self.assertEqual(status, 200)
+        return body
+
+    def sessions(self, peers):
+        return sorted((p["username"], p["port"]) for p in peers)
+
+    def test_delta_is_folded_per_session(self):
+        version, _ = self.peer_list()
+        self.register("alice", 9201)
+        bob = self.register("bob", 9202)
+        self.request("POST", "/logout/", {"ip": "127.0.0.1", "port": 9202}, cookie=bob)
+        # Bob vào rồi ra: chỉ còn "removed" cho session của bob
+        body = self.delta(version)
+        self.assertEqual(self.sessions(body["added"]), [("alice", 9201)])
+        self.assertEqual(self.sessions(body["removed"]), [("bob", 9202)])
+        self.assertEqual(body["version"], self.peer_list()[0])
+
+    def test_current_version_has_no_changes(self):
+        version, _ = self.peer_list()
+        body = self.delta(version)
+        self.assertEqual((body["version"], body["added"], body["removed"]), (version, [], []))
+
+    def test_unknown_version_returns_full_list(self):
+        self.register("carol", 9203)
+        version, _ = self.peer_list()
+        body = self.delta(version + 100)
+        self.assertTrue(body["resync"])
+        self.assertIn(("carol", 9203), self.sessions(body["peers"]))
+
+    def test_invalid_version_is_rejected(self):
+        status, _, _ = self.request("GET", "/get-list/?since_version=x", cookie=self.cookie)
+        self.assertEqual(status, 400)
+
+
+if __name__ == "__main__":
+    unittest.main()
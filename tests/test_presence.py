@@ -0,0 +1,144 @@
+"""
+tests.test_presence
+~~~~~~~~~~~~~~~~~~~
+
+/presence/ long-polls: versioned join/leave deltas, waking a waiter as
+soon as a peer registers, the cap on concurrent waiters, and how the
+GUI client applies the replies.
+"""
+
+import importlib.util
+import json
+import queue
+import threading
+import time
+import unittest
+
+from tracker_support import TrackerTestCase, free_port
+
+HAVE_CTK = importlib.util.find_spec("customtkinter") is not None
+
+
+class PresenceTest(TrackerTestCase):
+
+    tracker_setup = "t.presence_slots(1)"
+
+    def setUp(self):
+        self.cookie = self.login("watcher")
+
+    def version(self):
+        status, body = self.json("GET", "/presence/", cookie=self.cookie)
+        self.assertEqual(status, 200)
+        self.assertTrue(body["resync"])
+        return body["version"]
+
+    def poll(self, version, wait):
+        return self.json("GET", "/presence/?version={}&wait={}".format(version, wait),
+                         cookie=self.cookie)
+
+    def register(self, username, port):
+        cookie = self.login(username)
+        status, _ = self.json("POST", "/submit-info/", {"ip": "127.0.0.1", "port": port},
+                              cookie=cookie)
+        self.assertEqual(status, 200)
+        return cookie
+
+    def test_join_and_leave_are_reported_as_deltas(self):
+        version = self.version()
+        cookie = self.register("alice", 9101)
+        self.json("POST", "/logout/", {"ip": "127.0.0.1", "port": 9101}, cookie=cookie)
+
+        status, body = self.poll(version, 0)
+        self.assertEqual(status, 200)
+        self.assertEqual([(c["op"], c["username"], c["port"]) for c in body["changes"]],
+                         [("join", "alice", 9101), ("leave", "alice", 9101)])
+        self.assertEqual(body["version"], body["changes"][-1]["version"])
+
+        status, body = self.poll(body["version"], 0)
+        self.assertEqual(body["changes"], [])
+
+    def test_unknown_version_asks_for_resync(self):
+        status, body = self.poll(self.version() + 100, 0)
+        self.assertEqual(status, 200)
+        self.assertTrue(body["resync"])
+
+    def test_waiter_wakes_on_register(self):
+        version = self.version()
+        timer = threading.Timer(0.5, self.register, ("bob", 9102))
+        timer.start()
+        started = time.monotonic()
+        status, body = self.poll(version, 5)
+        elapsed = time.monotonic() - started
+        timer.join()
+        self.assertEqual(status, 200)
+        self.assertEqual([c["username"] for c in body["changes"]], ["bob"])
+        self.assertLess(elapsed, 3)
+
+    def test_waiters_over_the_cap_are_answered_at_once(self):
+        version = self.version()
+        held = []
+        waiter = threading.Thread(target=lambda: held.append(self.poll(version, 5)))
+        waiter.start()
+        time.sleep(0.5)
+
+        started = time.monotonic()
+        status, body = self.poll(version, 5)
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(status, 200)
+        self.assertEqual(body["changes"], [])
+        self.assertGreater(body["retry_after"], 0)
+
+        self.register("carol", 9103)
+        waiter.join(5)
+        self.assertEqual([c["username"] for c in held[0][1]["changes"]], ["carol"])
+        self.assertNotIn("retry_after", held[0][1])
+
+
+@unittest.skipUnless(HAVE_CTK, "peer_gui needs customtkinter")
+class WatchPresenceTest(unittest.TestCase):
+    """ChatClient.watch_presence trước các phản hồi /presence/ dựng sẵn"""
+
+    def setUp(self):
+        import peer_gui
+        self.gui = peer_gui
+        self.client = peer_gui.ChatClient(free_port(), lambda *args, **kwargs: None)
+        self.client.username = "me"
+        self.replies = queue.Queue()
+        self.client.tracker_request = lambda method, path, **kwargs: self.replies.get()
+        self.changes = queue.Queue()
+
+    def tearDown(self):
+        self.client.presence_stop.set()
+        self.replies.put((None, 500, None))
+        self.client.dispatcher.close()
+        self.client.typing.close()
+
+    def reply(self, body, status=200):
+        self.replies.put((json.dumps(body).encode("utf-8"), status, None))
+
+    def watch(self):
+        return self.client.watch_presence(lambda joined, left: self.changes.put((joined, left)))
+
+    def test_missing_route_falls_back(self):
+        self.replies.put((b"Not Found", 404, None))
+        self.assertFalse(self.watch())
+
+    def test_first_poll_is_applied(self):
+        self.reply({"version": 3, "resync": True,
+                    "peers": [{"username": "alice", "ip": "127.0.0.1", "port": 9101}]})
+        self.assertTrue(self.watch())
+        self.assertEqual(self.changes.get(timeout=2), ({"alice"}, set()))
+        self.assertEqual(self.client.presence_version, 3)
+
+        self.reply({"version": 4, "changes": [{"version": 4, "op": "leave", "username": "alice",
+                                               "ip": "127.0.0.1", "port": 9101}]})
+        self.assertEqual(self.changes.get(timeout=2), (set(), {"alice"}))
+
+    def test_retry_after_is_reported(self):
+        self.client.presence_version = 3
+        self.reply({"version": 3, "changes": [], "retry_after": 5.0})
+        self.assertEqual(self.client.poll_presence(), (set(), set(), False, 5.0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+tests.test_proxy_retry
+~~~~~~~~~~~~~~~~~~~~~~
+
+A request that fails on a stale pooled keep-alive connection is retried
+once on a newly opened connection, never on another pooled one, and the
+client always gets an answer.
+"""
+
+import os
+import socket
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from daemon import proxy  # noqa: E402
+from daemon.relay import SocketReader  # noqa: E402
+from daemon.upstream import UpstreamPool  # noqa: E402
+
+REQUEST = b"GET /x HTTP/1.1\r\nHost: app\r\n\r\n"
+
+
+def stale_connection():
+    """
+    Socket trông như còn sống trong pool: đầu bên kia chỉ đóng sau khi
+    nhận request, không trả lời (keep-alive đã hết hạn phía backend).
+    """
+    ours, theirs = socket.socketpair()
+
+    def backend():
+        theirs.recv(65536)
+        theirs.close()
+    threading.Thread(target=backend, daemon=True).start()
+    return ours
+
+
+class Backend:
+    """Backend thật: trả 200 "ok" cho mỗi kết nối mới"""
+
+    def __init__(self):
+        self.server = socket.socket()
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen()
+        self.port = self.server.getsockname()[1]
+        self.accepted = 0
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def run(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return
+            self.accepted += 1
+            data = b""
+            while b"\r\n\r\n" not in data:
+                data += conn.recv(65536)
+            conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+            conn.close()
+
+    def close(self):
+        self.server.close()
+
+
+class RelayRetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = Backend()
+        self.pool = UpstreamPool()
+
+    def tearDown(self):
+        self.backend.close()
+        self.pool.close()
+
+    def relay(self):
+        client, peer = socket.socketpair()
+        out = proxy._Collector()
+        try:
+            ok = proxy.relay_request("127.0.0.1", self.backend.port, REQUEST,
+                                     SocketReader(client), out, self.pool)
+        finally:
+            client.close()
+            peer.close()
+        return ok, bytes(out.data)
+
+    def test_retry_opens_a_new_connection(self):
+        # Hai connection cũ trong pool: lần thử lại không được lấy cái thứ hai
+        for _ in range(2):
+            self.pool.release("127.0.0.1", self.backend.port, stale_connection())
+        ok, response = self.relay()
+        self.assertIs(ok, True)
+        self.assertTrue(response.startswith(b"HTTP/1.1 200"))
+        self.assertTrue(response.endswith(b"ok"))
+        self.assertEqual(self.backend.accepted, 1)
+
+    def test_backend_closing_without_answer_gets_502(self):
+        self.backend.close()
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        self.backend.port = server.getsockname()[1]
+
+        def close_after_request():
+            for _ in range(2):
+                conn, _ = server.accept()
+                conn.recv(65536)
+                conn.close()
+        threading.Thread(target=close_after_request, daemon=True).start()
+        self.pool.release("127.0.0.1", self.backend.port, stale_connection())
+        ok, response = self.relay()
+        server.close()
+        self.assertIs(ok, False)
+        self.assertTrue(response.startswith(b"HTTP/1.1 502"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+"""
+tests.test_relay
+~~~~~~~~~~~~~~~~
+
+/relay-message/ fans a message out to the online sessions and reports
+delivery per recipient; the GUI client only falls back to direct P2P
+when the tracker cannot be reached, never after a relay that may have
+gone out.
+"""
+
+import importlib.util
+import json
+import os
+import socket
+import sys
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from tracker_support import TrackerTestCase, free_port
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+HAVE_CTK = importlib.util.find_spec("customtkinter") is not None
+
+
+class FakePeer:
+    """P2P server giả của một session: ghi lại các body /send-peer nhận được"""
+
+    def __init__(self):
+        self.received = []
+        peer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                peer.received.append(json.loads(self.rfile.read(length)))
+                body = b'{"status": "received"}'
+                self.send_response(200)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class RelayEndpointTest(TrackerTestCase):
+
+    def setUp(self):
+        self.alice = self.login("alice")
+        self.bob = self.login("bob")
+        self.peer = FakePeer()
+        self.dead_port = free_port()
+        for port in (self.peer.port, self.dead_port):
+            status, _ = self.json("POST", "/submit-info/",
+                                  {"ip": "127.0.0.1", "port": port}, self.bob)
+            self.assertEqual(status, 200)
+
+    def tearDown(self):
+        self.peer.close()
+        for port in (self.peer.port, self.dead_port):
+            self.json("POST", "/logout/", {"ip": "127.0.0.1", "port": port}, self.bob)
+
+    def test_report_per_recipient_and_session(self):
+        status, report = self.json("POST", "/relay-message/",
+                                   {"channel": "general", "message": "hello", "msg_id": "m1"},
+                                   self.alice)
+        self.assertEqual(status, 200)
+        self.assertTrue(report["logged"])
+        self.assertEqual((report["delivered"], report["total"]), (1, 1))
+        sessions = report["recipients"]["bob"]["sessions"]
+        self.assertEqual(sessions["127.0.0.1:{}".format(self.peer.port)], 200)
+        self.assertIsInstance(sessions["127.0.0.1:{}".format(self.dead_port)], str)
+        self.assertEqual(self.peer.received[-1]["message"], "hello")
+        self.assertEqual(self.peer.received[-1]["sender_username"], "alice")
+
+    def test_target_only_relays_typing(self):
+        status, _ = self.json("POST", "/relay-message/",
+                              {"target": "bob", "message": "not a typing edge"}, self.alice)
+        self.assertEqual(status, 400)
+        status, report = self.json("POST", "/relay-message/",
+                                   {"target": "bob", "typing": True, "expires_in": 3}, self.alice)
+        self.assertEqual(status, 200)
+        self.assertEqual(report["delivered"], 1)
+        self.assertEqual(self.peer.received[-1],
+                         {"sender_username": "alice", "channel": "bob", "type": "dm",
+                          "typing": True, "expires_in": 3})
+
+
+@unittest.skipUnless(HAVE_CTK, "peer_gui needs customtkinter")
+class ClientFallbackTest(unittest.TestCase):
+    """ChatClient.send_message trước các kiểu lỗi của /relay-message/"""
+
+    def setUp(self):
+        import peer_gui
+        self.gui = peer_gui
+        self.client = peer_gui.ChatClient(free_port(), lambda *args, **kwargs: None)
+        self.client.username = "alice"
+        self.client.check_channel_access = lambda channel, force_refresh=False: (True, None)
+        self.p2p = []
+        self.client.dispatcher.fan_out = lambda sessions, path, body: self.p2p.append(body) or []
+        self.saved = (peer_gui.TRACKER_PORT, peer_gui.RELAY_REQUEST_TIMEOUT)
+
+    def tearDown(self):
+        self.gui.TRACKER_PORT, self.gui.RELAY_REQUEST_TIMEOUT = self.saved
+        self.client.dispatcher.close()
+        self.client.typing.close()
+
+    def test_unreachable_tracker_falls_back_to_p2p(self):
+        self.gui.TRACKER_PORT = free_port()
+        sent, msg_id = self.client.send_message("hi", channel="general")
+        self.assertEqual(sent, 0)
+        self.assertIsNotNone(msg_id)
+        self.assertEqual(len(self.p2p), 1)
+
+    def test_slow_relay_is_not_resent(self):
+        # Tracker nhận kết nối nhưng không trả lời kịp: tin có thể đã đi
+        server = socket.socket()
+        server.bind(("127.0.0.1", 0))
+        server.listen()
+        accepted = []
+        threading.Thread(target=lambda: accepted.append(server.accept()), daemon=True).start()
+        self.gui.TRACKER_PORT = server.getsockname()[1]
+        self.gui.RELAY_REQUEST_TIMEOUT = 0.3
+        try:
+            sent, msg_id = self.client.send_message("hi", channel="general")
+        finally:
+            server.close()
+        self.assertIsNone(sent)
+        self.assertIsNotNone(msg_id)
+        self.assertEqual(self.p2p, [])
+
+
+if __name__ == "__main__":
+    unittest.main()
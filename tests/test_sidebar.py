@@ -0,0 +1,122 @@
+"""
+tests.test_sidebar
+~~~~~~~~~~~~~~~~~~
+
+SidebarList only creates, destroys or relabels the rows that changed, and
+keeps the packed order equal to the order it was given.
+"""
+
+import importlib.util
+import unittest
+
+HAVE_CTK = importlib.util.find_spec("customtkinter") is not None
+
+
+class FakeContainer:
+    """Giữ thứ tự pack của các frame con như Tk"""
+
+    def __init__(self):
+        self.packed = []
+
+
+class FakeFrame:
+
+    def __init__(self, container):
+        self.container = container
+        self.destroyed = False
+
+    def pack(self, before=None, **kwargs):
+        packed = self.container.packed
+        if self in packed:
+            packed.remove(self)
+        packed.insert(packed.index(before) if before is not None else len(packed), self)
+
+    def pack_forget(self):
+        self.container.packed.remove(self)
+
+    def destroy(self):
+        if self in self.container.packed:
+            self.container.packed.remove(self)
+        self.destroyed = True
+
+
+class FakeButton:
+
+    def __init__(self, frame, text, icon):
+        self._frame = frame
+        frame.button = self
+        self._item_text = text
+        self._item_icon = icon
+        self.label = "{} {}".format(icon, text)
+
+    def configure(self, text):
+        self.label = text
+
+
+class FakeGUI:
+
+    def __init__(self):
+        self.created = 0
+
+    def create_list_item(self, parent, text, icon, on_click, item_type="channel", before=None):
+        self.created += 1
+        frame = FakeFrame(parent)
+        frame.pack(fill="x", pady=2, before=before)
+        btn = FakeButton(frame, text, icon)
+        btn.on_click = on_click
+        return btn
+
+
+@unittest.skipUnless(HAVE_CTK, "peer_gui needs customtkinter")
+class SidebarListTest(unittest.TestCase):
+
+    def setUp(self):
+        from peer_gui import SidebarList
+        self.gui = FakeGUI()
+        self.container = FakeContainer()
+        self.clicked = []
+        self.sidebar = SidebarList(self.gui, self.container, "user", self.clicked.append)
+
+    def labels(self):
+        return [frame.button.label for frame in self.container.packed]
+
+    def test_unchanged_rows_are_not_touched(self):
+        rows = [("alice", "🟢", "alice"), ("bob", "🟢", "bob")]
+        self.assertEqual(self.sidebar.update(rows), 2)
+        widgets = dict(self.sidebar.rows)
+        self.assertEqual(self.sidebar.update(list(rows)), 0)
+        self.assertEqual(self.sidebar.rows, widgets)
+        self.assertEqual(self.gui.created, 2)
+
+    def test_add_remove_and_relabel(self):
+        self.sidebar.update([("alice", "🟢", "alice"), ("bob", "🟢", "bob"),
+                             ("carol", "🟢", "carol")])
+        bob = self.sidebar.get("bob")
+        alice_frame = self.sidebar.get("alice")._frame
+        changes = self.sidebar.update([("bob", "⚪", "bob (2)"), ("carol", "🟢", "carol"),
+                                       ("dave", "🟢", "dave")])
+        # alice bị xoá, bob đổi nhãn, dave được thêm; carol giữ nguyên
+        self.assertEqual(changes, 3)
+        self.assertTrue(alice_frame.destroyed)
+        self.assertIs(self.sidebar.get("bob"), bob)
+        self.assertEqual(self.labels(), ["⚪ bob (2)", "🟢 carol", "🟢 dave"])
+
+    def test_new_rows_are_inserted_in_place(self):
+        self.sidebar.update([("a", "#", "a"), ("c", "#", "c")])
+        self.sidebar.update([("0", "#", "0"), ("a", "#", "a"), ("b", "#", "b"), ("c", "#", "c")])
+        self.assertEqual(self.labels(), ["# 0", "# a", "# b", "# c"])
+
+    def test_reordered_rows_are_repacked(self):
+        self.sidebar.update([("a", "#", "a"), ("b", "#", "b"), ("c", "#", "c")])
+        self.assertEqual(self.sidebar.update([("c", "#", "c"), ("new", "#", "new"),
+                                              ("a", "#", "a"), ("b", "#", "b")]), 1)
+        self.assertEqual(self.labels(), ["# c", "# new", "# a", "# b"])
+
+    def test_click_reports_key(self):
+        self.sidebar.update([("general", "#", "general")])
+        self.sidebar.get("general").on_click()
+        self.assertEqual(self.clicked, ["general"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,106 @@
+"""
+tests.tracker_support
+~~~~~~~~~~~~~~~~~~~~~
+
+Runs a tracker (start_tracker.py) on a fresh database in a temporary
+directory, for tests that exercise it over HTTP.
+"""
+
+import http.client
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+
+class TrackerTestCase(unittest.TestCase):
+    """
+    Base class: one tracker per test class, run in a subprocess the way
+    start_tracker.py's main block runs it. ``tracker_options`` are passed
+    to app.run(); ``tracker_setup`` is Python run first with the module
+    imported as ``t`` (e.g. to shorten timeouts).
+    """
+
+    tracker_options = {}
+    tracker_setup = ""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.workdir = tempfile.mkdtemp()
+        subprocess.run([sys.executable, os.path.join(ROOT, "db_init.py")], cwd=cls.workdir,
+                       check=True, stdout=subprocess.DEVNULL)
+        cls.port = free_port()
+        script = "\n".join([
+            "import sys",
+            "sys.path.insert(0, {!r})".format(ROOT),
+            "import start_tracker as t",
+            cls.tracker_setup,
+            "t.init_db()",
+            "t.app.prepare_address('127.0.0.1', {})".format(cls.port),
+            "t.app.run(**{!r})".format(cls.tracker_options),
+        ])
+        cls.log = open(os.path.join(cls.workdir, "tracker.log"), "w")
+        cls.tracker = subprocess.Popen([sys.executable, "-c", script], cwd=cls.workdir,
+                                       stdout=cls.log, stderr=subprocess.STDOUT)
+        wait_for_port(cls.port)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tracker.terminate()
+        cls.tracker.wait(10)
+        cls.log.close()
+        shutil.rmtree(cls.workdir, ignore_errors=True)
+
+    def request(self, method, path, body=None, cookie=None, headers=None, timeout=10):
+        """Một request trên một kết nối TCP mới; trả về (status, headers, body)"""
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=timeout)
+        try:
+            headers = dict(headers or {}, Connection="close")
+            if body is not None:
+                body = json.dumps(body).encode("utf-8")
+                headers["Content-Type"] = "application/json"
+            if cookie:
+                headers["Cookie"] = cookie
+            conn.request(method, path, body, headers)
+            response = conn.getresponse()
+            return (response.status, {k.lower(): v for k, v in response.getheaders()},
+                    response.read())
+        finally:
+            conn.close()
+
+    def json(self, method, path, body=None, cookie=None, **kwargs):
+        status, _, data = self.request(method, path, body, cookie, **kwargs)
+        return status, json.loads(data) if data else None
+
+    def login(self, username, password="pw"):
+        """Đăng ký (nếu chưa có) rồi đăng nhập; trả về cookie session"""
+        self.request("POST", "/register", {"username": username, "password": password})
+        status, headers, _ = self.request("POST", "/login",
+                                          {"username": username, "password": password})
+        self.assertEqual(status, 200)
+        return headers["set-cookie"].split(";")[0]